@@ -1,48 +1,73 @@
+import time
+
+# Startup is timed from here, before the imports below (see App.mark_startup)
+STARTED = time.perf_counter()
+
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
-from tkinter.font import Font
-from tkcalendar import DateEntry, Calendar
-import pandas as pd
-from sqlalchemy import create_engine, Column, Integer, String, func
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.ext.declarative import declarative_base
-from openpyxl import Workbook
-from openpyxl.styles import Font, Border, Side, Alignment
 import datetime
+import json
+import logging
+import multiprocessing
+import os
+import sys
+from core import (
+    FILTER_COLUMNS, PAGE_SIZE, SORT_COLUMNS, SPARSE_ORDERING, TREE_COLUMNS, ChangeSet, EditBuffer, ImportCounts,
+    RecordRowModel, TaskCancelled, TaskRunner, ViewFilter, apply_record_edits, build_search_index_step,
+    compact_nomor_urut, delete_all_records, delete_records, edit_journal_path, export_fidusia_workbook,
+    export_partitioned, fetch_change_rows, fetch_page_rows, fetch_record_counts, file_sha256, file_signature,
+    filter_condition, find_processed_file, format_tanggal_akta, gelar_for, import_files, import_excel_stream,
+    insert_record_at, last_record_id, logger, next_nomor_urut, open_database, perf, query_cache, record_count_view,
+    record_processed_file, row_stripe, set_sql_echo, setup_logging, sql_echo_enabled,
+    tanggal_columns, thread_session, update_records,
+)
+
+# Background index build, search-as-you-type and sparse compaction delays
+SEARCH_INDEX_BUILD_DELAY_MS = 50
+SEARCH_DEBOUNCE_MS = 300
+SPARSE_COMPACT_DELAY_MS = 5000
+# Buffered cell edits are written at most this long after the first one (see core.EditBuffer)
+EDIT_FLUSH_DELAY_MS = 2000
+# How far down the Treeview (0-1) the next page is fetched
+PAGE_PREFETCH_AT = 0.9
+# Tabs of the statistics window: record_counts dimension and title
+STATISTICS_TABS = (('perusahaan_finance', 'Perusahaan Finance'), ('nama_perwakilan', 'Nama Perwakilan'), ('bulan', 'Bulan'))
+# Filter builder operators (see core.FILTER_OPERATORS) as shown
+FILTER_OPERATOR_TITLES = {'equals': 'sama dengan', 'prefix': 'diawali', 'range': 'rentang'}
+# Download modes: None is one workbook with every record, the rest one workbook per value (see core.EXPORT_PARTITIONS)
+DOWNLOAD_MODES = ((None, 'Semua data (satu file)'), ('perusahaan_finance', 'Per perusahaan finance'), ('bulan', 'Per bulan (tanggal akta)'))
+# Marks the heading of the sorted column: ascending, descending
+SORT_ARROWS = {False: ' \u25b2', True: ' \u25bc'}
+
+# When set, the app writes its startup timings to this JSON file and closes once the first page is shown
+STARTUP_REPORT_ENV = 'OLAHDATA_STARTUP_REPORT'
+
+IMPORTED = time.perf_counter()
+
+# Sessions are per thread: calls on `session` from the Tk main loop go to the main
+# thread's session, while background tasks get their own from the same registry.
+# The database is opened in __main__ (open_database binds Session), not at import:
+# worker processes re-import this module and must not open or migrate it.
+session = thread_session
 
-# Setup SQLite Database
-DATABASE_URI = 'sqlite:///database.db'
-engine = create_engine(DATABASE_URI, echo=True)
-Session = sessionmaker(bind=engine)
-session = Session()
-Base = declarative_base()
-
-# Define the database model
-class Record(Base):
-    __tablename__ = 'records'
-    
-    id = Column(Integer, primary_key=True)
-    nomor_urut = Column(Integer, nullable=False)
-    nomor_akta = Column(String)
-    tanggal_akta = Column(String)
-    sifat_akta = Column(String)
-    nama_debitur = Column(String)
-    gender = Column(String)
-    status = Column(String)
-    nama_perwakilan = Column(String)
-    perusahaan_finance = Column(String)
-    alamat_perusahaan = Column(String)
-    gelar = Column(String)
-
-# Create the table
-Base.metadata.create_all(engine)
 
 class App:
-    def __init__(self, root):
+    def __init__(self, root, engine):
         self.root = root
+        self.engine = engine
+        self.startup_ms = {'import_ms': (IMPORTED - STARTED) * 1000}
         self.root.title('Aplikasi Olah Data')
         self.root.geometry('1000x600')  # Set window size to 1000x600
 
+        # Settings menu; SQL logging can be switched on while the app runs
+        self.sql_echo_var = tk.BooleanVar(value=sql_echo_enabled())
+        self.menu_bar = tk.Menu(root)
+        self.settings_menu = tk.Menu(self.menu_bar, tearoff=0)
+        self.settings_menu.add_checkbutton(label="Log SQL", variable=self.sql_echo_var, command=self.toggle_sql_echo)
+        self.settings_menu.add_command(label="Performa...", command=self.open_performance_window)
+        self.menu_bar.add_cascade(label="Pengaturan", menu=self.settings_menu)
+        self.root.config(menu=self.menu_bar)
+
         # Configure Treeview style
         self.style = ttk.Style()
         self.style.configure('Treeview.Heading', background='#007acc', foreground='green', font=('Arial', 10, 'bold'))
@@ -69,6 +94,12 @@ class App:
         self.delete_button = tk.Button(self.button_frame, text="Hapus Data", command=self.delete_data)
         self.delete_button.pack(side='left', padx=5)
 
+        self.bulk_edit_button = tk.Button(self.button_frame, text="Edit Terpilih", command=self.open_bulk_edit_form)
+        self.bulk_edit_button.pack(side='left', padx=5)
+
+        self.statistics_button = tk.Button(self.button_frame, text="Statistik", command=self.open_statistics_window)
+        self.statistics_button.pack(side='left', padx=5)
+
         self.delete_all_button = tk.Button(self.button_frame, text="Hapus Database", command=self.delete_all_data)
         self.delete_all_button.pack(side='right', padx=5)
 
@@ -82,9 +113,40 @@ class App:
         self.search_button = tk.Button(self.search_frame, text="Search", command=self.filter_data)
         self.search_button.pack(side='right', padx=10)
 
+        # Date range of Tanggal Akta, applied together with the search when checked
+        self.date_filter_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(self.search_frame, text="Tanggal Akta", variable=self.date_filter_var, command=self.filter_data).pack(side='left', padx=(10, 5))
+        # The date pickers are added once the window is shown (see create_date_entries)
+        self.date_frame = tk.Frame(self.search_frame)
+        self.date_frame.pack(side='left')
+
+        # Column conditions of the filter builder (or of a drill-down from the statistics window)
+        tk.Button(self.search_frame, text="Filter...", command=self.open_filter_window).pack(side='left', padx=10)
+        self.filter_frame = tk.Frame(self.search_frame)
+        self.filter_label = tk.Label(self.filter_frame, fg='#007acc')
+        self.filter_label.pack(side='left', padx=5)
+        tk.Button(self.filter_frame, text="Hapus filter", command=self.clear_filters).pack(side='left')
+
+        # Search as you type, debounced so only the last keystroke runs a query
+        self.search_after_id = None
+        self.search_entry.bind('<KeyRelease>', self.on_search_typed)
+
+        # Status bar of the background tasks; packed before the Treeview so it keeps its space
+        self.status_frame = tk.Frame(root, relief='sunken', bd=1)
+        self.status_frame.pack(side='bottom', fill='x')
+        self.status_label = tk.Label(self.status_frame, text="Siap", anchor='w')
+        self.status_label.pack(side='left', fill='x', expand=True, padx=5)
+        self.cancel_button = tk.Button(self.status_frame, text="Batalkan", command=self.cancel_tasks, state='disabled')
+        self.cancel_button.pack(side='right', padx=5)
+        self.unsaved_label = tk.Label(self.status_frame, text="", fg='red')
+        self.unsaved_label.pack(side='right', padx=5)
+
+        # Imports, exports and queries run on worker threads (see TaskRunner)
+        self.tasks = TaskRunner(root, on_status=self.update_status_bar)
+
         # Create Treeview
         self.tree_frame = tk.Frame(root)
-        self.tree = ttk.Treeview(self.tree_frame, columns=('Nomor Urut', 'Nomor Akta', 'Tanggal Akta', 'Sifat Akta', 'Nama Debitur', 'Gender', 'Status', 'Nama Perwakilan', 'Perusahaan Finance', 'Alamat Perusahaan', 'Gelar'), show='headings')
+        self.tree = ttk.Treeview(self.tree_frame, columns=TREE_COLUMNS, show='headings')
         self.tree_frame.pack(expand=True, fill='both')
 
         # Set column headings and alignments
@@ -100,6 +162,12 @@ class App:
         self.tree.heading('Alamat Perusahaan', text='Alamat Perusahaan')
         self.tree.heading('Gelar', text='Status')
 
+        # Clicking the heading of a sortable column sorts the view in SQL
+        self.heading_titles = {col: self.tree.heading(col, 'text') for col in TREE_COLUMNS}
+        for col, name in FILTER_COLUMNS.items():
+            if name in SORT_COLUMNS:
+                self.tree.heading(col, command=lambda name=name: self.sort_by(name))
+
         # Set column widths
         self.tree.column('Nomor Urut', width=20, anchor='center')
         self.tree.column('Nomor Akta', width=20, anchor='center')
@@ -116,21 +184,169 @@ class App:
         # # Add vertical scrollbar
         self.vsb = ttk.Scrollbar(self.tree_frame, orient="vertical", command=self.tree.yview)
         self.vsb.pack(side='right', fill='y')
-        self.tree.configure(yscrollcommand=self.vsb.set)
+        self.tree.configure(yscrollcommand=self.on_tree_scroll)
 
         self.tree.pack(expand=True, fill='both')
 
+        # Paging state of the virtual list; row_model mirrors the loaded rows
+        self.row_model = RecordRowModel()
+        self.view_filter = ViewFilter()
+        self.view_last_key = None
+        self.view_exhausted = True
+        self.view_generation = 0
+        self.view_page_task = None
+
+        # Cell edits are written behind (see flush_edits); edits a crash left in the
+        # journal are written before the first page is read
+        self.edits = EditBuffer(edit_journal_path(self.engine))
+        self.edits_after_id = None
+
         self.display_data()
         self.tree.bind('<Double-1>', self.on_item_double_click)
 
-        # Initialize log file
-        self.log_file_path = "log.txt"
+        # Sparse-mode renumbering is deferred, and always finished before closing
+        self.compaction_after_id = None
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+
+        # Index rows of older databases for full-text search while the app is idle
+        self.root.after(SEARCH_INDEX_BUILD_DELAY_MS, self.build_search_index)
+
+        # The first page is loading on a worker thread; the first Expose event is the window being drawn
+        self.root.bind('<Expose>', self.on_first_paint)
+
         self.log("Application started")
 
-    def log(self, message):
-        """Append a log message to the log file with timestamp."""
-        with open(self.log_file_path, 'a') as log_file:
-            log_file.write(f"{datetime.datetime.now()} - {message}\n")
+    def on_first_paint(self, event):
+        self.root.unbind('<Expose>')
+        self.mark_startup('first_paint_ms')
+        self.create_date_entries()
+
+    def create_date_entries(self):
+        # tkcalendar is imported here, after the window is shown
+        from tkcalendar import DateEntry
+
+        self.date_from_entry = DateEntry(self.date_frame, date_pattern='dd/mm/yyyy', width=12)
+        self.date_from_entry.pack(side='left')
+        tk.Label(self.date_frame, text="s/d").pack(side='left', padx=5)
+        self.date_to_entry = DateEntry(self.date_frame, date_pattern='dd/mm/yyyy', width=12)
+        self.date_to_entry.pack(side='left')
+        for date_entry in (self.date_from_entry, self.date_to_entry):
+            date_entry.bind('<<DateEntrySelected>>', self.on_date_selected)
+
+    def mark_startup(self, name):
+        """Record a startup milestone in ms since STARTED; the timings are logged once the first page is shown."""
+        if name in self.startup_ms:
+            return
+        self.startup_ms[name] = (time.perf_counter() - STARTED) * 1000
+        # The wall-clock time lets a launcher add the interpreter start-up before STARTED
+        self.startup_ms[name.replace('_ms', '_at')] = time.time()
+        if 'first_paint_ms' not in self.startup_ms or 'first_page_ms' not in self.startup_ms:
+            return
+        self.log("Startup", **{key: round(value, 1) for key, value in self.startup_ms.items() if key.endswith('_ms')})
+        report_path = os.environ.get(STARTUP_REPORT_ENV)
+        if report_path:
+            with open(report_path, 'w', encoding='utf-8') as report_file:
+                json.dump(self.startup_ms, report_file)
+            # Closed from the event loop, after the caller has finished with the window
+            self.root.after_idle(self.on_close)
+
+    def log(self, message, level=logging.INFO, **fields):
+        """Log a message; extra keyword arguments become fields of the JSON record."""
+        logger.log(level, message, extra={'fields': fields})
+
+    def toggle_sql_echo(self):
+        set_sql_echo(self.sql_echo_var.get())
+        self.log("SQL echo switched", sql_echo=self.sql_echo_var.get())
+
+    def open_performance_window(self):
+        self.performance_window = tk.Toplevel(self.root)
+        self.performance_window.title("Performa")
+        self.performance_window.geometry("900x600")
+
+        # p50/p95 per operation
+        tk.Label(self.performance_window, text="Ringkasan per operasi").pack(anchor='w', padx=10)
+        self.perf_summary = ttk.Treeview(self.performance_window, columns=('Operasi', 'Jumlah', 'p50 ms', 'p95 ms', 'Maks ms'), show='headings', height=6)
+        for col in self.perf_summary['columns']:
+            self.perf_summary.heading(col, text=col)
+            self.perf_summary.column(col, width=250 if col == 'Operasi' else 80, anchor='w' if col == 'Operasi' else 'e')
+        self.perf_summary.pack(fill='x', padx=10)
+        self.perf_cache_label = tk.Label(self.performance_window, anchor='w')
+        self.perf_cache_label.pack(fill='x', padx=10)
+
+        # Recent operations; selecting one shows its slowest queries
+        tk.Label(self.performance_window, text="Operasi terakhir").pack(anchor='w', padx=10)
+        self.perf_recent = ttk.Treeview(self.performance_window, columns=('Waktu', 'Operasi', 'ms', 'Query', 'SQL ms', 'Status'), show='headings', height=10)
+        for col in self.perf_recent['columns']:
+            self.perf_recent.heading(col, text=col)
+            self.perf_recent.column(col, width=250 if col == 'Operasi' else 100, anchor='w' if col in ('Waktu', 'Operasi', 'Status') else 'e')
+        self.perf_recent.pack(fill='both', expand=True, padx=10)
+        self.perf_recent.bind('<<TreeviewSelect>>', self.show_slowest_queries)
+
+        tk.Label(self.performance_window, text="Query paling lambat").pack(anchor='w', padx=10)
+        self.perf_queries = tk.Text(self.performance_window, height=8, wrap='none')
+        self.perf_queries.pack(fill='x', padx=10)
+
+        button_frame = tk.Frame(self.performance_window)
+        button_frame.pack(fill='x', pady=5)
+        tk.Button(button_frame, text="Refresh", command=self.refresh_performance_window).pack(side='left', padx=10)
+        self.profiling_var = tk.BooleanVar(value=perf.profiling)
+        tk.Checkbutton(button_frame, text="Profil CPU (cProfile)", variable=self.profiling_var, command=self.toggle_profiling).pack(side='left', padx=10)
+        tk.Button(button_frame, text="Ekspor...", command=self.export_performance_report).pack(side='right', padx=10)
+
+        self.refresh_performance_window()
+
+    def refresh_performance_window(self):
+        self.perf_summary.delete(*self.perf_summary.get_children())
+        for row in perf.summary():
+            self.perf_summary.insert('', 'end', values=(row['name'], row['count'], row['p50_ms'], row['p95_ms'], row['max_ms']))
+        cache = query_cache(self.engine).stats()
+        self.perf_cache_label.config(text=(
+            f"Cache halaman: {cache['hits']:,} hit, {cache['misses']:,} miss, "
+            f"{cache['entries']:,} halaman ({cache['bytes'] / 2 ** 20:.1f} MB)"
+        ))
+        self.perf_recent.delete(*self.perf_recent.get_children())
+        self.perf_recent_spans = perf.recent()
+        for index, span in enumerate(self.perf_recent_spans):
+            self.perf_recent.insert('', 'end', iid=index, values=(span['started'], span['name'], span['elapsed_ms'], span['statements'], span['sql_ms'], span['status']))
+        self.perf_queries.delete('1.0', 'end')
+
+    def show_slowest_queries(self, event):
+        self.perf_queries.delete('1.0', 'end')
+        for item in self.perf_recent.selection():
+            for query in self.perf_recent_spans[int(item)]['slowest']:
+                rows = '' if query['rows'] is None else f", {query['rows']} baris"
+                self.perf_queries.insert('end', f"{query['ms']} ms{rows}: {query['statement']}\n")
+
+    def toggle_profiling(self):
+        perf.profiling = self.profiling_var.get()
+        self.log("Profiling switched", profiling=perf.profiling)
+
+    def export_performance_report(self):
+        file_path = filedialog.asksaveasfilename(parent=self.performance_window, defaultextension=".json", filetypes=[("JSON files", "*.json")])
+        if not file_path:
+            return
+        try:
+            perf.export(file_path)
+            messagebox.showinfo("Berhasil", "Laporan performa berhasil disimpan!", parent=self.performance_window)
+            self.log(f"Performance report exported to file: {file_path}")
+        except Exception as e:
+            messagebox.showerror("Error", f"An error occurred: {e}", parent=self.performance_window)
+            self.log(f"Error exporting performance report to file {file_path}: {e}", level=logging.ERROR)
+
+    def update_status_bar(self, running, queued):
+        if not running and not queued:
+            self.status_label.config(text="Siap")
+            self.cancel_button.config(state='disabled')
+            return
+        text = "Berjalan: " + ", ".join(task.describe() for task in running) if running else "Menunggu"
+        if queued:
+            text += f"  |  Antrean: {len(queued)}"
+        self.status_label.config(text=text)
+        self.cancel_button.config(state='normal')
+
+    def cancel_tasks(self):
+        self.tasks.cancel_all()
+        self.log("Background tasks cancelled")
 
     def open_upload_form(self):
         self.upload_window = tk.Toplevel(self.root)
@@ -161,8 +377,16 @@ class App:
         self.alamat_perusahaan_finance = tk.Entry(input_frame)
         self.alamat_perusahaan_finance.grid(row=3, column=1, padx=10, pady=5)
         
+        # Streaming mode for very large files: read row by row and commit per chunk
+        self.stream_import_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(input_frame, text="Mode streaming (file besar)", variable=self.stream_import_var).grid(row=4, column=1, padx=10, pady=5, sticky='w')
+
         # Upload File Button
-        tk.Button(self.upload_window, text="Upload File", command=self.upload_file).pack(pady=10)
+        self.upload_file_button = tk.Button(self.upload_window, text="Upload File", command=self.upload_file)
+        self.upload_file_button.pack(pady=10)
+
+        self.upload_progress_label = tk.Label(self.upload_window, text="")
+        self.upload_progress_label.pack(pady=5)
     
     def upload_file(self):
         start_nomor_urut = self.start_nomor_urut_entry.get()
@@ -190,117 +414,275 @@ class App:
             messagebox.showerror("Error", "Alamat Perusahaan Finance tidak boleh kosong.")
             return
         
-        file_path = filedialog.askopenfilename(filetypes=[("Excel files", "*.xlsx")])
-        if file_path:
-            self.process_file(file_path, start_nomor_urut, nama_perwakilan, nama_perusahaan_finance, alamat_perusahaan_finance)
-            self.log(f"Data uploaded from file: {file_path}")
+        # Several workbooks can be selected; they are numbered one after another in the order chosen
+        file_paths = list(filedialog.askopenfilenames(filetypes=[("Excel files", "*.xlsx")]))
+        if not file_paths:
+            return
+        if self.stream_import_var.get() and len(file_paths) > 1:
+            messagebox.showerror("Error", "Mode streaming hanya untuk satu file.")
+            return
 
-    def process_file(self, file_path, start_nomor_urut, nama_perwakilan, nama_perusahaan_finance, alamat_perusahaan_finance):
-        try:
-            # Read the Excel file
-            df = pd.read_excel(file_path)
-            
-            # Create a list of records to insert into the database
-            records = []
-            existing_nomor_urut = {record.nomor_urut for record in session.query(Record.nomor_urut).all()}
-
-            current_nomor_urut = start_nomor_urut
-
-            for _, row in df.iterrows():
-                nomor_akta = row.get('number', '')
-                # Convert date from DD/MM/YYYY to DD Month YYYY
-                tanggal_akta = row.get('created_time', '')
-                if pd.notna(tanggal_akta):
-                    try:
-                        tanggal_akta = datetime.datetime.strptime(tanggal_akta, "%d/%m/%Y %H:%M").strftime("%d %B %Y")
-                    except ValueError:
-                        try:
-                            tanggal_akta = datetime.datetime.strptime(tanggal_akta, "%d/%m/%Y").strftime("%d %B %Y")
-                        except ValueError:
-                            tanggal_akta = ''
-                else:
-                    tanggal_akta = ''
-                            
-                # Determine 'gelar'
-                gender = row.get('gender_1', '')
-                status = row.get('marital_1', '')
-                if gender == 'male':
-                    gelar = 'Tn'
-                elif gender == 'female' and status == 'single':
-                    gelar = 'Nn'
-                elif gender == 'female' and status == 'married':
-                    gelar = 'Ny'
-                else:
-                    gelar = ''  # Default or handle other cases
-
-                # Skip if nomor_urut already exists
-                if current_nomor_urut in existing_nomor_urut:
-                    current_nomor_urut += 1  # Increment nomor_urut to avoid duplicates
-                
-                record = Record(
-                    nomor_urut=current_nomor_urut,
-                    nomor_akta=nomor_akta,
-                    tanggal_akta=tanggal_akta,
-                    sifat_akta='AKTA JAMINAN FIDUSIA',
-                    nama_debitur=row.get('name_debitur', ''),
-                    gender=row.get('gender_1', ''),
-                    status=row.get('marital_1', ''),
-                    nama_perwakilan=nama_perwakilan,
-                    perusahaan_finance=nama_perusahaan_finance,
-                    alamat_perusahaan=alamat_perusahaan_finance,
-                    gelar=gelar
-                )
-                records.append(record)
-                current_nomor_urut += 1  # Increment nomor_urut for the next record
-            
-            # Add records to the session and commit
-            session.add_all(records)
-            session.commit()
-            
-            messagebox.showinfo("Berhasil", "Data berhasil di simpan ke database!")
-            self.upload_window.destroy()  # Close the upload form
+        def check_files(db_session, task):
+            # The same workbook uploaded twice would double its rows, so look it up in the manifest first
+            file_hashes, previous = [], []
+            for file_path in file_paths:
+                task.check_cancelled()
+                file_hash = file_sha256(file_path)
+                entry = find_processed_file(db_session, file_hash)
+                if entry:
+                    previous.append(f"{os.path.basename(file_path)}: {entry.processed_at.replace('T', ' ')} ({entry.rows} data)")
+                elif file_hash in file_hashes:
+                    previous.append(f"{os.path.basename(file_path)}: dipilih lebih dari sekali")
+                file_hashes.append(file_hash)
+            return file_hashes, previous
+
+        def checked(result):
+            file_hashes, previous = result
+            if previous and not messagebox.askyesno("Konfirmasi", "File berikut sudah pernah diupload:\n" + "\n".join(previous) + "\n\nUpload lagi?"):
+                self.set_upload_status("", uploading=False)
+                return
+            if self.stream_import_var.get():
+                self.process_file_stream(file_paths[0], file_hashes[0], start_nomor_urut, nama_perwakilan, nama_perusahaan_finance, alamat_perusahaan_finance)
+            else:
+                self.process_files(file_paths, file_hashes, start_nomor_urut, nama_perwakilan, nama_perusahaan_finance, alamat_perusahaan_finance)
+            self.log(f"Data uploaded from files: {', '.join(file_paths)}")
+
+        def check_failed(e):
+            self.set_upload_status("", uploading=False)
+            if not isinstance(e, TaskCancelled):
+                messagebox.showerror("Error", f"An error occurred: {e}")
+                self.log(f"Error reading files {', '.join(file_paths)}: {e}", level=logging.ERROR)
+
+        self.set_upload_status("Memeriksa file...", uploading=True)
+        self.tasks.submit("Periksa file", check_files, writes=False, on_done=checked, on_error=check_failed)
+
+    def set_upload_status(self, text, uploading):
+        # The upload form may have been closed while the import was running
+        if self.upload_window.winfo_exists():
+            self.upload_progress_label.config(text=text)
+            self.upload_file_button.config(state='disabled' if uploading else 'normal')
+
+    def process_files(self, file_paths, file_hashes, start_nomor_urut, nama_perwakilan, nama_perusahaan_finance, alamat_perusahaan_finance):
+        self.flush_edits()
+        self.compact_now()
+        signatures = [file_signature(file_path) for file_path in file_paths]
+        # Files whose transaction has been committed
+        files_done = []
+
+        def mark_processed(db_session, index, counts):
+            record_processed_file(db_session, file_hashes[index], signatures[index], counts.inserted)
+
+        def import_all(db_session, task):
+            def report(done, total):
+                # Called after each file's commit; recorded first, as report raises when the upload is cancelled
+                files_done[:] = range(done)
+                task.report(done, total)
+
+            # Workbooks are parsed in worker processes; each one is inserted here in a single
+            # transaction together with its manifest entry
+            last_id = last_record_id(db_session)
+            file_counts = import_files(db_session, file_paths, start_nomor_urut, nama_perwakilan, nama_perusahaan_finance, alamat_perusahaan_finance, progress=report, on_file=mark_processed)
+            return sum(file_counts, ImportCounts()), last_id
+
+        def show_progress(done, total):
+            if total > 1:
+                self.set_upload_status(f"{done} / {total} file diproses", uploading=True)
+
+        def done(result):
+            self.finish_upload(*result, file_count=len(file_paths))
+
+        def failed(e):
+            self.set_upload_status("", uploading=False)
+            saved = f"\n{len(files_done)} file pertama sudah tersimpan." if files_done else ""
+            if isinstance(e, TaskCancelled):
+                self.log(f"Upload of files {', '.join(file_paths)} cancelled")
+                if files_done:
+                    messagebox.showinfo("Info", "Upload dibatalkan." + saved)
+            else:
+                failed_path = file_paths[len(files_done)]
+                messagebox.showerror("Error", f"An error occurred in {os.path.basename(failed_path)}: {e}" + saved)
+                self.log(f"Error processing file {failed_path}: {e}", level=logging.ERROR)
+            if files_done:
+                self.display_data()
+
+        self.set_upload_status("Memproses file...", uploading=True)
+        self.tasks.submit("Upload data", import_all, writes=True, on_done=done, on_error=failed, on_progress=show_progress)
+
+    def finish_upload(self, counts, last_id, file_count=1):
+        files = f" dari {file_count} file" if file_count > 1 else ""
+        messagebox.showinfo("Berhasil", f"Data{files} berhasil di simpan ke database!\n{counts.describe()}")
+        self.log("Upload finished", **counts.as_dict())
+        self.upload_window.destroy()  # Close the upload form
+        if counts.updated:
+            # Re-imported rows changed in place; their ids are not known here
             self.display_data()
-        except Exception as e:
-            messagebox.showerror("Error", f"An error occurred: {e}")
-            self.log(f"Error processing file {file_path}: {e}")
+        else:
+            self.apply_changes(ChangeSet(inserted_after=last_id))
+
+    def process_file_stream(self, file_path, file_hash, start_nomor_urut, nama_perwakilan, nama_perusahaan_finance, alamat_perusahaan_finance):
+        self.flush_edits()
+        self.compact_now()
+        signature = file_signature(file_path)
+
+        def mark_processed(db_session, counts):
+            record_processed_file(db_session, file_hash, signature, counts.inserted)
+
+        def import_file(db_session, task):
+            # Progress is reported after each committed chunk, so a cancelled upload can be resumed
+            last_id = last_record_id(db_session)
+            counts = import_excel_stream(db_session, file_path, start_nomor_urut, nama_perwakilan, nama_perusahaan_finance, alamat_perusahaan_finance, progress=task.report, file_hash=file_hash, on_complete=mark_processed)
+            return counts, last_id
+
+        def show_progress(rows_done, total_rows):
+            if total_rows:
+                self.set_upload_status(f"{rows_done:,} / {total_rows:,} baris diproses", uploading=True)
+            else:
+                self.set_upload_status(f"{rows_done:,} baris diproses", uploading=True)
 
-    def display_data(self, search_query=""):
-        # Clear the existing data in the Treeview
-        for row in self.tree.get_children():
-            self.tree.delete(row)
-        
-        # Query all records from the database, with optional filtering
-        # records = session.query(Record).order_by(Record.nomor_urut).all()
-        query = session.query(Record).order_by(Record.nomor_urut)
-        if search_query:
-            search_query = f"%{search_query}%"
-            query = query.filter(
-                (Record.nomor_akta.like(search_query)) |
-                (Record.nama_debitur.like(search_query)) |
-                (Record.nama_perwakilan.like(search_query)) |
-                (Record.perusahaan_finance.like(search_query)) |
-                (Record.alamat_perusahaan.like(search_query))
-            )
-        records = query.all()
-        
-        # Insert records into the Treeview
-        for index, record in enumerate(records):
-            tag = 'evenrow' if index % 2 == 0 else 'oddrow'
-            self.tree.insert('', 'end', iid=record.id, values=(
-                record.nomor_urut,
-                record.nomor_akta,
-                record.tanggal_akta,
-                record.sifat_akta,
-                record.nama_debitur,
-                record.gender,
-                record.status,
-                record.nama_perwakilan,
-                record.perusahaan_finance,
-                record.alamat_perusahaan,
-                record.gelar
-            ), tags=(tag,))
-            
-        self.adjust_column_widths()
+        def done(result):
+            self.finish_upload(*result)
+
+        def failed(e):
+            self.set_upload_status("", uploading=False)
+            if isinstance(e, TaskCancelled):
+                messagebox.showinfo("Info", "Upload dibatalkan.\nUpload ulang file yang sama untuk melanjutkan dari bagian terakhir yang tersimpan.")
+                self.log(f"Streaming of file {file_path} cancelled")
+            else:
+                messagebox.showerror("Error", f"An error occurred: {e}\nUpload ulang file yang sama untuk melanjutkan dari bagian terakhir yang tersimpan.")
+                self.log(f"Error streaming file {file_path}: {e}", level=logging.ERROR)
+            self.display_data()
+
+        self.set_upload_status("Memproses file...", uploading=True)
+        self.tasks.submit("Upload data", import_file, writes=True, on_done=done, on_error=failed, on_progress=show_progress)
+
+    def display_data(self, view=None):
+        # Pages are read from the database, so the buffered edits are written first
+        self.flush_edits(on_saved=lambda: self.show_view(view), on_failed=lambda: self.show_view(view))
+
+    @perf.timed("Muat ulang tabel")
+    def show_view(self, view=None):
+        # Clear the existing data in the Treeview with a single call
+        self.tree.delete(*self.tree.get_children())
+        self.row_model.clear()
+
+        # Only the first page is loaded here; on_tree_scroll loads the rest on demand.
+        # A page still being fetched for the previous view is dropped when it arrives.
+        self.view_generation += 1
+        if self.view_page_task is not None:
+            self.view_page_task.cancel()
+            self.view_page_task = None
+        self.view_filter = view or ViewFilter()
+        self.show_filters()
+        self.show_sort()
+        self.view_last_key = None
+        self.view_exhausted = False
+        self.load_next_page()
+
+    def load_next_page(self):
+        if self.view_exhausted or self.view_page_task is not None:
+            return
+        view, after, generation = self.view_filter, self.view_last_key, self.view_generation
+        self.view_page_task = self.tasks.submit(
+            "Memuat data",
+            lambda db_session, task: fetch_page_rows(db_session, view, after),
+            on_done=lambda page: self.show_page(generation, page),
+            on_error=lambda e: self.page_failed(generation, e)
+        )
+
+    @perf.timed("Tampilkan halaman")
+    def show_page(self, generation, page):
+        if generation != self.view_generation:
+            return
+        self.view_page_task = None
+        self.mark_startup('first_page_ms')
+        if len(page) < PAGE_SIZE:
+            self.view_exhausted = True
+        if page:
+            self.view_last_key = page[-1][2]
+
+        # Insert records into the Treeview, continuing the row striping
+        offset = len(self.row_model)
+        self.row_model.extend(page)
+        for index, (record_id, values, key) in enumerate(page, start=offset):
+            self.tree.insert('', 'end', iid=record_id, values=values, tags=(row_stripe(index),))
+        if offset == 0:
+            self.adjust_column_widths()
+
+    @perf.timed("Terapkan perubahan")
+    def apply_changes(self, changes):
+        """Patch the loaded rows with a ChangeSet instead of reloading the view."""
+        if changes.cleared:
+            self.tree.delete(*self.row_model.ids)
+            self.row_model.clear()
+            self.view_exhausted = True
+            return
+
+        first = self.row_model.remove(changes.deleted)
+        if first is not None:
+            self.tree.delete(*[record_id for record_id in changes.deleted if self.tree.exists(record_id)])
+            self.restripe_rows(first)
+
+        # A cell edit touches only its own item
+        for record_id, columns in changes.updated.items():
+            if record_id not in self.row_model:
+                continue
+            for column_name, value in columns.items():
+                self.row_model.set_value(record_id, TREE_COLUMNS.index(column_name), value)
+                self.tree.set(record_id, column_name, value)
+
+        if not changes.needs_fetch():
+            return
+        if self.view_filter.sort is not None:
+            # New and renumbered rows are placed by the register order, so a sorted view is reloaded
+            self.display_data(self.view_filter)
+            return
+        view, generation = self.view_filter, self.view_generation
+        loaded_ids = list(self.row_model.ids)
+        up_to = None if self.view_exhausted else self.view_last_key
+        self.tasks.submit(
+            "Memuat perubahan",
+            lambda db_session, task: fetch_change_rows(db_session, changes, view, loaded_ids, up_to),
+            on_done=lambda fetched: self.apply_fetched_changes(generation, fetched),
+            on_error=lambda e: None if isinstance(e, TaskCancelled) else self.log(f"Error loading changes: {e}", level=logging.ERROR)
+        )
+
+    @perf.timed("Terapkan perubahan")
+    def apply_fetched_changes(self, generation, fetched):
+        if generation != self.view_generation:
+            return
+        numbers, rows, overflow = fetched
+        if overflow:
+            # A bulk insert landed inside the loaded window: reloading one page is cheaper
+            self.display_data(self.view_filter)
+            return
+
+        for record_id in self.row_model.renumber(numbers):
+            self.tree.set(record_id, 'Nomor Urut', self.row_model.values[record_id][0])
+        if numbers and self.row_model.ids and not self.view_exhausted:
+            self.view_last_key = self.row_model.keys[-1]
+
+        first = self.row_model.remove([record_id for record_id, values, key in rows])
+        if first is not None:
+            self.tree.delete(*[record_id for record_id, values, key in rows if self.tree.exists(record_id)])
+        for record_id, values, key in rows:
+            position = self.row_model.insert(record_id, values, key)
+            self.tree.insert('', position, iid=record_id, values=values)
+            first = position if first is None else min(first, position)
+        if first is not None:
+            self.restripe_rows(first)
+
+    def page_failed(self, generation, e):
+        if generation != self.view_generation:
+            return
+        self.view_page_task = None
+        if not isinstance(e, TaskCancelled):
+            self.log(f"Error loading data: {e}", level=logging.ERROR)
+
+    def on_tree_scroll(self, first, last):
+        self.vsb.set(first, last)
+        # Fetch the next page once the viewport gets close to the last loaded row
+        if float(last) >= PAGE_PREFETCH_AT and not self.view_exhausted and self.view_page_task is None:
+            self.load_next_page()
 
     def adjust_column_widths(self):
         for col in self.tree['columns']:
@@ -308,6 +690,9 @@ class App:
         self.tree.update_idletasks()
 
     def on_item_double_click(self, event):
+        # Double-clicking a heading sorts (twice) rather than editing
+        if self.tree.identify_region(event.x, event.y) != 'cell':
+            return
         item_id = self.tree.identify_row(event.y)
         column = self.tree.identify_column(event.x)
         col_index = int(column.split('#')[-1]) - 1
@@ -324,26 +709,157 @@ class App:
         
         tk.Button(self.edit_window, text="Simpan", command=lambda: self.save_edit(item_id, col_index)).pack(pady=10)
 
+    @perf.timed("Edit data")
     def save_edit(self, item_id, col_index):
         new_value = self.edit_entry.get()
-        
-        # Update the Treeview
-        self.tree.item(item_id, values=(
-            *self.tree.item(item_id, 'values')[:col_index],
-            new_value,
-            *self.tree.item(item_id, 'values')[col_index + 1:]
-        ))
-        
-        # Update the database
-        record_id = item_id
-        record = session.query(Record).filter_by(id=record_id).first()
         column_name = self.tree['columns'][col_index]
-        setattr(record, column_name.lower().replace(' ', '_'), new_value)
-        
-        session.commit()
-        
+        attribute = column_name.lower().replace(' ', '_')
+
+        if attribute == 'nomor_urut':
+            self.save_nomor_urut_edit(item_id, new_value)
+            return
+        try:
+            self.edits.add(item_id, attribute, new_value)
+        except Exception as e:
+            messagebox.showerror("Error", f"An error occurred: {e}")
+            self.log(f"Error editing record {item_id}: {e}", level=logging.ERROR)
+            return
+
         self.edit_window.destroy()
-        self.display_data()  # Refresh the Treeview to reflect changes
+        if attribute == 'tanggal_akta':
+            # Shown the way it will be stored: a date as 'DD Month YYYY'
+            new_value = format_tanggal_akta(**tanggal_columns(new_value))
+        self.apply_changes(ChangeSet(updated={item_id: {column_name: new_value}}))
+        if self.edits.full():
+            self.flush_edits()
+        else:
+            self.schedule_edit_flush()
+            self.show_unsaved_edits()
+
+    def save_nomor_urut_edit(self, item_id, new_value):
+        # A new number is checked against the others and moves the record, so it
+        # is not buffered; the writer thread writes it after any earlier writes
+        def done(updated):
+            if self.edit_window.winfo_exists():
+                self.edit_window.destroy()
+            # The record moves to its new position
+            self.apply_changes(ChangeSet(deleted=[item_id], inserted=[item_id]))
+
+        def failed(e):
+            # The edit window stays open to correct the number
+            messagebox.showerror("Error", f"An error occurred: {e}")
+            self.log(f"Error editing record {item_id}: {e}", level=logging.ERROR)
+
+        self.tasks.submit(
+            "Edit data",
+            lambda db_session, task: update_records(db_session, [item_id], 'nomor_urut', new_value),
+            writes=True,
+            on_done=done,
+            on_error=failed
+        )
+
+    def schedule_edit_flush(self):
+        # Counted from the first pending edit, so steady editing still saves every few seconds
+        if self.edits_after_id is None:
+            self.edits_after_id = self.root.after(EDIT_FLUSH_DELAY_MS, self.flush_edits)
+
+    def flush_edits(self, on_saved=None, on_failed=None):
+        """Write the buffered cell edits in one transaction, then call on_saved().
+
+        The edits go through the writer thread, so the Tk thread never waits
+        for the database and the edits are written before any write task
+        submitted after them. Reads and deletes run from on_saved, so they see
+        every edit. Edits that cannot be written stay buffered and are tried
+        again; on_failed() is called instead.
+        """
+        if self.edits_after_id is not None:
+            self.root.after_cancel(self.edits_after_id)
+            self.edits_after_id = None
+        if not len(self.edits):
+            if on_saved:
+                on_saved()
+            return
+        edits = self.edits.snapshot()
+
+        def done(updated):
+            self.edits.saved(edits)
+            self.log(f"Saved {len(edits)} buffered edits", records=updated)
+            self.show_unsaved_edits()
+            if on_saved:
+                on_saved()
+
+        def failed(e):
+            # The edits stay in the buffer and the journal
+            self.log(f"Error saving {len(edits)} edits: {e}", level=logging.ERROR)
+            self.schedule_edit_flush()
+            self.unsaved_label.config(text=f"Gagal menyimpan {len(self.edits)} perubahan, dicoba lagi")
+            if on_failed:
+                on_failed()
+
+        self.tasks.submit("Simpan edit", lambda db_session, task: apply_record_edits(db_session, edits), writes=True, on_done=done, on_error=failed)
+
+    def edits_not_saved(self, action):
+        messagebox.showerror("Error", f"Perubahan yang belum disimpan gagal ditulis ke database; {action} dibatalkan.")
+
+    def show_unsaved_edits(self):
+        count = len(self.edits)
+        self.unsaved_label.config(text=f"Perubahan belum disimpan: {count}" if count else "")
+
+    def open_bulk_edit_form(self):
+        selected_items = self.tree.selection()
+        if not selected_items:
+            messagebox.showinfo("Info", "Pilih data yang akan diubah terlebih dahulu.")
+            return
+
+        # Every column except the unique Nomor Urut, listed by its heading
+        columns = {self.tree.heading(col, 'text'): col for col in self.tree['columns'] if col != 'Nomor Urut'}
+
+        self.bulk_edit_window = tk.Toplevel(self.root)
+        self.bulk_edit_window.title("Edit Data Terpilih")
+        self.bulk_edit_window.geometry("300x200")
+
+        tk.Label(self.bulk_edit_window, text=f"{len(selected_items)} data terpilih").pack(pady=5)
+        column_box = ttk.Combobox(self.bulk_edit_window, values=list(columns), state='readonly')
+        column_box.pack(pady=5)
+        value_entry = tk.Entry(self.bulk_edit_window)
+        value_entry.pack(pady=5)
+
+        def save():
+            if column_box.get() not in columns:
+                messagebox.showerror("Error", "Pilih kolom yang akan diubah.")
+                return
+            self.save_bulk_edit(selected_items, columns[column_box.get()], value_entry.get())
+
+        tk.Button(self.bulk_edit_window, text="Simpan", command=save).pack(pady=10)
+
+    def save_bulk_edit(self, selected_items, column_name, new_value):
+        attribute = column_name.lower().replace(' ', '_')
+        shown_value = format_tanggal_akta(**tanggal_columns(new_value)) if attribute == 'tanggal_akta' else new_value
+
+        def done(updated):
+            # Only the rows still loaded in the Treeview need their cell changed
+            self.apply_changes(ChangeSet(updated={item: {column_name: shown_value} for item in selected_items}))
+            messagebox.showinfo("Berhasil", f"{updated} data berhasil diubah.")
+            self.log(f"Records updated ({attribute} = {new_value!r}): {selected_items}")
+
+        def failed(e):
+            if isinstance(e, TaskCancelled):
+                return
+            messagebox.showerror("Error", f"An error occurred: {e}")
+            self.log(f"Error updating records: {e}", level=logging.ERROR)
+
+        self.bulk_edit_window.destroy()
+        # A cell edit still buffered must not overwrite the bulk edit afterwards
+        self.flush_edits(
+            on_saved=lambda: self.tasks.submit(
+                "Edit data",
+                lambda db_session, task: update_records(db_session, selected_items, attribute, new_value),
+                writes=True,
+                on_done=done,
+                on_error=failed
+            ),
+            on_failed=lambda: self.edits_not_saved("edit")
+        )
 
     def open_input_form(self):
         self.top = tk.Toplevel(self.root)
@@ -367,15 +883,7 @@ class App:
         for index, label in enumerate(self.labels):
             tk.Label(self.top, text=label).grid(row=index, column=0, sticky='e', padx=10, pady=5)
             
-            # if label == 'Tanggal Akta (DD/MM/YYYY)':
-            #     # Add DateEntry widget for date selection
-            #     entry = DateEntry(self.top, date_pattern='dd/mm/yyyy')
-            if label == 'Tanggal Akta':
-                # Add Calendar widget for date selection
-                entry = Calendar(self.top, selectmode='day', date_pattern='dd/mm/yyyy')
-                entry.grid(row=index, column=1, padx=10, pady=5)
-                self.entries[label] = entry
-            elif label == 'Gender':
+            if label == 'Gender':
                 # Add Combobox for gender selection
                 entry = ttk.Combobox(self.top, values=['male', 'female'])
             elif label == 'Status':
@@ -402,237 +910,504 @@ class App:
             perusahaan_finance = self.entries['Perusahaan Finance'].get()
             alamat_perusahaan = self.entries['Alamat Perusahaan'].get()
             nomor_urut_baru = int(self.entries["Nomor Urut"].get())
-            
-            # Set Gelar based on Gender and Status
-            if gender == 'male':
-                gelar = 'Tn'
-            elif gender == 'female' and status == 'single':
-                gelar = 'Nn'
-            elif gender == 'female' and status == 'married':
-                gelar = 'Ny'
-            else:
-                gelar = ''
-
-            # Convert date from DD/MM/YYYY to DD Month YYYY
-            try:
-                tanggal_akta = datetime.datetime.strptime(tanggal_akta_str, "%d/%m/%Y").strftime("%d %B %Y")
-            except ValueError:
-                tanggal_akta = ''  # Default to empty if format is incorrect
-
-            # Cek apakah nomor urut baru sudah ada
-            existing_record = session.query(Record).filter_by(nomor_urut=nomor_urut_baru).first()
-
-            if existing_record:
-                # Jika nomor urut baru sudah ada, geser nomor urut yang ada
-                records_to_update = session.query(Record).filter(Record.nomor_urut >= nomor_urut_baru).all()
-                for record in records_to_update:
-                    record.nomor_urut += 1
-                
-                new_record = Record(
-                    nomor_urut=nomor_urut_baru,
-                    nomor_akta=nomor_akta,
-                    tanggal_akta=tanggal_akta,
-                    sifat_akta=sifat_akta,
-                    nama_debitur=nama_debitur,
-                    gender=gender,
-                    status=status,
-                    nama_perwakilan=nama_perwakilan,
-                    perusahaan_finance=perusahaan_finance,
-                    alamat_perusahaan=alamat_perusahaan,
-                    gelar=gelar
-                )
-
-                # Add record to the session and commit
-                session.add(new_record)
-                
-            session.commit()
+        except ValueError as e:
+            messagebox.showerror("Error", f"An error occurred: {e}")
+            return
 
-            self.log(f"Data saved: {nomor_akta}, {tanggal_akta}, {nama_debitur}, {nomor_urut_baru}")
+        # Set Gelar based on Gender and Status
+        gelar = gelar_for(gender, status)
+
+        # A DD/MM/YYYY date is stored as a date; other text is kept as typed
+        tanggal_values = tanggal_columns(tanggal_akta_str)
+
+        def insert(db_session, task):
+            # Jika nomor urut baru sudah ada, nomor urut yang ada digeser
+            record, compaction_pending = insert_record_at(
+                db_session,
+                nomor_urut_baru,
+                nomor_akta=nomor_akta,
+                **tanggal_values,
+                sifat_akta=sifat_akta,
+                nama_debitur=nama_debitur,
+                gender=gender,
+                status=status,
+                nama_perwakilan=nama_perwakilan,
+                perusahaan_finance=perusahaan_finance,
+                alamat_perusahaan=alamat_perusahaan,
+                gelar=gelar
+            )
+            db_session.commit()
+            return record.id, compaction_pending
+
+        def done(result):
+            record_id, compaction_pending = result
+            if compaction_pending:
+                self.schedule_compaction()
+            self.log(f"Data saved: {nomor_akta}, {format_tanggal_akta(**tanggal_values)}, {nama_debitur}, {nomor_urut_baru}")
             messagebox.showinfo("Berhasil","Data berhasil disimpan!")
-            self.top.destroy()  # Close the input form
-            self.display_data()  # Refresh the Treeview
-        except Exception as e:
-            session.rollback()  # Rollback jika terjadi error
-            messagebox.showerror("Error", f"An error occurred: {e}")
-            self.log(f"Error saving data: {e}")
+            if self.top.winfo_exists():
+                self.top.destroy()  # Close the input form
+            # Records after the new one may have been shifted down
+            self.apply_changes(ChangeSet(inserted=[record_id], renumbered=True))
 
+        def failed(e):
+            messagebox.showerror("Error", f"An error occurred: {e}")
+            self.log(f"Error saving data: {e}", level=logging.ERROR)
+
+        # Shifting the following numbers can take a while, so the insert runs on the writer thread
+        self.tasks.submit("Input data", insert, writes=True, on_done=done, on_error=failed)
+
+    def schedule_compaction(self):
+        # Several inserts in a row share one renumbering pass
+        if self.compaction_after_id is not None:
+            self.root.after_cancel(self.compaction_after_id)
+        self.compaction_after_id = self.root.after(SPARSE_COMPACT_DELAY_MS, self.compact_now)
+
+    def compact_now(self, on_compacted=None):
+        """Give pending sparse inserts their final numbers, then call on_compacted().
+
+        The renumbering runs on the writer thread, so write tasks submitted
+        after it see the final numbers; reads, which do not wait for the
+        writer, go in on_compacted. It is called even when the renumbering
+        fails, as the register stays usable with placeholder numbers.
+        """
+        if self.compaction_after_id is not None:
+            self.root.after_cancel(self.compaction_after_id)
+            self.compaction_after_id = None
+        if not SPARSE_ORDERING:
+            if on_compacted:
+                on_compacted()
+            return
 
-    def shift_nomor_urut(self, new_nomor_urut):
+        def compact(db_session, task):
+            renumbered = compact_nomor_urut(db_session)
+            db_session.commit()
+            return renumbered
+
+        def done(renumbered):
+            if renumbered:
+                self.log(f"Compacted nomor urut: {renumbered} records renumbered")
+                self.apply_changes(ChangeSet(renumbered=True))
+            if on_compacted:
+                on_compacted()
+
+        def failed(e):
+            self.log(f"Error compacting nomor_urut: {e}", level=logging.ERROR)
+            if on_compacted:
+                on_compacted()
+
+        self.tasks.submit("Rapikan nomor urut", compact, writes=True, on_done=done, on_error=failed)
+
+    def on_close(self):
+        # Running tasks stop at their next cancellation point; a streaming
+        # upload keeps its committed chunks and can be resumed later
+        self.tasks.shutdown()
+        # Buffered edits are saved and pending sparse inserts get their final
+        # numbers before the app exits; edits that fail stay in the journal.
+        # The task runner has stopped, so the edits are written here.
+        if self.edits_after_id is not None:
+            self.root.after_cancel(self.edits_after_id)
+            self.edits_after_id = None
         try:
-            # Ambil semua record yang nomor urutnya lebih besar atau sama dengan new_nomor_urut
-            records_to_shift = session.query(Record).filter(Record.nomor_urut >= new_nomor_urut).order_by(Record.nomor_urut.desc()).all()
-
-            # Mulai dari nomor urut terbesar, geser semua nomor urut
-            for record in records_to_shift:
-                record.nomor_urut += 1
-                
-            session.commit()
-
-            self.log(f"Shifted nomor urut starting from {new_nomor_urut}to {new_nomor_urut + len(records_to_shift)}")
+            self.edits.apply(session)
         except Exception as e:
-            session.rollback()  # Rollback jika terjadi error
-            messagebox.showerror("Error", f"An error occurred while shifting nomor_urut: {e}")
-            self.log(f"Error shifting nomor_urut starting from {new_nomor_urut}: {e}")
+            self.log(f"Error saving {len(self.edits)} edits: {e}", level=logging.ERROR)
+        if SPARSE_ORDERING:
+            try:
+                compact_nomor_urut(session)
+                session.commit()
+            except Exception as e:
+                session.rollback()
+                self.log(f"Error compacting nomor_urut: {e}", level=logging.ERROR)
+        self.edits.close()
+        session.remove()
+        self.root.destroy()
 
     def get_next_nomor_urut(self):
         # Get the next nomor_urut based on the existing records
-        last_record = session.query(Record).order_by(Record.nomor_urut.desc()).first()
-        return (last_record.nomor_urut + 1) if last_record else 1
+        return next_nomor_urut(session)
 
     def delete_data(self):
-        selected_item = self.tree.selection()       
-        for item in selected_item:
-            record_values = self.tree.item(item, 'values')
-            nomor_urut = record_values[0]
-
-            # Delete from database
-            record_to_delete = session.query(Record).filter_by(nomor_urut=nomor_urut).first()
-            if record_to_delete:
-               session.delete(record_to_delete)
-               session.commit()
-
-            # Remove from Treeview
-            self.tree.delete(item)
-            self.display_data()
+        selected_item = self.tree.selection()
+        if not selected_item:
+            return
 
-        messagebox.showinfo("Info", "Record(s) data berhasil dihapus.")
-        self.log(f"Records deleted: {selected_item}")
+        def done(deleted):
+            # Remove from Treeview without reloading
+            self.edits.discard(selected_item)
+            self.show_unsaved_edits()
+            self.apply_changes(ChangeSet(deleted=selected_item))
+            messagebox.showinfo("Info", "Record(s) data berhasil dihapus.")
+            self.log(f"Records deleted: {selected_item}")
+
+        def failed(e):
+            if isinstance(e, TaskCancelled):
+                return
+            messagebox.showerror("Error", f"An error occurred: {e}")
+            self.log(f"Error deleting records: {e}", level=logging.ERROR)
+
+        # The Treeview item ids are the record ids; deleting waits for the buffered edits
+        self.flush_edits(
+            on_saved=lambda: self.tasks.submit(
+                "Hapus data",
+                lambda db_session, task: delete_records(db_session, selected_item),
+                writes=True,
+                on_done=done,
+                on_error=failed
+            ),
+            on_failed=lambda: self.edits_not_saved("hapus data")
+        )
+
+    def restripe_rows(self, start=0):
+        # Rows above start keep their tag, so a change only costs the rows below it
+        for index in range(start, len(self.row_model)):
+            self.tree.item(self.row_model.ids[index], tags=(row_stripe(index),))
 
     def download_data(self):
-        try:
-            # Query all records from the database
-            records = session.query(Record).order_by(Record.nomor_urut).all()
-            
-            # Create a new Excel workbook and select the active worksheet
-            wb = Workbook()
-            ws = wb.active
-            
-            # Set headers in the first row
-            ws['A1'] = 'Nomor Urut'
-            ws['B1'] = 'Nomor Akta'
-            ws['C1'] = 'Tanggal Akta'
-            ws['D1'] = 'Sifat Akta'
-            ws['E1'] = 'Nama Penghadap dan atau yang diwakilkan/kuasa'
-            ws['E2'] = 'Nama Debitur'
-            ws['E3'] = 'Perusahaan Finance'
-            ws['E4'] = 'Alamat Perusahaan'
-            ws['E5'] = 'gelar'
-            
-            # Apply bold font for headers
-            bold_font = Font(bold=True)
-            ws['A1'].font = bold_font
-            ws['B1'].font = bold_font
-            ws['C1'].font = bold_font
-            ws['D1'].font = bold_font
-            ws['E1'].font = bold_font
-
-            # Set the rest of the font to regular
-            regular_font = Font(bold=False)
-            ws['E2'].font = regular_font
-            ws['E3'].font = regular_font
-            ws['E4'].font = regular_font
-            
-            # Define border style
-            thin_border = Border(
-                left=Side(style='thin'),
-                right=Side(style='thin'),
-                top=Side(style='thin'),
-                bottom=Side(style='thin')
-            )
-
-            # Apply border to header cells
-            for cell in ['A1', 'B1', 'C1', 'D1', 'E1']:
-                ws[cell].border = thin_border
-
-            # Write data to Excel
-            row_index = 2  # Start writing data from the second row
-            for record in records:
-                # Convert date from YYYY-MM-DD to DD Month YYYY
-                tanggal_akta = record.tanggal_akta
-                if tanggal_akta:
-                    tanggal_akta = datetime.datetime.strptime(tanggal_akta, "%d %B %Y").strftime("%d %B %Y")
-                else:
-                    tanggal_akta = ''
-
-                ws.merge_cells(start_row=row_index, start_column=1, end_row=row_index + 3, end_column=1)
-                detail_cell = ws.cell(row=row_index, column=1)
-                detail_cell.value = (record.nomor_urut)
-                for i in range(row_index, row_index + 4):  # iterasi melalui baris untuk menambahkan border ke setiap sel dalam kolom
-                    ws.cell(row=i, column=1).border = thin_border
-                
-                ws.merge_cells(start_row=row_index, start_column=2, end_row=row_index + 3, end_column=2)
-                detail_cell = ws.cell(row=row_index, column=2)
-                detail_cell.value = (record.nomor_akta)
-                for i in range(row_index, row_index + 4):  # iterasi melalui baris untuk menambahkan border ke setiap sel dalam kolom
-                    ws.cell(row=i, column=2).border = thin_border
-
-                ws.merge_cells(start_row=row_index, start_column=3, end_row=row_index + 3, end_column=3)
-                detail_cell = ws.cell(row=row_index, column=3)
-                detail_cell.value = (record.tanggal_akta)
-                for i in range(row_index, row_index + 4):  # iterasi melalui baris untuk menambahkan border ke setiap sel dalam kolom
-                    ws.cell(row=i, column=3).border = thin_border
-
-                ws.merge_cells(start_row=row_index, start_column=4, end_row=row_index + 3, end_column=4)
-                detail_cell = ws.cell(row=row_index, column=4)
-                detail_cell.value = (record.sifat_akta)
-                for i in range(row_index, row_index + 4):  # iterasi melalui baris untuk menambahkan border ke setiap sel dalam kolom
-                    ws.cell(row=i, column=4).border = thin_border
-                
-
-                # ws.cell(row=row_index, column=2, value=record.nomor_akta).border = thin_border
-                # ws.cell(row=row_index, column=3, value=record.tanggal_akta).border = thin_border
-                # ws.cell(row=row_index, column=4, value=record.sifat_akta).border = thin_border
-                
-                # Merge cells for the detailed information
-                ws.merge_cells(start_row=row_index, start_column=5, end_row=row_index + 3, end_column=5)
-                detail_cell = ws.cell(row=row_index, column=5)
-                detail_cell.value = (
-                    f"- {record.nama_perwakilan}\n"
-                    f"QQ.   A. {record.gelar}. {record.nama_debitur}\n"
-                    f"           B. PT. {record.perusahaan_finance}\n"
-                    f"                Berkedudukan di {record.alamat_perusahaan}"
-                )
-                detail_cell.alignment = Alignment(wrap_text=True, vertical="top")
-
-                # Apply border to the merged cell area
-                for row in range(row_index, row_index + 4):
-                    ws.cell(row=row, column=5).border = thin_border
-
-                # Move to the next set of rows
-                row_index += 4
-                
-            
-            # Save the workbook
+        self.download_window = tk.Toplevel(self.root)
+        self.download_window.title("Download Data")
+        self.download_window.geometry("300x200")
+
+        # The mode is a DOWNLOAD_MODES index, since a Tk variable cannot hold None
+        self.download_mode_var = tk.IntVar(value=0)
+        for index, (_, title) in enumerate(DOWNLOAD_MODES):
+            tk.Radiobutton(self.download_window, text=title, variable=self.download_mode_var, value=index).pack(anchor='w', padx=20, pady=(10 if index == 0 else 0, 0))
+        self.download_zip_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(self.download_window, text="Simpan sebagai ZIP", variable=self.download_zip_var).pack(anchor='w', padx=20, pady=10)
+        tk.Button(self.download_window, text="Download", command=self.start_download).pack(pady=10)
+
+    def start_download(self):
+        partition = DOWNLOAD_MODES[self.download_mode_var.get()][0]
+        archive = partition is not None and self.download_zip_var.get()
+        self.download_window.destroy()
+        if partition is None:
             file_path = filedialog.asksaveasfilename(defaultextension=".xlsx", filetypes=[("Excel files", "*.xlsx")])
-            if file_path:
-                wb.save(file_path)
+        elif archive:
+            file_path = filedialog.asksaveasfilename(defaultextension=".zip", filetypes=[("ZIP files", "*.zip")])
+        else:
+            file_path = filedialog.askdirectory(title="Pilih folder tujuan")
+        if not file_path:
+            return
+
+        def done(exported):
+            if partition is None:
                 messagebox.showinfo("Berhasil", "Data Excel berhasil penyesuaian template dan disimpan!")
-        except Exception as e:
+            else:
+                messagebox.showinfo("Berhasil", f"{len(exported)} file Excel berhasil penyesuaian template dan disimpan di {file_path}!")
+            self.log(f"Data downloaded to: {file_path}", partition=partition, files=len(exported) if partition else 1)
+
+        def failed(e):
+            if isinstance(e, TaskCancelled):
+                self.log(f"Download to {file_path} cancelled")
+                return
             messagebox.showerror("Error", f"An error occurred: {e}")
-            self.log(f"Data downloaded to file: {file_path}")
-            
+            self.log(f"Error downloading data to {file_path}: {e}", level=logging.ERROR)
+
+        if partition is None:
+            # Records are streamed into a write-only workbook, so memory stays flat
+            export = lambda db_session, task: export_fidusia_workbook(db_session, file_path, progress=task.report)
+        else:
+            # Each workbook is rendered in a worker process; progress counts finished files
+            export = lambda db_session, task: export_partitioned(db_session, file_path, partition, archive, progress=task.report)
+        # The download includes pending sparse inserts and buffered edits once they are written
+        submit = lambda: self.tasks.submit("Download data", export, on_done=done, on_error=failed)
+        self.compact_now(on_compacted=lambda: self.flush_edits(on_saved=submit, on_failed=submit))
+
+    def on_search_typed(self, event):
+        # A newer keystroke cancels the query still waiting for the previous one
+        if self.search_after_id is not None:
+            self.root.after_cancel(self.search_after_id)
+            self.search_after_id = None
+        if self.search_entry.get() != self.view_filter.search_query:
+            self.search_after_id = self.root.after(SEARCH_DEBOUNCE_MS, self.filter_data)
+
+    def on_date_selected(self, event):
+        if self.date_filter_var.get():
+            self.filter_data()
+
+    def selected_date_range(self):
+        """(from, to) of the date filter, None when it is off; raises ValueError for a date that does not parse."""
+        if not self.date_filter_var.get():
+            return None
+        return self.date_from_entry.get_date(), self.date_to_entry.get_date()
+
     def filter_data(self):
+        if self.search_after_id is not None:
+            self.root.after_cancel(self.search_after_id)
+            self.search_after_id = None
         search_query = self.search_entry.get()
-        self.display_data(search_query)
+        try:
+            date_range = self.selected_date_range()
+        except ValueError:
+            messagebox.showerror("Error", "Tanggal tidak valid (DD/MM/YYYY).")
+            return
+        # Column conditions and the sort stay in effect until they are cleared
+        self.display_data(ViewFilter(search_query, date_range, self.view_filter.conditions, self.view_filter.sort))
+
+    def sort_by(self, name):
+        """Heading click: sort ascending, then descending, then back to the register order."""
+        current = self.view_filter.sort or ('nomor_urut', False)
+        if current[0] != name:
+            sort = (name, False)
+        elif not current[1]:
+            sort = (name, True)
+        else:
+            sort = None
+        view = self.view_filter
+        self.display_data(ViewFilter(view.search_query, view.date_range, view.conditions, sort))
+
+    def show_sort(self):
+        sort = self.view_filter.sort
+        for col, title in self.heading_titles.items():
+            sorted_here = sort is not None and FILTER_COLUMNS[col] == sort[0]
+            self.tree.heading(col, text=title + SORT_ARROWS[sort[1]] if sorted_here else title)
+
+    def column_title(self, name):
+        """Heading of the Treeview column of a Record column."""
+        return next(self.heading_titles[col] for col, column_name in FILTER_COLUMNS.items() if column_name == name)
+
+    def condition_text(self, value):
+        """A condition value as typed in the filter builder."""
+        if value is None:
+            return ''
+        if isinstance(value, datetime.date):
+            return value.strftime('%d/%m/%Y')
+        return str(value)
+
+    def describe_condition(self, name, operator, value):
+        title = self.column_title(name)
+        if operator == 'range':
+            low, high = (self.condition_text(bound) or '...' for bound in value)
+            return f"{title} {low} s/d {high}"
+        return f"{title} {FILTER_OPERATOR_TITLES[operator]} {self.condition_text(value) or '(kosong)'}"
+
+    def show_filters(self):
+        if not self.view_filter.conditions:
+            self.filter_frame.pack_forget()
+            return
+        self.filter_label.config(text=", ".join(self.describe_condition(*condition) for condition in self.view_filter.conditions))
+        self.filter_frame.pack(side='left', padx=10)
+
+    def clear_filters(self):
+        view = self.view_filter
+        self.display_data(ViewFilter(view.search_query, view.date_range, sort=view.sort))
+
+    def open_filter_window(self):
+        if getattr(self, 'filter_window', None) is not None and self.filter_window.winfo_exists():
+            self.filter_window.lift()
+            return
+        self.filter_window = tk.Toplevel(self.root)
+        self.filter_window.title("Filter")
+        self.filter_window.geometry("700x300")
+
+        tk.Label(self.filter_window, text="Semua kondisi harus cocok. Awalan membedakan huruf besar/kecil; tanggal DD/MM/YYYY.").pack(anchor='w', padx=10, pady=5)
+        self.filter_rows_frame = tk.Frame(self.filter_window)
+        self.filter_rows_frame.pack(fill='both', expand=True, padx=10)
+        self.filter_rows = []
+        for name, operator, value in self.view_filter.conditions:
+            low, high = value if operator == 'range' else (value, None)
+            self.add_filter_row(name, operator, self.condition_text(low), self.condition_text(high))
+        if not self.filter_rows:
+            self.add_filter_row()
+
+        button_frame = tk.Frame(self.filter_window)
+        button_frame.pack(fill='x', pady=5)
+        tk.Button(button_frame, text="Tambah kondisi", command=self.add_filter_row).pack(side='left', padx=10)
+        tk.Button(button_frame, text="Terapkan", command=self.apply_filter_window).pack(side='right', padx=10)
+
+    def add_filter_row(self, name='perusahaan_finance', operator='equals', value='', value_to=''):
+        row = tk.Frame(self.filter_rows_frame)
+        row.pack(fill='x', pady=2)
+        titles = {self.heading_titles[col]: column_name for col, column_name in FILTER_COLUMNS.items()}
+        column_box = ttk.Combobox(row, values=list(titles), state='readonly', width=20)
+        column_box.set(self.column_title(name))
+        column_box.pack(side='left')
+        operator_box = ttk.Combobox(row, values=list(FILTER_OPERATOR_TITLES.values()), state='readonly', width=12)
+        operator_box.set(FILTER_OPERATOR_TITLES[operator])
+        operator_box.pack(side='left', padx=5)
+        value_entry = tk.Entry(row, width=25)
+        value_entry.insert(0, value)
+        value_entry.pack(side='left')
+        tk.Label(row, text="s/d").pack(side='left', padx=5)
+        value_to_entry = tk.Entry(row, width=25)
+        value_to_entry.insert(0, value_to)
+        value_to_entry.pack(side='left')
+        entry = (row, titles, column_box, operator_box, value_entry, value_to_entry)
+        tk.Button(row, text="Hapus", command=lambda: self.remove_filter_row(entry)).pack(side='left', padx=5)
+        self.filter_rows.append(entry)
+
+    def remove_filter_row(self, entry):
+        entry[0].destroy()
+        self.filter_rows.remove(entry)
+
+    def apply_filter_window(self):
+        operators = {title: operator for operator, title in FILTER_OPERATOR_TITLES.items()}
+        conditions = []
+        try:
+            for row, titles, column_box, operator_box, value_entry, value_to_entry in self.filter_rows:
+                # A row left blank is ignored
+                if not value_entry.get().strip() and not value_to_entry.get().strip():
+                    continue
+                conditions.append(filter_condition(
+                    titles[column_box.get()], operators[operator_box.get()], value_entry.get(), value_to_entry.get()
+                ))
+        except ValueError as e:
+            messagebox.showerror("Error", str(e), parent=self.filter_window)
+            return
+        self.filter_window.destroy()
+        view = self.view_filter
+        self.display_data(ViewFilter(view.search_query, view.date_range, conditions, view.sort))
+
+    def open_statistics_window(self):
+        if getattr(self, 'statistics_window', None) is not None and self.statistics_window.winfo_exists():
+            self.statistics_window.lift()
+            self.refresh_statistics()
+            return
+        self.statistics_window = tk.Toplevel(self.root)
+        self.statistics_window.title("Statistik")
+        self.statistics_window.geometry("500x500")
+
+        # One tab per record_counts dimension; double-clicking a row shows its records in the main window
+        notebook = ttk.Notebook(self.statistics_window)
+        notebook.pack(expand=True, fill='both', padx=10, pady=5)
+        self.statistics_trees = {}
+        self.statistics_values = {}
+        for dimension, title in STATISTICS_TABS:
+            frame = tk.Frame(notebook)
+            notebook.add(frame, text=title)
+            tree = ttk.Treeview(frame, columns=('Nilai', 'Jumlah Akta'), show='headings')
+            tree.heading('Nilai', text=title)
+            tree.heading('Jumlah Akta', text='Jumlah Akta')
+            tree.column('Nilai', width=300, anchor='w')
+            tree.column('Jumlah Akta', width=100, anchor='e')
+            scrollbar = ttk.Scrollbar(frame, orient='vertical', command=tree.yview)
+            scrollbar.pack(side='right', fill='y')
+            tree.configure(yscrollcommand=scrollbar.set)
+            tree.pack(expand=True, fill='both')
+            tree.bind('<Double-1>', lambda event, dimension=dimension: self.drill_down(dimension))
+            self.statistics_trees[dimension] = tree
+            self.statistics_values[dimension] = []
+
+        footer = tk.Frame(self.statistics_window)
+        footer.pack(fill='x', pady=5)
+        self.statistics_total_label = tk.Label(footer, text="")
+        self.statistics_total_label.pack(side='left', padx=10)
+        tk.Button(footer, text="Muat ulang", command=self.refresh_statistics).pack(side='right', padx=10)
+        tk.Label(self.statistics_window, text="Klik dua kali pada baris untuk menampilkan datanya.").pack(anchor='w', padx=10, pady=(0, 5))
+
+        self.refresh_statistics()
+
+    def refresh_statistics(self):
+        # The counts come from the record_counts summary table, so this is a few small reads
+        submit = lambda: self.tasks.submit(
+            "Memuat statistik",
+            lambda db_session, task: {dimension: fetch_record_counts(db_session, dimension) for dimension, _ in STATISTICS_TABS},
+            on_done=self.show_statistics,
+            on_error=lambda e: None if isinstance(e, TaskCancelled) else self.log(f"Error loading statistics: {e}", level=logging.ERROR)
+        )
+        self.flush_edits(on_saved=submit, on_failed=submit)
+
+    def show_statistics(self, counts):
+        if not self.statistics_window.winfo_exists():
+            return
+        for dimension, rows in counts.items():
+            tree = self.statistics_trees[dimension]
+            tree.delete(*tree.get_children())
+            self.statistics_values[dimension] = [value for value, _ in rows]
+            for index, (value, akta) in enumerate(rows):
+                tree.insert('', 'end', iid=index, values=(self.statistics_label(dimension, value), f"{akta:,}".replace(',', '.')))
+        total = sum(akta for _, akta in counts['perusahaan_finance'])
+        self.statistics_total_label.config(text=f"Total: {total:,} akta".replace(',', '.'))
+
+    def statistics_label(self, dimension, value):
+        if not value:
+            return "(kosong)"
+        if dimension == 'bulan':
+            year, month = map(int, value.split('-'))
+            return datetime.date(year, month, 1).strftime("%B %Y")
+        return value
+
+    def drill_down(self, dimension):
+        tree = self.statistics_trees[dimension]
+        item = tree.focus()
+        if not item:
+            return
+        view = record_count_view(dimension, self.statistics_values[dimension][int(item)])
+        view.sort = self.view_filter.sort
+        # The search box and date filter show what the main window is filtered on
+        self.search_entry.delete(0, 'end')
+        self.date_filter_var.set(view.date_range is not None)
+        if view.date_range is not None:
+            self.date_from_entry.set_date(view.date_range[0])
+            self.date_to_entry.set_date(view.date_range[1])
+        self.display_data(view)
+        self.log("Statistics drill-down", dimension=dimension, value=self.statistics_values[dimension][int(item)])
+
+    def build_search_index(self):
+        def step_done(complete):
+            if complete:
+                self.log("Search index is complete")
+            else:
+                self.root.after(SEARCH_INDEX_BUILD_DELAY_MS, self.build_search_index)
+
+        def step_failed(e):
+            if not isinstance(e, TaskCancelled):
+                self.log(f"Error building search index: {e}", level=logging.ERROR)
+
+        self.tasks.submit(
+            "Indeks pencarian",
+            lambda db_session, task: build_search_index_step(db_session),
+            writes=True,
+            on_done=step_done,
+            on_error=step_failed
+        )
 
     # Fungsi untuk menghapus semua data di database
     def delete_all_data(self):
         confirm = messagebox.askyesno("Konfirmasi", "Apakah Anda yakin ingin menghapus semua data?")
-        if confirm:
-            try:
-                session.query(Record).delete()
-                session.commit()
-                self.display_data()  # Refresh Treeview setelah penghapusan
-                messagebox.showinfo("Berhasil", "Semua data berhasil dihapus.")
-                self.log("All records deleted from the database.")
-            except Exception as e:
-                session.rollback()  # Rollback jika terjadi error
-                messagebox.showerror("Error", f"An error occurred: {e}")
-                self.log(f"Error deleting all data: {e}")
+        if not confirm:
+            return
+
+        def delete_all(db_session, task):
+            delete_all_records(db_session)
+            db_session.commit()
+
+        def done(result):
+            self.edits.discard()
+            self.show_unsaved_edits()
+            self.apply_changes(ChangeSet(cleared=True))  # Refresh Treeview setelah penghapusan
+            messagebox.showinfo("Berhasil", "Semua data berhasil dihapus.")
+            self.log("All records deleted from the database.")
+
+        def failed(e):
+            # Rolled back by the task runner
+            if isinstance(e, TaskCancelled):
+                return
+            messagebox.showerror("Error", f"An error occurred: {e}")
+            self.log(f"Error deleting all data: {e}", level=logging.ERROR)
+
+        self.flush_edits(
+            on_saved=lambda: self.tasks.submit("Hapus database", delete_all, writes=True, on_done=done, on_error=failed),
+            on_failed=lambda: self.edits_not_saved("hapus database")
+        )
 
         
 
 if __name__ == '__main__':
-    root = tk.Tk()
-    app = App(root)
-    root.mainloop()
+    # Lets the packaged app start the worker processes that parse uploaded workbooks
+    multiprocessing.freeze_support()
+    if sys.argv[1:2] == ['watch']:
+        # Headless mode: import workbooks dropped into an inbox folder (see watch.py).
+        # Nothing has touched the database yet, so watch.py opens the one given by --database.
+        from watch import main
+        main(sys.argv[2:])
+    else:
+        log_listener = setup_logging()
+        try:
+            # Setup SQLite Database; migration messages go to the log set up above
+            engine = open_database()
+            root = tk.Tk()
+            app = App(root, engine)
+            root.mainloop()
+        finally:
+            log_listener.stop()
@@ -0,0 +1,629 @@
+"""Benchmark suite for Aplikasi Olah Data.
+
+For every size a synthetic upload workbook with the real columns (number,
+created_time, name_debitur, gender_1, marital_1) is generated and cached in
+--data-dir. Import (single and multi-file), schema migration, search, paging,
+sorting, statistics, renumbering, bulk edit/delete, export and app startup are
+then timed against a fresh database. Each size appends one JSON line to
+--output and is compared with the previous run of the same size, so
+regressions show up between versions.
+
+Run with:  python benchmark.py [--sizes 1000 10000 100000 1000000] [--memory] [--logging] [--app dist/app.exe]
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from contextlib import closing
+
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+from sqlalchemy.exc import OperationalError
+
+import core
+from core import (
+    COUNT_DIMENSIONS, EXPORT_PROCESSES, IMPORT_PROCESSES, PAGE_SIZE, PRAGMA_PROFILES, SORT_COLUMNS, Record, Session,
+    EditBuffer, ViewFilter, compact_nomor_urut, delete_records, export_fidusia_workbook, export_partitioned, fetch_page_rows,
+    fetch_record_counts, fetch_records_page, import_dataframe, import_excel_stream, import_files, insert_record_at,
+    next_nomor_urut, open_database, percentile, read_record_rows, record_order, record_row_values, record_rows_select,
+    search_filter, set_sql_echo, setup_logging, update_records,
+)
+
+SIZES = (1000, 10000, 100000, 1000000)
+# Documented target for the bulk import path at 100k rows
+IMPORT_TARGET_ROWS_PER_SEC = 50000
+SEARCH_QUERIES = ('DEBITUR 4242', 'debitur 99', '77/FID', 'FINANCE')
+RENUMBER_INSERTS = 5
+# Single-record transactions timed per pragma profile
+SMALL_COMMITS = 200
+# Multi-file upload: number of workbooks, and the largest size it runs for (read_excel is slow)
+MULTI_FILE_COPIES = 4
+MULTI_FILE_MAX_ROWS = 100000
+# Records held in memory at once when measuring bytes per row of each read path
+READ_PATH_SAMPLE = 20000
+# Single-cell edits timed one transaction each and through the EditBuffer
+CELL_EDITS = 200
+# The app whose startup is timed, unless --app names a build; it gets this long to show its first page
+APP_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.py')
+STARTUP_TIMEOUT_SEC = 120
+# Share of the records edited, then deleted, by the bulk benchmark
+BULK_FRACTION = 0.1
+# A timing this much slower than the previous run of the same size is a regression
+REGRESSION_THRESHOLD = 0.2
+# ...and at least this many milliseconds slower, so jitter on tiny timings is not reported
+REGRESSION_MIN_MS = 5
+
+
+def make_sheet(rows, seed=0):
+    """Generate a synthetic partner sheet with the real upload columns."""
+    rng = np.random.default_rng(seed)
+    days = rng.integers(1, 29, rows)
+    months = rng.integers(1, 13, rows)
+    created_time = [f"{d:02d}/{m:02d}/2024 10:{d:02d}" if d % 2 else f"{d:02d}/{m:02d}/2024" for d, m in zip(days, months)]
+    return pd.DataFrame({
+        # Sheets with different seeds hold different akta, so they do not overlap on import
+        'number': [f"{i}/FID/{2024 + seed}" for i in range(1, rows + 1)],
+        'created_time': created_time,
+        'name_debitur': [f"DEBITUR {i}" for i in range(1, rows + 1)],
+        'gender_1': rng.choice(['male', 'female'], rows),
+        'marital_1': rng.choice(['single', 'married'], rows),
+    })
+
+
+def write_sheet(path, df):
+    """Save a synthetic sheet as .xlsx (write-only, so large sheets stay cheap)."""
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append(list(df.columns))
+    for row in df.itertuples(index=False):
+        ws.append(list(row))
+    wb.save(path)
+
+
+def sheet_workbook(data_dir, rows, seed=0):
+    """Path of the generated workbook for a size, written on first use."""
+    os.makedirs(data_dir, exist_ok=True)
+    path = os.path.join(data_dir, f"sheet_{rows}_{seed}.xlsx")
+    if not os.path.exists(path):
+        write_sheet(path, make_sheet(rows, seed))
+    return path
+
+
+def temporary_session(directory, name='bench.db', profile='tuned'):
+    engine = open_database(f"sqlite:///{os.path.join(directory, name)}", profile)
+    return Session(bind=engine)
+
+
+def timed(func, *args, **kwargs):
+    """(result, seconds) of one call."""
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def traced_bytes(func, *args, **kwargs):
+    """Traced Python memory still held by the result of one call, in bytes."""
+    tracemalloc.start()
+    try:
+        result = func(*args, **kwargs)
+        held = tracemalloc.get_traced_memory()[0]
+        del result
+        return held
+    finally:
+        tracemalloc.stop()
+
+
+def traced_peak_mb(func, *args, **kwargs):
+    """Peak traced Python memory of one call in MB. Tracing slows the call down, so it gets its own pass."""
+    tracemalloc.start()
+    try:
+        func(*args, **kwargs)
+        return tracemalloc.get_traced_memory()[1] / 2 ** 20
+    finally:
+        tracemalloc.stop()
+
+
+def peak_rss_bytes():
+    """Peak resident set size of this process so far, in bytes."""
+    if sys.platform == 'win32':
+        import ctypes
+        from ctypes import wintypes
+
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD)] + [
+                (name, ctypes.c_size_t) for name in (
+                    'PeakWorkingSetSize', 'WorkingSetSize', 'QuotaPeakPagedPoolUsage', 'QuotaPagedPoolUsage',
+                    'QuotaPeakNonPagedPoolUsage', 'QuotaNonPagedPoolUsage', 'PagefileUsage', 'PeakPagefileUsage',
+                )
+            ]
+
+        counters = ProcessMemoryCounters(cb=ctypes.sizeof(ProcessMemoryCounters))
+        ctypes.windll.psapi.GetProcessMemoryInfo(ctypes.windll.kernel32.GetCurrentProcess(), ctypes.byref(counters), counters.cb)
+        return counters.PeakWorkingSetSize
+    if sys.platform.startswith('linux'):
+        # ru_maxrss would include the parent's memory at fork; VmHWM covers only this process image
+        with open('/proc/self/status', encoding='ascii') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    import resource
+    # macOS reports bytes
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def export_peak_rss(database, path):
+    """Run in a child process by bench_export: export database to path, then print the peak RSS before and after as JSON."""
+    db_session = Session(bind=open_database(f"sqlite:///{database}"))
+    try:
+        before = peak_rss_bytes()
+        export_fidusia_workbook(db_session, path)
+    finally:
+        db_session.close()
+    print(json.dumps({'before': before, 'after': peak_rss_bytes()}))
+
+
+def import_sheet(db_session, df):
+    return import_dataframe(db_session, df, 1, 'PERWAKILAN', 'FINANCE', 'JAKARTA')
+
+
+def bench_import(db_session, rows):
+    """Bulk import of a generated sheet, then the same sheet again (every row skipped); returns metrics."""
+    df = make_sheet(rows)
+    _, elapsed = timed(import_sheet, db_session, df)
+    _, reimport = timed(import_sheet, db_session, df)
+    return {'import_s': elapsed, 'import_rows_per_s': rows / elapsed, 'reimport_s': reimport}
+
+
+def bench_import_stream(directory, workbook, memory=False):
+    """Streaming import of the workbook into its own database; returns metrics."""
+    def stream(name):
+        db_session = temporary_session(directory, name)
+        try:
+            import_excel_stream(db_session, workbook, 1, 'PERWAKILAN', 'FINANCE', 'JAKARTA')
+        finally:
+            db_session.close()
+
+    _, elapsed = timed(stream, 'stream.db')
+    metrics = {'import_stream_s': elapsed}
+    if memory:
+        metrics['import_stream_peak_mb'] = traced_peak_mb(stream, 'stream_traced.db')
+    return metrics
+
+
+def bench_import_files(directory, workbooks):
+    """Upload of several workbooks, parsed in one process vs. IMPORT_PROCESSES worker processes; returns metrics."""
+    metrics = {}
+    for mode, processes in (('serial', 1), ('parallel', IMPORT_PROCESSES)):
+        db_session = temporary_session(directory, f"files_{mode}.db")
+        try:
+            _, metrics[f'import_files_{mode}_s'] = timed(import_files, db_session, workbooks, 1, 'PERWAKILAN', 'FINANCE', 'JAKARTA', processes=processes)
+        finally:
+            db_session.close()
+    return metrics
+
+
+def search_while_importing(directory, name, profile, workbook, queries=SEARCH_QUERIES):
+    """Search from one thread while another streams a workbook in; returns (latencies ms, errors, import seconds)."""
+    reader = temporary_session(directory, name, profile)
+    writer = temporary_session(directory, name, profile)
+    elapsed = []
+
+    def stream():
+        start = time.perf_counter()
+        import_excel_stream(writer, workbook, 1, 'PERWAKILAN', 'FINANCE', 'JAKARTA')
+        elapsed.append(time.perf_counter() - start)
+
+    importer = threading.Thread(target=stream)
+    latencies, errors = [], 0
+    importer.start()
+    try:
+        while importer.is_alive():
+            for query in queries:
+                start = time.perf_counter()
+                try:
+                    fetch_records_page(reader, ViewFilter(query))
+                except OperationalError:
+                    # Locked out by the writer for longer than busy_timeout
+                    errors += 1
+                reader.rollback()
+                latencies.append((time.perf_counter() - start) * 1000)
+    finally:
+        importer.join()
+        reader.close()
+        writer.close()
+    return latencies, errors, elapsed[0] if elapsed else 0
+
+
+def bench_pragmas(directory, rows, workbook):
+    """Bulk import, single-record commits, and searching during a streaming import, for each PRAGMA_PROFILES entry; returns metrics."""
+    df = make_sheet(rows)
+    metrics = {}
+    for profile in PRAGMA_PROFILES:
+        name = f"pragmas_{profile}.db"
+        db_session = temporary_session(directory, name, profile)
+        try:
+            _, metrics[f'import_{profile}_s'] = timed(import_sheet, db_session, df)
+            # One record per transaction, like Input Data (appended, so no renumbering)
+            start = time.perf_counter()
+            for index in range(SMALL_COMMITS):
+                insert_record_at(db_session, next_nomor_urut(db_session), nomor_akta=f"INPUT {index}")
+                db_session.commit()
+            metrics[f'commit_{profile}_ms'] = (time.perf_counter() - start) * 1000 / SMALL_COMMITS
+        finally:
+            db_session.close()
+        latencies, errors, elapsed = search_while_importing(directory, name, profile, workbook)
+        latencies.sort()
+        metrics[f'stream_during_search_{profile}_s'] = elapsed
+        metrics[f'search_during_import_{profile}_p95_ms'] = percentile(latencies, 95) or 0
+        metrics[f'search_during_import_{profile}_max_ms'] = latencies[-1] if latencies else 0
+        metrics[f'search_during_import_{profile}_count'] = len(latencies)
+        metrics[f'search_during_import_{profile}_errors'] = errors
+    return metrics
+
+
+def bench_migrate(directory, name='bench.db'):
+    """Migrating the imported register back from the schema before MIGRATIONS, then the startup check of the up-to-date one; returns metrics."""
+    path = os.path.join(directory, name)
+    connection = sqlite3.connect(path)
+    try:
+        for index in ('ux_records_nomor_urut', 'ix_records_perusahaan_finance', 'ix_records_nama_perwakilan',
+                      'ix_records_nomor_akta', 'ix_records_nama_debitur', 'ix_records_perusahaan_finance_tanggal'):
+            connection.execute(f"DROP INDEX {index}")
+        connection.execute("CREATE INDEX ix_records_nomor_urut_id ON records (nomor_urut, id)")
+        connection.execute("PRAGMA user_version = 0")
+        connection.commit()
+    finally:
+        connection.close()
+    _, migrate = timed(open_database, f"sqlite:///{path}")
+    _, startup = timed(open_database, f"sqlite:///{path}")
+    return {'migrate_s': migrate, 'open_database_ms': startup * 1000}
+
+
+def bench_search(db_session, queries=SEARCH_QUERIES):
+    """Mean first-page search latency, FTS5 index vs. the LIKE scan, and the first page of a date range; returns metrics."""
+    fts_ms, like_ms = [], []
+    for query in queries:
+        _, elapsed = timed(fetch_records_page, db_session, ViewFilter(query))
+        fts_ms.append(elapsed * 1000)
+        _, elapsed = timed(lambda: db_session.query(Record).filter(search_filter(query)).order_by(*record_order()).limit(PAGE_SIZE).all())
+        like_ms.append(elapsed * 1000)
+    _, month = timed(fetch_records_page, db_session, ViewFilter(date_range=(datetime.date(2024, 3, 1), datetime.date(2024, 3, 31))))
+    _, year = timed(fetch_records_page, db_session, ViewFilter(date_range=(datetime.date(2024, 1, 1), datetime.date(2024, 12, 31))))
+    return {
+        'search_fts_ms': sum(fts_ms) / len(fts_ms),
+        'search_like_ms': sum(like_ms) / len(like_ms),
+        'date_range_month_ms': month * 1000,
+        'date_range_year_ms': year * 1000,
+    }
+
+
+def bench_sort(db_session):
+    """Mean first page sorted (descending) by each sortable column, a page halfway down the date order, and one
+    finance company by date; returns metrics."""
+    first_ms = []
+    for name in SORT_COLUMNS:
+        _, elapsed = timed(fetch_records_page, db_session, ViewFilter(sort=(name, True)))
+        first_ms.append(elapsed * 1000)
+    dated = db_session.query(Record.tanggal, Record.id).filter(Record.tanggal.isnot(None)).order_by(Record.tanggal, Record.id)
+    middle = dated.offset(dated.count() // 2).first()
+    _, deep = timed(fetch_records_page, db_session, ViewFilter(sort=('tanggal', False)), tuple(middle) if middle else None)
+    company = db_session.query(Record.perusahaan_finance).limit(1).scalar()
+    _, company_ms = timed(fetch_records_page, db_session, ViewFilter(conditions=[('perusahaan_finance', 'equals', company)], sort=('tanggal', True)))
+    return {'sort_first_ms': sum(first_ms) / len(first_ms), 'sort_deep_ms': deep * 1000, 'sort_filtered_ms': company_ms * 1000}
+
+
+def bench_statistics(db_session):
+    """Every statistics tab from record_counts, against the same counts with GROUP BY over the register; returns metrics."""
+    _, summary = timed(lambda: [fetch_record_counts(db_session, dimension) for dimension in COUNT_DIMENSIONS])
+    connection = db_session.connection()
+    _, group_by = timed(lambda: [
+        connection.exec_driver_sql(f"SELECT COALESCE({expression.format(row='')}, ''), COUNT(*) FROM records GROUP BY 1").all()
+        for expression in COUNT_DIMENSIONS.values()
+    ])
+    return {'statistics_ms': summary * 1000, 'statistics_group_by_ms': group_by * 1000}
+
+
+def bench_pages(db_session):
+    """First page and the last page of the register (keyset pagination), and the first page again from the query cache; returns metrics."""
+    _, first = timed(fetch_page_rows, db_session)
+    _, cached = timed(fetch_page_rows, db_session)
+    order = record_order()
+    after = db_session.query(*order).order_by(*(column.desc() for column in order)).offset(PAGE_SIZE).first()
+    _, last = timed(fetch_page_rows, db_session, None, tuple(after) if after else None)
+    return {'page_first_ms': first * 1000, 'page_last_ms': last * 1000, 'page_cached_ms': cached * 1000}
+
+
+def bench_read_path(db_session, sample=READ_PATH_SAMPLE):
+    """Every record read as ORM instances and as RecordRow tuples (both turned into Treeview values), the memory
+    per row of each when held, and of a cached page; returns metrics."""
+    order = (Record.nomor_urut, Record.id)
+
+    def read_orm():
+        for record in db_session.query(Record).order_by(*order).yield_per(core.EXPORT_YIELD_PER):
+            record_row_values(record)
+        db_session.expunge_all()
+
+    def read_rows():
+        for row in read_record_rows(db_session, record_rows_select().order_by(*order), core.EXPORT_YIELD_PER):
+            record_row_values(row)
+
+    count = db_session.query(Record).count()
+    _, orm = timed(read_orm)
+    _, rows = timed(read_rows)
+    held = min(count, sample)
+    orm_bytes = traced_bytes(lambda: db_session.query(Record).order_by(*order).limit(held).all())
+    db_session.expunge_all()
+    row_bytes = traced_bytes(lambda: list(read_record_rows(db_session, record_rows_select().order_by(*order).limit(held))))
+    page = fetch_page_rows(db_session)
+    return {
+        'read_orm_rows_per_s': count / orm,
+        'read_rows_per_s': count / rows,
+        'read_orm_bytes_per_row': orm_bytes / max(held, 1),
+        'read_rows_bytes_per_row': row_bytes / max(held, 1),
+        'cached_page_bytes_per_row': core._rows_size(page) / max(len(page), 1),
+    }
+
+
+def bench_renumber(db_session, inserts=RENUMBER_INSERTS):
+    """Insert records near the top of the register, shifting and sparse; returns metrics."""
+    metrics = {}
+    try:
+        for sparse in (False, True):
+            core.SPARSE_ORDERING = sparse
+            mode = 'sparse' if sparse else 'shift'
+            start = time.perf_counter()
+            for index in range(inserts):
+                insert_record_at(db_session, 10 + index, nomor_akta=f"SISIPAN {mode} {index}")
+                db_session.commit()
+            metrics[f'insert_{mode}_ms'] = (time.perf_counter() - start) * 1000 / inserts
+            _, elapsed = timed(compact_nomor_urut, db_session)
+            db_session.commit()
+            metrics[f'compact_{mode}_ms'] = elapsed * 1000
+    finally:
+        core.SPARSE_ORDERING = False
+    return metrics
+
+
+def bench_export(db_session, directory, memory=False):
+    """Streaming fidusia export; returns metrics.
+
+    With memory the export runs again in a fresh process, whose peak RSS (the
+    memory the user sees) is reported, together with its growth during the export.
+    """
+    path = os.path.join(directory, 'export.xlsx')
+    _, elapsed = timed(export_fidusia_workbook, db_session, path)
+    metrics = {'export_s': elapsed, 'export_file_mb': os.path.getsize(path) / 2 ** 20}
+    if memory:
+        script = f"import benchmark; benchmark.export_peak_rss({db_session.get_bind().url.database!r}, {path!r})"
+        env = {**os.environ, 'PYTHONPATH': os.path.dirname(os.path.abspath(__file__))}
+        result = subprocess.run([sys.executable, '-c', script], env=env, capture_output=True, text=True, check=True)
+        peak = json.loads(result.stdout.splitlines()[-1])
+        metrics['export_peak_rss_mb'] = peak['after'] / 2 ** 20
+        metrics['export_rss_growth_mb'] = (peak['after'] - peak['before']) / 2 ** 20
+    return metrics
+
+
+def bench_export_sharded(db_session, directory):
+    """One workbook per month, rendered in one process vs. EXPORT_PROCESSES worker processes (zipped); returns metrics."""
+    metrics = {}
+    for mode, processes in (('serial', 1), ('parallel', EXPORT_PROCESSES)):
+        path = os.path.join(directory, f"export_{mode}.zip")
+        _, metrics[f'export_sharded_{mode}_s'] = timed(export_partitioned, db_session, path, 'bulan', archive=True, processes=processes)
+    return metrics
+
+
+def bench_cell_edits(db_session, directory, edits=CELL_EDITS):
+    """Mean time per cell edit, committed one by one and written behind through a journaled EditBuffer; returns metrics."""
+    ids = [record_id for record_id, in db_session.query(Record.id).order_by(Record.id).limit(edits)]
+    _, single = timed(lambda: [update_records(db_session, [record_id], 'nama_debitur', f"EDIT {record_id}") for record_id in ids])
+    buffer = EditBuffer(os.path.join(directory, 'bench.db.edits.jsonl'))
+
+    def buffered():
+        for record_id in ids:
+            buffer.add(record_id, 'nama_debitur', f"BUFFER {record_id}")
+            if buffer.full():
+                buffer.apply(db_session)
+        buffer.apply(db_session)
+
+    try:
+        _, behind = timed(buffered)
+    finally:
+        buffer.close()
+    count = max(len(ids), 1)
+    return {'cell_edit_ms': single * 1000 / count, 'cell_edit_buffered_ms': behind * 1000 / count}
+
+
+def bench_bulk(db_session, fraction=BULK_FRACTION):
+    """Bulk edit, then bulk delete, of every n-th record; returns metrics."""
+    ids = [record_id for record_id, in db_session.query(Record.id).order_by(Record.id)]
+    selected = ids[::max(round(1 / fraction), 1)]
+    _, edit = timed(update_records, db_session, selected, 'nama_perwakilan', 'PERWAKILAN BARU')
+    _, delete = timed(delete_records, db_session, selected)
+    return {'bulk_edit_s': edit, 'delete_s': delete}
+
+
+def bench_logging(directory, rows):
+    """Import time without logging, with the JSON log, and with SQL echo on; returns metrics."""
+    df = make_sheet(rows)
+    metrics = {}
+    listener = None
+    try:
+        for mode in ('none', 'json', 'sql_echo'):
+            if listener is None and mode != 'none':
+                listener = setup_logging(os.path.join(directory, 'log.txt'))
+            set_sql_echo(mode == 'sql_echo')
+            db_session = temporary_session(directory, f"logging_{mode}.db")
+            _, metrics[f'import_log_{mode}_s'] = timed(import_sheet, db_session, df)
+            db_session.close()
+    finally:
+        set_sql_echo(False)
+        if listener is not None:
+            listener.stop()
+            for named_logger in (core.logger, core.sql_logger):
+                named_logger.handlers.clear()
+    return metrics
+
+
+def bench_startup(directory, app_command=None):
+    """Startup of the app on a copy of the benchmark database; returns metrics.
+
+    The wall time of importing app.py is always measured. Launch to first paint and to first page need a display: the app
+    (or the build in app_command) reports them through STARTUP_REPORT_ENV.
+    """
+    startup_dir = os.path.join(directory, 'startup')
+    os.makedirs(startup_dir, exist_ok=True)
+    # The app opens database.db in its working directory
+    with closing(sqlite3.connect(os.path.join(directory, 'bench.db'))) as source, \
+            closing(sqlite3.connect(os.path.join(startup_dir, 'database.db'))) as target:
+        source.backup(target)
+    env = {**os.environ, 'PYTHONPATH': os.path.dirname(APP_SCRIPT)}
+    _, imported = timed(subprocess.run, [sys.executable, '-c', 'import app'], cwd=startup_dir, env=env, check=True, timeout=STARTUP_TIMEOUT_SEC)
+    metrics = {'startup_import_ms': imported * 1000}
+
+    report_path = os.path.join(startup_dir, 'startup.json')
+    launched = time.time()
+    try:
+        subprocess.run(
+            app_command or [sys.executable, APP_SCRIPT], cwd=startup_dir, env={**env, 'OLAHDATA_STARTUP_REPORT': report_path},
+            capture_output=True, timeout=STARTUP_TIMEOUT_SEC
+        )
+    except subprocess.TimeoutExpired:
+        return metrics
+    if not os.path.exists(report_path):
+        # No display to open the window on
+        return metrics
+    with open(report_path, encoding='utf-8') as report_file:
+        startup = json.load(report_file)
+    metrics['startup_first_paint_ms'] = (startup['first_paint_at'] - launched) * 1000
+    metrics['startup_first_page_ms'] = (startup['first_page_at'] - launched) * 1000
+    return metrics
+
+
+def run_size(rows, data_dir, memory=False, logging=False, app_command=None):
+    """Every benchmark for one size; returns {metric: value}."""
+    workbook = sheet_workbook(data_dir, rows)
+    metrics = {}
+    with tempfile.TemporaryDirectory() as directory:
+        db_session = temporary_session(directory)
+        try:
+            metrics.update(bench_import(db_session, rows))
+            metrics.update(bench_migrate(directory))
+            metrics.update(bench_import_stream(directory, workbook, memory))
+            if rows <= MULTI_FILE_MAX_ROWS:
+                workbooks = [sheet_workbook(data_dir, rows, seed) for seed in range(MULTI_FILE_COPIES)]
+                metrics.update(bench_import_files(directory, workbooks))
+            metrics.update(bench_search(db_session))
+            metrics.update(bench_pages(db_session))
+            metrics.update(bench_sort(db_session))
+            metrics.update(bench_read_path(db_session))
+            metrics.update(bench_statistics(db_session))
+            metrics.update(bench_renumber(db_session))
+            metrics.update(bench_export(db_session, directory, memory))
+            metrics.update(bench_export_sharded(db_session, directory))
+            metrics.update(bench_cell_edits(db_session, directory))
+            metrics.update(bench_bulk(db_session))
+            metrics.update(bench_startup(directory, app_command))
+        finally:
+            db_session.close()
+        # A second workbook, so the streaming import writes new rows next to the first one's
+        metrics.update(bench_pragmas(directory, rows, sheet_workbook(data_dir, rows, 1)))
+        if logging:
+            metrics.update(bench_logging(directory, rows))
+    return metrics
+
+
+def code_version():
+    """Short git commit of the checkout, or None outside one."""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def previous_results(path):
+    """Latest saved result per size from the results file."""
+    previous = {}
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as results_file:
+            for line in results_file:
+                if line.strip():
+                    result = json.loads(line)
+                    previous[result['rows']] = result
+    return previous
+
+
+def timing_ms(name, value):
+    """A timing metric in milliseconds, or None for rates and sizes."""
+    if name.endswith('_ms'):
+        return value
+    if name.endswith('_s'):
+        return value * 1000
+    return None
+
+
+def report(result, previous, threshold=REGRESSION_THRESHOLD):
+    """Print a result next to the previous run of its size; returns the names of regressed timings."""
+    rows = result['rows']
+    regressions = []
+    print(f"\n{rows:,} rows" + (f"  (vs {previous.get('commit') or previous['timestamp']})" if previous else ""))
+    for name, value in result['metrics'].items():
+        line = f"  {name:<38} {value:14,.3f}"
+        before = previous['metrics'].get(name) if previous else None
+        if before:
+            change = value / before - 1
+            line += f"  {change * 100:+7.1f} %"
+            slower_ms = (timing_ms(name, value) or 0) - (timing_ms(name, before) or 0)
+            if timing_ms(name, value) is not None and change > threshold and slower_ms >= REGRESSION_MIN_MS:
+                line += "  REGRESSION"
+                regressions.append(name)
+        print(line)
+    if rows >= 100000:
+        rate = result['metrics']['import_rows_per_s']
+        status = 'OK' if rate >= IMPORT_TARGET_ROWS_PER_SEC else 'BELOW TARGET'
+        print(f"  import target {IMPORT_TARGET_ROWS_PER_SEC:,} rows/s: {status}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(SIZES), help="numbers of rows to benchmark")
+    parser.add_argument('--data-dir', default='benchmark_data', help="where the generated workbooks are cached")
+    parser.add_argument('--output', default='benchmark_results.jsonl', help="JSON-lines file the results are appended to")
+    parser.add_argument('--memory', action='store_true', help="also measure peak memory of the streaming import (traced) and export (RSS)")
+    parser.add_argument('--logging', action='store_true', help="also measure the logging overhead of an import")
+    parser.add_argument('--app', help="built app (e.g. dist/app.exe) to time the startup of, instead of python app.py")
+    args = parser.parse_args()
+
+    previous = previous_results(args.output)
+    regressions = []
+    for rows in args.sizes:
+        metrics = run_size(rows, args.data_dir, args.memory, args.logging, [args.app] if args.app else None)
+        result = {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'commit': code_version(),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'rows': rows,
+            'metrics': {name: round(value, 3) for name, value in metrics.items()},
+        }
+        regressions += [f"{rows}:{name}" for name in report(result, previous.get(rows))]
+        with open(args.output, 'a', encoding='utf-8') as results_file:
+            results_file.write(json.dumps(result) + '\n')
+
+    if regressions:
+        print(f"\nRegressions (more than {REGRESSION_THRESHOLD:.0%} slower): {', '.join(regressions)}")
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
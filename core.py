@@ -0,0 +1,2549 @@
+"""Data layer and business logic of Aplikasi Olah Data.
+
+Everything here works without Tk, so it can be imported by benchmark.py or
+scripts: the database model, import, search, renumbering, bulk edits, the
+fidusia export, logging, instrumentation and the background task runner.
+"""
+import bisect
+import cProfile
+import datetime
+import functools
+import hashlib
+import heapq
+import io
+import json
+import logging
+import math
+import os
+import pstats
+import queue
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import weakref
+import zipfile
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from contextlib import closing, contextmanager
+from itertools import islice, repeat
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, TimedRotatingFileHandler
+
+# numpy, pandas and openpyxl are imported by the upload and download functions
+# that use them, so the app window does not wait for them at startup
+from sqlalchemy import bindparam, create_engine, event, inspect, select, text, update, column, tuple_, Column, Date, Float, Index, Integer, LargeBinary, String, func
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import declarative_base, scoped_session, sessionmaker
+
+# Logging: records are put on a queue and written as JSON lines by a listener
+# thread (see setup_logging), so logging never waits for the disk. The log
+# rotates by size, or by time when LOG_ROTATE_WHEN is set (e.g. 'midnight').
+LOG_FILE_PATH = 'log.txt'
+LOG_LEVEL = os.environ.get('OLAHDATA_LOG_LEVEL', 'INFO')
+LOG_MAX_BYTES = 5 * 1024 * 1024
+LOG_BACKUP_COUNT = 5
+LOG_ROTATE_WHEN = None
+# SQL statements are only logged while SQL echo is on; switch it with set_sql_echo
+SQL_ECHO = os.environ.get('OLAHDATA_SQL_ECHO') == '1'
+
+logger = logging.getLogger('olahdata')
+sql_logger = logging.getLogger('sqlalchemy.engine')
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """One JSON object per record; fields passed as extra={'fields': {...}} are added to it."""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        entry.update(getattr(record, 'fields', {}))
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def setup_logging(path=LOG_FILE_PATH, level=LOG_LEVEL, when=LOG_ROTATE_WHEN):
+    """Send the app and SQL loggers through a queue to a rotating JSON-lines file.
+
+    Returns the started QueueListener; stop() it on exit to flush the queue.
+    """
+    if when:
+        file_handler = TimedRotatingFileHandler(path, when=when, backupCount=LOG_BACKUP_COUNT, encoding='utf-8')
+    else:
+        file_handler = RotatingFileHandler(path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8')
+    file_handler.setFormatter(JsonLinesFormatter())
+
+    log_queue = queue.SimpleQueue()
+    for named_logger in (logger, sql_logger):
+        named_logger.addHandler(QueueHandler(log_queue))
+        named_logger.propagate = False
+    logger.setLevel(level)
+    set_sql_echo(SQL_ECHO)
+
+    listener = QueueListener(log_queue, file_handler)
+    listener.start()
+    return listener
+
+
+def set_sql_echo(enabled):
+    """Switch logging of SQL statements on or off; applies from the next transaction."""
+    sql_logger.setLevel(logging.INFO if enabled else logging.WARNING)
+
+
+def sql_echo_enabled():
+    return sql_logger.isEnabledFor(logging.INFO)
+
+
+# Instrumentation: timing spans of App operations with the SQL they ran
+PERF_HISTORY = 500
+PERF_SLOWEST_QUERIES = 5
+PERF_STATEMENT_CHARS = 300
+PERF_PROFILE_LINES = 40
+
+
+def percentile(sorted_values, q):
+    """Nearest-rank q-th percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(math.ceil(q / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+class PerformanceMonitor:
+    """Records how long App operations take and which SQL they run.
+
+    span() times a block on the current thread. The cursor listeners added by
+    install() charge every statement (latency and rows affected) to the spans
+    open on the thread that ran it. The last PERF_HISTORY spans are kept.
+    While profiling is on, each outermost span also runs under cProfile and
+    the stats are merged, which works for the worker threads as well.
+    """
+
+    def __init__(self, history=PERF_HISTORY):
+        self.lock = threading.Lock()
+        self.spans = deque(maxlen=history)
+        self.local = threading.local()
+        self.profiling = False
+        self.profile_stats = None
+
+    def _open_spans(self):
+        if not hasattr(self.local, 'spans'):
+            self.local.spans = []
+        return self.local.spans
+
+    @contextmanager
+    def span(self, name, **fields):
+        open_spans = self._open_spans()
+        current = {
+            'name': name,
+            'started': datetime.datetime.now().isoformat(timespec='milliseconds'),
+            'thread': threading.current_thread().name,
+            'status': 'ok',
+            'statements': 0,
+            'sql_ms': 0.0,
+            'rows': 0,
+            'slowest': [],
+            **fields,
+        }
+        profiler = None
+        if self.profiling and not open_spans:
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # Another profiler (e.g. a debugger) is active on this thread
+                profiler = None
+        open_spans.append(current)
+        started = time.perf_counter()
+        try:
+            yield current
+        except TaskCancelled:
+            current['status'] = 'cancelled'
+            raise
+        except Exception:
+            current['status'] = 'error'
+            raise
+        finally:
+            current['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 2)
+            current['sql_ms'] = round(current['sql_ms'], 2)
+            current['slowest'] = [
+                {'ms': round(ms, 2), 'rows': rows, 'statement': statement}
+                for ms, number, rows, statement in sorted(current['slowest'], reverse=True)
+            ]
+            open_spans.pop()
+            if profiler is not None:
+                profiler.disable()
+                with self.lock:
+                    if self.profile_stats is None:
+                        self.profile_stats = pstats.Stats(profiler)
+                    else:
+                        self.profile_stats.add(profiler)
+            with self.lock:
+                self.spans.append(current)
+
+    def timed(self, name):
+        """Decorator running a function inside span(name)."""
+        def decorate(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def install(self, bind):
+        event.listen(bind, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(bind, 'after_cursor_execute', self._after_cursor_execute)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info['perf_started'] = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed_ms = (time.perf_counter() - conn.info.pop('perf_started', time.perf_counter())) * 1000
+        open_spans = self._open_spans()
+        if not open_spans:
+            return
+        # SQLite reports -1 for SELECT; executemany reports the total over all parameter sets
+        rows = cursor.rowcount if cursor.rowcount >= 0 else None
+        statement = ' '.join(statement.split())[:PERF_STATEMENT_CHARS]
+        for current in open_spans:
+            current['statements'] += 1
+            current['sql_ms'] += elapsed_ms
+            current['rows'] += rows or 0
+            # Min-heap on latency holding the slowest statements so far; the
+            # statement number breaks ties so rows/None are never compared
+            slow = (elapsed_ms, current['statements'], rows, statement)
+            if len(current['slowest']) < PERF_SLOWEST_QUERIES:
+                heapq.heappush(current['slowest'], slow)
+            elif elapsed_ms > current['slowest'][0][0]:
+                heapq.heapreplace(current['slowest'], slow)
+
+    def recent(self):
+        """Finished spans, newest first."""
+        with self.lock:
+            return list(reversed(self.spans))
+
+    def summary(self):
+        """Per operation: count and p50/p95/max duration in ms, highest p95 first."""
+        durations = {}
+        for current in self.recent():
+            durations.setdefault(current['name'], []).append(current['elapsed_ms'])
+        rows = []
+        for name, values in durations.items():
+            values.sort()
+            rows.append({'name': name, 'count': len(values), 'p50_ms': percentile(values, 50), 'p95_ms': percentile(values, 95), 'max_ms': values[-1]})
+        return sorted(rows, key=lambda row: row['p95_ms'], reverse=True)
+
+    def profile_report(self, limit=PERF_PROFILE_LINES):
+        """Merged cProfile stats by cumulative time, as text ('' when nothing was profiled)."""
+        with self.lock:
+            if self.profile_stats is None:
+                return ''
+            output = io.StringIO()
+            self.profile_stats.stream = output
+            self.profile_stats.sort_stats('cumulative').print_stats(limit)
+        return output.getvalue()
+
+    def export(self, path):
+        """Write the summary, recent operations and profile to a JSON file for a bug report."""
+        report = {
+            'exported': datetime.datetime.now().isoformat(timespec='seconds'),
+            'summary': self.summary(),
+            'operations': self.recent(),
+            'profile': self.profile_report(),
+        }
+        with open(path, 'w', encoding='utf-8') as report_file:
+            json.dump(report, report_file, ensure_ascii=False, indent=2, default=str)
+
+
+perf = PerformanceMonitor()
+
+# SQLite database; open_database() creates the engine and binds Session to it
+DATABASE_URI = 'sqlite:///database.db'
+Session = sessionmaker()
+# Every thread (the Tk main loop and each task worker) gets its own session from
+# thread_session; thread_session.remove() closes the calling thread's session
+thread_session = scoped_session(Session)
+
+# Pragmas applied to every new connection. 'tuned' uses the write-ahead log,
+# so readers keep working while the writer thread imports, and synchronous=NORMAL,
+# which in WAL mode only risks the last commits on a power cut, never corruption.
+# 'sqlite' restores the SQLite defaults (e.g. for a database on a network share,
+# where WAL does not work). Values are KiB for cache_size (negative) and bytes
+# for mmap_size.
+PRAGMA_PROFILES = {
+    'tuned': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -64 * 1024,
+        'mmap_size': 256 * 1024 * 1024,
+        'temp_store': 'MEMORY',
+        'busy_timeout': 10000,
+    },
+    'sqlite': {
+        'journal_mode': 'DELETE',
+        'synchronous': 'FULL',
+        'cache_size': -2000,
+        'mmap_size': 0,
+        'temp_store': 'DEFAULT',
+        'busy_timeout': 5000,
+    },
+}
+PRAGMA_PROFILE = os.environ.get('OLAHDATA_PRAGMA_PROFILE', 'tuned')
+
+
+def apply_pragmas(dbapi_connection, pragmas):
+    """Run PRAGMA name = value on a new DB-API connection for each setting."""
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+    finally:
+        cursor.close()
+
+
+Base = declarative_base()
+
+
+# Define the database model
+class Record(Base):
+    __tablename__ = 'records'
+    
+    id = Column(Integer, primary_key=True)
+    nomor_urut = Column(Integer, nullable=False)
+    nomor_akta = Column(String)
+    # The akta date. tanggal_akta only keeps text that is not a date (e.g. '' for
+    # an empty cell) and is NULL otherwise; format_tanggal_akta shows either
+    tanggal = Column(Date)
+    tanggal_akta = Column(String)
+    sifat_akta = Column(String)
+    nama_debitur = Column(String)
+    gender = Column(String)
+    status = Column(String)
+    nama_perwakilan = Column(String)
+    perusahaan_finance = Column(String)
+    alamat_perusahaan = Column(String)
+    gelar = Column(String)
+    # Ordering key; equal to nomor_urut except for rows inserted in sparse mode
+    # that are still waiting for compact_nomor_urut (see SPARSE_ORDERING)
+    urutan = Column(Float)
+    # row_fingerprint of an imported row, so a re-import updates it instead of adding it again.
+    # NULL for records entered by hand and for duplicates that predate the column
+    fingerprint = Column(LargeBinary)
+
+    # Back ORDER BY nomor_urut / urutan and the keyset pagination of the virtual list
+    # (a unique nomor_urut also orders by (nomor_urut, id)), filtering by finance
+    # company or representative, and sorting by the SORT_COLUMNS, which needs
+    # an index on the column alone (see ViewFilter.order_parts). The records of
+    # one finance company sorted by date have an index of their own. The filter
+    # and sort indexes leave out nomor_urut so that shifting the register does
+    # not have to rewrite them. Existing databases get these through
+    # MIGRATIONS, so a new index needs a migration too.
+    __table_args__ = (
+        Index('ux_records_nomor_urut', 'nomor_urut', unique=True),
+        Index('ix_records_urutan_id', 'urutan', 'id'),
+        Index('ux_records_fingerprint', 'fingerprint', unique=True),
+        Index('ix_records_perusahaan_finance', 'perusahaan_finance'),
+        Index('ix_records_nama_perwakilan', 'nama_perwakilan'),
+        Index('ix_records_perusahaan_finance_tanggal', 'perusahaan_finance', 'tanggal'),
+        Index('ix_records_tanggal', 'tanggal'),
+        Index('ix_records_nomor_akta', 'nomor_akta'),
+        Index('ix_records_nama_debitur', 'nama_debitur'),
+    )
+
+
+# Position of an unfinished streaming import, committed together with each chunk
+class ImportProgress(Base):
+    __tablename__ = 'import_progress'
+
+    file_hash = Column(String, primary_key=True)
+    start_nomor_urut = Column(Integer, primary_key=True)
+    rows_done = Column(Integer, nullable=False)
+    next_nomor_urut = Column(Integer, nullable=False)
+
+
+# Manifest of uploaded workbooks. A file is recognised by its content hash, and
+# by (path, size, mtime_ns) so an unchanged file can be skipped without reading it
+class ProcessedFile(Base):
+    __tablename__ = 'processed_files'
+
+    id = Column(Integer, primary_key=True)
+    file_hash = Column(String, nullable=False, index=True)
+    path = Column(String, nullable=False)
+    size = Column(Integer, nullable=False)
+    mtime_ns = Column(Integer, nullable=False)
+    # PROCESSED_IMPORTED, or PROCESSED_DUPLICATE for a copy of an imported file
+    status = Column(String, nullable=False)
+    rows = Column(Integer, nullable=False)
+    processed_at = Column(String, nullable=False)
+
+# Full-text index of the Search box columns. records_fts is an external-content
+# FTS5 table kept in sync by triggers. Rows that existed before the index was
+# added are indexed in batches by build_search_index_step; until then the
+# triggers skip them (ids in (built_up_to, target]) and search falls back to LIKE.
+# Bulk inserts pause the triggers inside their transaction and index the new rows
+# with one INSERT ... SELECT, which is several times faster than per-row triggers.
+SEARCH_COLUMNS = ('nomor_akta', 'nama_debitur', 'nama_perwakilan', 'perusahaan_finance', 'alamat_perusahaan')
+SEARCH_INDEX_BATCH = 20000
+
+_search_columns = ', '.join(SEARCH_COLUMNS)
+_new_values = ', '.join(f'new.{column}' for column in SEARCH_COLUMNS)
+_old_values = ', '.join(f'old.{column}' for column in SEARCH_COLUMNS)
+SEARCH_INDEX_DDL = [
+    f"CREATE VIRTUAL TABLE records_fts USING fts5({_search_columns}, content='records', content_rowid='id')",
+    "CREATE TABLE records_fts_build (id INTEGER PRIMARY KEY CHECK (id = 1), built_up_to INTEGER NOT NULL, target INTEGER NOT NULL, paused INTEGER NOT NULL DEFAULT 0)",
+    "INSERT INTO records_fts_build (id, built_up_to, target) SELECT 1, 0, COALESCE(MAX(id), 0) FROM records",
+    f"""CREATE TRIGGER records_fts_ai AFTER INSERT ON records
+    WHEN EXISTS (SELECT 1 FROM records_fts_build WHERE paused = 0 AND (new.id <= built_up_to OR new.id > target))
+    BEGIN
+        INSERT INTO records_fts (rowid, {_search_columns}) VALUES (new.id, {_new_values});
+    END""",
+    f"""CREATE TRIGGER records_fts_ad AFTER DELETE ON records
+    WHEN EXISTS (SELECT 1 FROM records_fts_build WHERE paused = 0 AND (old.id <= built_up_to OR old.id > target))
+    BEGIN
+        INSERT INTO records_fts (records_fts, rowid, {_search_columns}) VALUES ('delete', old.id, {_old_values});
+    END""",
+    f"""CREATE TRIGGER records_fts_au AFTER UPDATE OF {_search_columns} ON records
+    WHEN EXISTS (SELECT 1 FROM records_fts_build WHERE paused = 0 AND (old.id <= built_up_to OR old.id > target))
+    BEGIN
+        INSERT INTO records_fts (records_fts, rowid, {_search_columns}) VALUES ('delete', old.id, {_old_values});
+        INSERT INTO records_fts (rowid, {_search_columns}) VALUES (new.id, {_new_values});
+    END""",
+]
+
+
+def ensure_search_index(bind):
+    """Create the FTS5 search index if needed; returns False when SQLite has no FTS5."""
+    with bind.begin() as connection:
+        if inspect(connection).has_table('records_fts'):
+            return True
+        try:
+            for statement in SEARCH_INDEX_DDL:
+                connection.exec_driver_sql(statement)
+        except OperationalError:
+            # e.g. "no such module: fts5"; the transaction is rolled back
+            return False
+    return True
+
+
+# Set by open_database; False when the SQLite build has no FTS5
+SEARCH_FTS_AVAILABLE = False
+
+# Akta counts per finance company, representative and month of tanggal, for the
+# statistics window. Triggers on records keep record_counts current row by row,
+# so reading it never runs a GROUP BY over the register. Like the search index,
+# bulk imports pause the triggers inside their transaction and add the counts of
+# the new rows with one GROUP BY (ADD_RECORD_COUNTS_SQL). NULL counts as ''.
+# Counts that drop to zero stay in the table and are skipped when read.
+COUNT_DIMENSIONS = {
+    'perusahaan_finance': "{row}perusahaan_finance",
+    'nama_perwakilan': "{row}nama_perwakilan",
+    'bulan': "substr({row}tanggal, 1, 7)",
+}
+
+
+def _count_changes(row, delta):
+    """VALUES of the record_counts changes for one record in trigger SQL."""
+    return ', '.join(
+        f"('{dimension}', COALESCE({expression.format(row=row)}, ''), {delta})"
+        for dimension, expression in COUNT_DIMENSIONS.items()
+    )
+
+
+_UPSERT_COUNTS = "ON CONFLICT (dimension, value) DO UPDATE SET akta = akta + excluded.akta"
+RECORD_COUNTS_DDL = [
+    "CREATE TABLE IF NOT EXISTS record_counts (dimension TEXT NOT NULL, value TEXT NOT NULL, akta INTEGER NOT NULL, PRIMARY KEY (dimension, value)) WITHOUT ROWID",
+    "CREATE TABLE IF NOT EXISTS record_counts_state (id INTEGER PRIMARY KEY CHECK (id = 1), paused INTEGER NOT NULL DEFAULT 0)",
+    "INSERT OR IGNORE INTO record_counts_state (id) VALUES (1)",
+    f"""CREATE TRIGGER IF NOT EXISTS record_counts_ai AFTER INSERT ON records
+    WHEN (SELECT paused FROM record_counts_state) = 0
+    BEGIN
+        INSERT INTO record_counts (dimension, value, akta) VALUES {_count_changes('new.', 1)} {_UPSERT_COUNTS};
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS record_counts_ad AFTER DELETE ON records
+    WHEN (SELECT paused FROM record_counts_state) = 0
+    BEGIN
+        INSERT INTO record_counts (dimension, value, akta) VALUES {_count_changes('old.', -1)} {_UPSERT_COUNTS};
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS record_counts_au AFTER UPDATE OF perusahaan_finance, nama_perwakilan, tanggal ON records
+    WHEN (SELECT paused FROM record_counts_state) = 0
+    BEGIN
+        INSERT INTO record_counts (dimension, value, akta) VALUES {_count_changes('old.', -1)}, {_count_changes('new.', 1)} {_UPSERT_COUNTS};
+    END""",
+]
+ADD_RECORD_COUNTS_SQL = (
+    "INSERT INTO record_counts (dimension, value, akta) SELECT * FROM ("
+    + " UNION ALL ".join(
+        f"SELECT '{dimension}', COALESCE({expression.format(row='')}, ''), COUNT(*) FROM records WHERE id > :last_id GROUP BY 2"
+        for dimension, expression in COUNT_DIMENSIONS.items()
+    )
+    + f") WHERE true {_UPSERT_COUNTS}"
+)
+
+
+def pause_record_counts(connection, paused):
+    """Switch the record_counts triggers off (True) or back on, inside the caller's transaction."""
+    connection.exec_driver_sql(f"UPDATE record_counts_state SET paused = {int(paused)}")
+
+
+def _migrate_urutan(connection):
+    """Add the urutan ordering column, filled from nomor_urut."""
+    if 'urutan' not in {column_info['name'] for column_info in inspect(connection).get_columns('records')}:
+        connection.exec_driver_sql("ALTER TABLE records ADD COLUMN urutan FLOAT")
+        connection.exec_driver_sql("UPDATE records SET urutan = nomor_urut")
+    connection.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_records_urutan_id ON records (urutan, id)")
+
+
+def _migrate_fingerprint(connection):
+    """Add row fingerprints to existing rows.
+
+    Of rows that were already imported twice only the first gets one, so the
+    unique index can be built.
+    """
+    if 'fingerprint' not in {column_info['name'] for column_info in inspect(connection).get_columns('records')}:
+        connection.exec_driver_sql("ALTER TABLE records ADD COLUMN fingerprint BLOB")
+        connection.connection.driver_connection.create_function('row_fingerprint', 3, row_fingerprint, deterministic=True)
+        connection.exec_driver_sql(
+            "UPDATE records SET fingerprint = row_fingerprint(nomor_akta, nama_debitur, tanggal_akta) "
+            "WHERE id IN (SELECT MIN(id) FROM records GROUP BY nomor_akta, nama_debitur, tanggal_akta)"
+        )
+        duplicates = connection.exec_driver_sql("SELECT COUNT(*) FROM records WHERE fingerprint IS NULL").scalar()
+        if duplicates:
+            logger.warning(f"{duplicates} records are duplicates of an earlier import and have no fingerprint", extra={'fields': {'duplicates': duplicates}})
+    connection.exec_driver_sql("CREATE UNIQUE INDEX IF NOT EXISTS ux_records_fingerprint ON records (fingerprint)")
+
+
+def _migrate_unique_nomor_urut(connection):
+    """Make nomor_urut unique.
+
+    Older imports skipped a taken number only once, so a register can hold the
+    same number twice. From the first duplicate on, rows are renumbered in
+    (nomor_urut, id) order like compact_nomor_urut does: each gets
+    max(its number, previous number + 1), so the later rows move down until a
+    gap absorbs the shift. The unique index replaces ix_records_nomor_urut_id.
+    """
+    first_duplicate = connection.exec_driver_sql(
+        "SELECT MIN(nomor_urut) FROM (SELECT nomor_urut FROM records GROUP BY nomor_urut HAVING COUNT(*) > 1)"
+    ).scalar()
+    if first_duplicate is not None:
+        connection.execute(text("""
+            WITH ordered AS (
+                SELECT id, nomor_urut, ROW_NUMBER() OVER (ORDER BY nomor_urut, id) AS position
+                FROM records WHERE nomor_urut >= :first_duplicate
+            ), numbered AS (
+                SELECT id, nomor_urut,
+                       position + MAX(nomor_urut - position) OVER (ORDER BY position ROWS UNBOUNDED PRECEDING) AS final
+                FROM ordered
+            )
+            UPDATE records SET nomor_urut = numbered.final, urutan = numbered.final
+            FROM numbered
+            WHERE records.id = numbered.id AND numbered.nomor_urut != numbered.final
+        """), {'first_duplicate': first_duplicate})
+        renumbered = connection.exec_driver_sql("SELECT changes()").scalar()
+        logger.warning(
+            f"Duplicate nomor_urut from {first_duplicate} on: {renumbered} records renumbered",
+            extra={'fields': {'first_duplicate': first_duplicate, 'renumbered': renumbered}}
+        )
+    connection.exec_driver_sql("CREATE UNIQUE INDEX IF NOT EXISTS ux_records_nomor_urut ON records (nomor_urut)")
+    connection.exec_driver_sql("DROP INDEX IF EXISTS ix_records_nomor_urut_id")
+
+
+def _migrate_filter_indexes(connection):
+    """Index the finance company and representative columns for filtering."""
+    connection.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_records_perusahaan_finance ON records (perusahaan_finance)")
+    connection.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_records_nama_perwakilan ON records (nama_perwakilan)")
+
+
+def _migrate_tanggal(connection):
+    """Add the typed tanggal column, parsed from the tanggal_akta text.
+
+    Text that parses moves to tanggal (tanggal_akta becomes NULL); anything
+    else stays in tanggal_akta as it was.
+    """
+    if 'tanggal' not in {column_info['name'] for column_info in inspect(connection).get_columns('records')}:
+        connection.exec_driver_sql("ALTER TABLE records ADD COLUMN tanggal DATE")
+    connection.connection.driver_connection.create_function('parse_tanggal_akta', 1, _parse_tanggal_akta_iso, deterministic=True)
+    connection.exec_driver_sql("UPDATE records SET tanggal = parse_tanggal_akta(tanggal_akta) WHERE tanggal IS NULL AND tanggal_akta IS NOT NULL")
+    connection.exec_driver_sql("UPDATE records SET tanggal_akta = NULL WHERE tanggal IS NOT NULL AND tanggal_akta IS NOT NULL")
+    connection.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_records_tanggal ON records (tanggal)")
+
+
+def _create_record_counts(connection):
+    for statement in RECORD_COUNTS_DDL:
+        connection.exec_driver_sql(statement)
+
+
+def _migrate_record_counts(connection):
+    """Add the record_counts summary table and its triggers, counted from the existing records."""
+    _create_record_counts(connection)
+    connection.exec_driver_sql("DELETE FROM record_counts")
+    connection.execute(text(ADD_RECORD_COUNTS_SQL), {'last_id': 0})
+
+
+def _migrate_sort_indexes(connection):
+    """Index the sortable text columns, and the date within a finance company."""
+    connection.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_records_nomor_akta ON records (nomor_akta)")
+    connection.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_records_nama_debitur ON records (nama_debitur)")
+    connection.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_records_perusahaan_finance_tanggal ON records (perusahaan_finance, tanggal)")
+
+
+# Schema migrations of existing databases, in order. Only ever append to this
+# list. PRAGMA user_version holds how many of them a database has had;
+# open_database applies the rest, each in one transaction together with the new
+# user_version, so a migration that fails leaves the database as it was. New
+# databases get the whole schema from create_all (and the record_counts DDL)
+# and start at the latest version. Databases from before the list have version
+# 0 and may already have some of the changes, so migrations check first
+# (IF NOT EXISTS) and can run again.
+MIGRATIONS = (
+    _migrate_urutan,
+    _migrate_fingerprint,
+    _migrate_unique_nomor_urut,
+    _migrate_filter_indexes,
+    _migrate_tanggal,
+    _migrate_record_counts,
+    _migrate_sort_indexes,
+)
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+@contextmanager
+def schema_transaction(engine):
+    """engine.begin() that also covers DDL; pysqlite only opens a transaction by itself before DML."""
+    with engine.begin() as connection:
+        connection.exec_driver_sql("BEGIN IMMEDIATE")
+        yield connection
+
+
+def backup_database(engine, suffix):
+    """Copy a file database next to itself (database.db -> database.db.<suffix>.bak); returns the path or None.
+
+    Uses the SQLite backup API, so the copy is consistent even with a WAL file.
+    """
+    path = engine.url.database
+    if not path or path == ':memory:':
+        return None
+    backup_path = f"{path}.{suffix}.bak"
+    with engine.connect() as connection, closing(sqlite3.connect(backup_path)) as target:
+        connection.connection.driver_connection.backup(target)
+    return backup_path
+
+
+def migrate_database(engine):
+    """Apply the MIGRATIONS a database has not had yet; returns the number applied.
+
+    An up-to-date database costs one PRAGMA read. Before migrating, the
+    database is backed up as database.db.v<version>.bak.
+    """
+    with engine.connect() as connection:
+        version = connection.exec_driver_sql("PRAGMA user_version").scalar()
+    if version > SCHEMA_VERSION:
+        raise RuntimeError(f"Database dibuat oleh versi aplikasi yang lebih baru (skema {version}, aplikasi {SCHEMA_VERSION}).")
+    if version == SCHEMA_VERSION:
+        return 0
+
+    backup_path = backup_database(engine, f"v{version}")
+    logger.info(f"Migrating database schema from version {version} to {SCHEMA_VERSION}", extra={'fields': {'backup': backup_path}})
+    for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        with perf.span(f"Migrasi {number}", migration=migration.__name__):
+            with schema_transaction(engine) as connection:
+                # Another process (e.g. the inbox watcher) may have applied it in the meantime
+                if connection.exec_driver_sql("PRAGMA user_version").scalar() >= number:
+                    continue
+                migration(connection)
+                connection.exec_driver_sql(f"PRAGMA user_version = {number}")
+    return SCHEMA_VERSION - version
+
+
+def open_database(uri=DATABASE_URI, profile=PRAGMA_PROFILE):
+    """Create the engine, bring the schema up to date, give it a QueryCache and bind Session to it.
+
+    Every connection the engine opens gets the PRAGMA_PROFILES[profile] settings.
+    """
+    global SEARCH_FTS_AVAILABLE
+    engine = create_engine(uri)
+    pragmas = PRAGMA_PROFILES[profile]
+    event.listen(engine, 'connect', lambda dbapi_connection, _: apply_pragmas(dbapi_connection, pragmas))
+    perf.install(engine)
+
+    with engine.connect() as connection:
+        effective = {name: connection.exec_driver_sql(f"PRAGMA {name}").scalar() for name in pragmas}
+    # SQLite silently keeps the old journal mode where WAL is not possible
+    if 'journal_mode' in pragmas and str(effective['journal_mode']).lower() != pragmas['journal_mode'].lower():
+        logger.warning(f"Journal mode {pragmas['journal_mode']} not available, using {effective['journal_mode']}", extra={'fields': {'profile': profile}})
+    logger.info("Database opened", extra={'fields': {'uri': uri, 'profile': profile, **effective}})
+
+    if inspect(engine).has_table('records'):
+        migrate_database(engine)
+        # Tables added since the database was created
+        Base.metadata.create_all(engine)
+    else:
+        with schema_transaction(engine) as connection:
+            Base.metadata.create_all(connection)
+            _create_record_counts(connection)
+            connection.exec_driver_sql(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    SEARCH_FTS_AVAILABLE = ensure_search_index(engine)
+    _query_caches[engine] = QueryCache(engine.url.database)
+    Session.configure(bind=engine)
+    return engine
+
+SIFAT_AKTA_FIDUSIA = 'AKTA JAMINAN FIDUSIA'
+# How tanggal is shown, exported and written in older databases
+TANGGAL_FORMAT = "%d %B %Y"
+
+# Column order of the rows built by number_import_rows
+IMPORT_COLUMNS = (
+    'nomor_urut', 'nomor_akta', 'tanggal', 'tanggal_akta', 'sifat_akta', 'nama_debitur', 'gender',
+    'status', 'nama_perwakilan', 'perusahaan_finance', 'alamat_perusahaan', 'gelar', 'urutan', 'fingerprint'
+)
+# A row whose fingerprint is already in the register is left alone by the insert
+INSERT_RECORDS_SQL = (
+    f"INSERT INTO records ({', '.join(IMPORT_COLUMNS)}) VALUES ({', '.join('?' * len(IMPORT_COLUMNS))}) "
+    "ON CONFLICT (fingerprint) DO NOTHING"
+)
+# Columns a re-import may change on a row it already imported; the rest identify the row
+# (fingerprint) or keep its place in the register (nomor_urut)
+REIMPORT_COLUMNS = ('gender', 'status', 'gelar', 'nama_perwakilan', 'perusahaan_finance', 'alamat_perusahaan')
+UPDATE_REIMPORTED_SQL = (
+    f"UPDATE records SET {', '.join(f'{name} = :{name}' for name in REIMPORT_COLUMNS)} "
+    f"WHERE fingerprint = :fingerprint AND ({' OR '.join(f'{name} IS NOT :{name}' for name in REIMPORT_COLUMNS)})"
+)
+STREAM_CHUNK_SIZE = 5000
+
+# Sparse ordering: inserting a record in the middle of the register writes only
+# the new row (a fractional urutan between its neighbours and a negative
+# placeholder nomor_urut). The visible numbers are rewritten later, in one pass, by
+# compact_nomor_urut. When False every insert shifts the following numbers at once.
+SPARSE_ORDERING = False
+
+# Added to temporarily negated numbers so they never meet a placeholder
+RENUMBER_OFFSET = 1 << 40
+
+# Virtual list: rows fetched per page
+PAGE_SIZE = 200
+# Pages kept by QueryCache, bounded by their approximate size in memory
+QUERY_CACHE_MAX_BYTES = 32 * 1024 * 1024
+
+
+def sheet_column(df, name):
+    """Return a column of the uploaded sheet, or empty strings when the column is missing."""
+    if name in df.columns:
+        return df[name]
+    import pandas as pd
+    return pd.Series('', index=df.index, dtype=object)
+
+
+def convert_created_time(values):
+    """Convert a 'created_time' column (DD/MM/YYYY [HH:MM]) to (ISO dates, 'DD Month YYYY' labels).
+
+    Values that do not parse get None and ''.
+    """
+    import numpy as np
+    import pandas as pd
+    parsed = pd.to_datetime(values, format="%d/%m/%Y %H:%M", errors='coerce')
+    missing = parsed.isna() & values.notna()
+    if missing.any():
+        parsed[missing] = pd.to_datetime(values[missing], format="%d/%m/%Y", errors='coerce')
+    # A batch only spans a few hundred distinct days, so format each day once
+    codes, days = pd.factorize(parsed.dt.normalize())
+    dates = np.append(days.strftime("%Y-%m-%d").to_numpy(dtype=object), None)
+    labels = np.append(days.strftime(TANGGAL_FORMAT).to_numpy(dtype=object), '')
+    return dates[codes], labels[codes]
+
+
+def column_values(values):
+    """Column as a list of Python values, with NaN turned into None (stored as NULL)."""
+    return values.astype(object).where(values.notna(), None).tolist()
+
+
+def derive_gelar(gender, status):
+    """Vectorized 'gelar' rule: male -> Tn, single female -> Nn, married female -> Ny."""
+    import numpy as np
+    female = gender.eq('female')
+    return np.select(
+        [gender.eq('male'), female & status.eq('single'), female & status.eq('married')],
+        ['Tn', 'Nn', 'Ny'],
+        default=''
+    )
+
+
+def gelar_for(gender, status):
+    """The 'gelar' rule of derive_gelar for a single record."""
+    if gender == 'male':
+        return 'Tn'
+    if gender == 'female' and status == 'single':
+        return 'Nn'
+    if gender == 'female' and status == 'married':
+        return 'Ny'
+    return ''
+
+
+@functools.lru_cache(maxsize=4096)
+def format_tanggal(value):
+    """A date as 'DD Month YYYY'. Cached: a register holds a few thousand distinct days at most."""
+    return value.strftime(TANGGAL_FORMAT)
+
+
+def format_tanggal_akta(tanggal, tanggal_akta=None):
+    """The Tanggal Akta of a record as shown and exported: its date, or the text kept for a value that is not one."""
+    if tanggal is not None:
+        return format_tanggal(tanggal)
+    return tanggal_akta or ''
+
+
+@functools.lru_cache(maxsize=4096)
+def parse_tanggal_akta(value):
+    """A date typed as DD/MM/YYYY or written as 'DD Month YYYY'; None when value is not a date."""
+    value = (value or '').strip()
+    for date_format in ("%d/%m/%Y", TANGGAL_FORMAT):
+        try:
+            return datetime.datetime.strptime(value, date_format).date()
+        except ValueError:
+            pass
+    return None
+
+
+def _parse_tanggal_akta_iso(value):
+    tanggal = parse_tanggal_akta(value)
+    return tanggal.isoformat() if tanggal is not None else None
+
+
+def tanggal_columns(value):
+    """The tanggal / tanggal_akta values of a date entered as text (see Record.tanggal)."""
+    tanggal = parse_tanggal_akta(value)
+    if tanggal is not None:
+        return {'tanggal': tanggal, 'tanggal_akta': None}
+    return {'tanggal': None, 'tanggal_akta': value}
+
+
+# Stands for NULL in a fingerprint key, so a missing value differs from ''
+_FINGERPRINT_NULL = '\x00'
+
+
+def row_fingerprint(nomor_akta, nama_debitur, tanggal_akta):
+    """Identity of an imported row: a 16-byte hash of its nomor_akta, debtor and date as stored."""
+    null = _FINGERPRINT_NULL
+    key = f"{null if nomor_akta is None else nomor_akta}\x1f{null if nama_debitur is None else nama_debitur}\x1f{null if tanggal_akta is None else tanggal_akta}"
+    return hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+
+
+def sheet_import_columns(df):
+    """The 'records' columns that come from the sheet itself, converted with whole-column operations.
+
+    Plain lists only, so the result can be sent back from an import worker process.
+    """
+    import numpy as np
+    import pandas as pd
+    gender = sheet_column(df, 'gender_1')
+    status = sheet_column(df, 'marital_1')
+    dates, labels = convert_created_time(sheet_column(df, 'created_time'))
+    columns = {
+        'nomor_akta': column_values(sheet_column(df, 'number')),
+        'tanggal': dates.tolist(),
+        # Only dates that did not parse keep their text (''), as in Record.tanggal
+        'tanggal_akta': np.where(pd.isna(dates), labels, None).tolist(),
+        'nama_debitur': column_values(sheet_column(df, 'name_debitur')),
+        'gender': column_values(gender),
+        'status': column_values(status),
+        'gelar': derive_gelar(gender, status).tolist(),
+    }
+    # Fingerprints hash the date as it was stored before the tanggal column: the label
+    columns['fingerprint'] = list(map(row_fingerprint, columns['nomor_akta'], columns['nama_debitur'], labels.tolist()))
+    return columns
+
+
+def number_import_rows(sheet_columns, nomor_urut, nama_perwakilan, nama_perusahaan_finance, alamat_perusahaan_finance):
+    """Combine sheet_import_columns with their nomor_urut and the upload form values into row tuples (IMPORT_COLUMNS order)."""
+    columns = {
+        **sheet_columns,
+        'nomor_urut': nomor_urut,
+        'sifat_akta': repeat(SIFAT_AKTA_FIDUSIA),
+        'nama_perwakilan': repeat(nama_perwakilan),
+        'perusahaan_finance': repeat(nama_perusahaan_finance),
+        'alamat_perusahaan': repeat(alamat_perusahaan_finance),
+        'urutan': nomor_urut,
+    }
+    return list(zip(*(columns[name] for name in IMPORT_COLUMNS)))
+
+
+def free_nomor_urut(db_session, start_nomor_urut, count):
+    """The first count unused numbers from start_nomor_urut, in order.
+
+    nomor_urut is unique, so every number that is already taken is skipped.
+    The taken numbers are read through the index for a range that is widened
+    until it holds enough free ones; appending after the last number reads none.
+    """
+    import numpy as np
+    end = start_nomor_urut + count
+    while True:
+        taken = [nomor_urut for nomor_urut, in db_session.query(Record.nomor_urut).filter(Record.nomor_urut >= start_nomor_urut, Record.nomor_urut < end)]
+        free = np.setdiff1d(np.arange(start_nomor_urut, end), taken, assume_unique=True)
+        if len(free) >= count:
+            return free[:count].tolist()
+        end += max(count - len(free), end - start_nomor_urut)
+
+
+def last_record_id(db_session):
+    """Highest Record.id, 0 for an empty table; records added later have larger ids."""
+    return db_session.query(func.max(Record.id)).scalar() or 0
+
+
+def insert_import_rows(db_session, rows):
+    """Write import rows with one executemany on the session's connection.
+
+    The tuples go straight to the DB-API cursor: no ORM objects, and no
+    per-row parameter processing by SQLAlchemy. Returns the number of rows
+    inserted; rows whose fingerprint already exists are not.
+    """
+    if not rows:
+        return 0
+    connection = db_session.connection()
+    # The pause is the first write, so it takes the database lock: no other
+    # writer can add a row between reading the maximum and inserting. New
+    # rowids are above it, so the search index and record_counts can take the
+    # new rows as a range.
+    pause_record_counts(connection, True)
+    last_id = last_record_id(db_session)
+    if SEARCH_FTS_AVAILABLE:
+        connection.exec_driver_sql("UPDATE records_fts_build SET paused = 1")
+    inserted = connection.exec_driver_sql(INSERT_RECORDS_SQL, rows).rowcount
+    if SEARCH_FTS_AVAILABLE:
+        connection.execute(text(
+            f"INSERT INTO records_fts (rowid, {_search_columns}) "
+            f"SELECT id, {_search_columns} FROM records WHERE id > :last_id"
+        ), {'last_id': last_id})
+        connection.exec_driver_sql("UPDATE records_fts_build SET paused = 0")
+    connection.execute(text(ADD_RECORD_COUNTS_SQL), {'last_id': last_id})
+    pause_record_counts(connection, False)
+    return inserted
+
+
+class ImportCounts:
+    """Rows an import inserted, updated (changed since an earlier import) and skipped (already up to date)."""
+
+    def __init__(self, inserted=0, updated=0, skipped=0):
+        self.inserted = inserted
+        self.updated = updated
+        self.skipped = skipped
+
+    def __add__(self, other):
+        return ImportCounts(self.inserted + other.inserted, self.updated + other.updated, self.skipped + other.skipped)
+
+    def as_dict(self):
+        return {'inserted': self.inserted, 'updated': self.updated, 'skipped': self.skipped}
+
+    def describe(self):
+        """Summary for the user."""
+        return f"{self.inserted} data baru, {self.updated} diperbarui, {self.skipped} dilewati (sudah ada)"
+
+
+def existing_fingerprints(db_session, fingerprints):
+    """The given fingerprints that are already in the register, looked up through the unique index.
+
+    Runs on the DB-API cursor like insert_import_rows: a 100k-row sheet takes
+    over a hundred IN queries, and ORM statement overhead would dominate them.
+    """
+    fingerprints = list(set(fingerprints))
+    connection = db_session.connection()
+    found = set()
+    for index in range(0, len(fingerprints), BULK_ID_CHUNK):
+        chunk = fingerprints[index:index + BULK_ID_CHUNK]
+        found.update(fingerprint for fingerprint, in connection.exec_driver_sql(
+            f"SELECT fingerprint FROM records WHERE fingerprint IN ({', '.join('?' * len(chunk))})", tuple(chunk)
+        ))
+    return found
+
+
+def write_import(db_session, sheet_columns, start_nomor_urut, nama_perwakilan, nama_perusahaan_finance, alamat_perusahaan_finance):
+    """Upsert converted sheet rows by fingerprint (the caller commits).
+
+    Rows with a new fingerprint get the free numbers from start_nomor_urut on
+    (see free_nomor_urut) and are inserted. Rows imported before keep their number and are only written
+    when one of REIMPORT_COLUMNS changed; repeats of a row within the sheet
+    are skipped. Returns (ImportCounts, the number after the last one used).
+    """
+    fingerprints = sheet_columns['fingerprint']
+    existing = existing_fingerprints(db_session, fingerprints)
+    new_positions, update_positions, seen = [], [], set()
+    for position, fingerprint in enumerate(fingerprints):
+        # Only the first occurrence of a row counts, for updates as for inserts
+        if fingerprint in seen:
+            continue
+        seen.add(fingerprint)
+        if fingerprint in existing:
+            update_positions.append(position)
+        else:
+            new_positions.append(position)
+
+    new_columns = sheet_columns
+    if len(new_positions) < len(fingerprints):
+        new_columns = {name: [values[position] for position in new_positions] for name, values in sheet_columns.items()}
+    nomor_urut = free_nomor_urut(db_session, start_nomor_urut, len(new_positions))
+    rows = number_import_rows(new_columns, nomor_urut, nama_perwakilan, nama_perusahaan_finance, alamat_perusahaan_finance)
+    inserted = insert_import_rows(db_session, rows)
+
+    updated = 0
+    if update_positions:
+        form_values = {'nama_perwakilan': nama_perwakilan, 'perusahaan_finance': nama_perusahaan_finance, 'alamat_perusahaan': alamat_perusahaan_finance}
+        changes = [
+            {**form_values, **{name: sheet_columns[name][position] for name in ('gender', 'status', 'gelar', 'fingerprint')}}
+            for position in update_positions
+        ]
+        updated = db_session.connection().exec_driver_sql(UPDATE_REIMPORTED_SQL, changes).rowcount
+
+    next_start = rows[-1][0] + 1 if rows else start_nomor_urut
+    return ImportCounts(inserted, updated, len(fingerprints) - inserted - updated), next_start
+
+
+def import_dataframe(db_session, df, start_nomor_urut, nama_perwakilan, nama_perusahaan_finance, alamat_perusahaan_finance, on_complete=None):
+    """Upsert an uploaded sheet (see write_import) and commit it as one transaction; returns ImportCounts.
+
+    on_complete(db_session, counts) runs inside that transaction, e.g. to
+    record the file in the manifest together with its rows.
+    Target: at least 50,000 rows/sec for a 100k-row sheet (see benchmark.py).
+    """
+    try:
+        counts, _ = write_import(db_session, sheet_import_columns(df), start_nomor_urut, nama_perwakilan, nama_perusahaan_finance, alamat_perusahaan_finance)
+        if on_complete:
+            on_complete(db_session, counts)
+        db_session.commit()
+    except Exception:
+        db_session.rollback()
+        raise
+    return counts
+
+
+# Worker processes that parse workbooks for import_files
+IMPORT_PROCESSES = os.cpu_count() or 1
+
+
+def parse_import_file(file_path):
+    """Read one workbook and convert its columns; runs in an import worker process.
+
+    Returns (row count, sheet_import_columns).
+    """
+    import pandas as pd
+    df = pd.read_excel(file_path)
+    return len(df), sheet_import_columns(df)
+
+
+def parsed_import_files(file_paths, processes=IMPORT_PROCESSES):
+    """parse_import_file results in file order, parsed ahead in worker processes.
+
+    At most two files per process are parsed ahead of the consumer, so a long
+    selection does not pile up in memory while the writer catches up.
+    """
+    if processes <= 1 or len(file_paths) <= 1:
+        for file_path in file_paths:
+            yield parse_import_file(file_path)
+        return
+    paths = iter(file_paths)
+    with ProcessPoolExecutor(max_workers=min(processes, len(file_paths))) as pool:
+        pending = deque(pool.submit(parse_import_file, file_path) for file_path in islice(paths, 2 * processes))
+        try:
+            while pending:
+                result = pending.popleft().result()
+                for file_path in islice(paths, 1):
+                    pending.append(pool.submit(parse_import_file, file_path))
+                yield result
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def import_files(db_session, file_paths, start_nomor_urut, nama_perwakilan, nama_perusahaan_finance, alamat_perusahaan_finance, processes=IMPORT_PROCESSES, progress=None, on_file=None):
+    """Import several workbooks: parsed in parallel worker processes, written here one file at a time.
+
+    Files are written in the given order whatever order the workers finish in,
+    and each file's numbers continue right after the previous file's, so the
+    result is the same as uploading the files one after another. Each file is
+    one transaction; on_file(db_session, index, counts) runs inside it.
+    progress(files_done, total_files) is called at the start and after each
+    file is committed, so files_done files are saved whatever fails next.
+    Returns the ImportCounts of each file.
+    """
+    file_counts = []
+    next_start = start_nomor_urut
+    if progress:
+        progress(0, len(file_paths))
+    parsed = parsed_import_files(file_paths, processes)
+    try:
+        for index, (_, sheet_columns) in enumerate(parsed):
+            try:
+                counts, next_start = write_import(db_session, sheet_columns, next_start, nama_perwakilan, nama_perusahaan_finance, alamat_perusahaan_finance)
+                if on_file:
+                    on_file(db_session, index, counts)
+                db_session.commit()
+            except Exception:
+                db_session.rollback()
+                raise
+            file_counts.append(counts)
+            if progress:
+                progress(index + 1, len(file_paths))
+    finally:
+        parsed.close()
+    return file_counts
+
+
+def search_index_ready(db_session):
+    """True once every existing row is in the FTS5 index."""
+    if not SEARCH_FTS_AVAILABLE:
+        return False
+    built_up_to, target = db_session.execute(text("SELECT built_up_to, target FROM records_fts_build")).one()
+    return built_up_to >= target
+
+
+def build_search_index_step(db_session, batch=SEARCH_INDEX_BATCH):
+    """Index the next batch of pre-existing rows; returns True when the index is complete."""
+    if not SEARCH_FTS_AVAILABLE:
+        return True
+    built_up_to, target = db_session.execute(text("SELECT built_up_to, target FROM records_fts_build")).one()
+    if built_up_to >= target:
+        return True
+    upper = min(built_up_to + batch, target)
+    try:
+        db_session.execute(text(
+            f"INSERT INTO records_fts (rowid, {_search_columns}) "
+            f"SELECT id, {_search_columns} FROM records WHERE id > :lower AND id <= :upper"
+        ), {'lower': built_up_to, 'upper': upper})
+        db_session.execute(text("UPDATE records_fts_build SET built_up_to = :upper"), {'upper': upper})
+        db_session.commit()
+    except Exception:
+        db_session.rollback()
+        raise
+    return upper >= target
+
+
+def fts_match_query(search_query):
+    """Turn Search box text into an FTS5 query: every term must match, each as a prefix."""
+    terms = search_query.split()
+    return ' '.join('"{}"*'.format(term.replace('"', '""')) for term in terms)
+
+
+def search_filter(search_query, use_fts=False):
+    """Filter of the Search box over the searchable text columns.
+
+    With use_fts the FTS5 index answers prefix/multi-term queries; otherwise
+    it is a LIKE substring match (a full scan).
+    """
+    if use_fts:
+        matches = text("SELECT rowid FROM records_fts WHERE records_fts MATCH :fts_query").columns(column('rowid', Integer))
+        return Record.id.in_(matches.bindparams(fts_query=fts_match_query(search_query)))
+    search_query = f"%{search_query}%"
+    return (
+        (Record.nomor_akta.like(search_query)) |
+        (Record.nama_debitur.like(search_query)) |
+        (Record.nama_perwakilan.like(search_query)) |
+        (Record.perusahaan_finance.like(search_query)) |
+        (Record.alamat_perusahaan.like(search_query))
+    )
+
+
+def date_range_filters(date_range):
+    """Filters for a (from, to) range of tanggal, both ends included; either end may be None."""
+    if not date_range:
+        return []
+    date_from, date_to = date_range
+    filters = []
+    if date_from is not None:
+        filters.append(Record.tanggal >= date_from)
+    if date_to is not None:
+        filters.append(Record.tanggal <= date_to)
+    return filters
+
+
+# Filter builder: a condition is (column name, operator, value). 'equals' takes
+# the whole value (None for NULL), 'prefix' the start of a text column, compared
+# as an index range and so case-sensitive, and 'range' a (from, to) pair with
+# both ends included and either one None.
+FILTER_OPERATORS = ('equals', 'prefix', 'range')
+# Treeview column -> Record column a condition can test
+FILTER_COLUMNS = {
+    'Nomor Urut': 'nomor_urut',
+    'Nomor Akta': 'nomor_akta',
+    'Tanggal Akta': 'tanggal',
+    'Sifat Akta': 'sifat_akta',
+    'Nama Debitur': 'nama_debitur',
+    'Gender': 'gender',
+    'Status': 'status',
+    'Nama Perwakilan': 'nama_perwakilan',
+    'Perusahaan Finance': 'perusahaan_finance',
+    'Alamat Perusahaan': 'alamat_perusahaan',
+    'Gelar': 'gelar',
+}
+# Columns the view can be sorted by. Each has an index, and SQLite ends every
+# index with the rowid (Record.id), so ORDER BY column, id reads it in order
+SORT_COLUMNS = ('nomor_urut', 'nomor_akta', 'tanggal', 'nama_debitur', 'nama_perwakilan', 'perusahaan_finance')
+# Greater than any text that starts with the same prefix (highest code point)
+_PREFIX_END = '\U0010ffff'
+
+
+def filter_value(name, value):
+    """Text typed for a condition on a column, as the column's type; raises ValueError when it does not parse.
+
+    An empty date stands for records without one.
+    """
+    value = value.strip()
+    if name == 'tanggal':
+        if not value:
+            return None
+        tanggal = parse_tanggal_akta(value)
+        if tanggal is None:
+            raise ValueError(f"Tanggal tidak valid (DD/MM/YYYY): {value}")
+        return tanggal
+    if name == 'nomor_urut':
+        if not value.isdigit():
+            raise ValueError(f"Nomor urut harus berupa angka: {value}")
+        return int(value)
+    return value
+
+
+def filter_condition(name, operator, value, value_to=''):
+    """A ViewFilter condition from the text of the filter builder; raises ValueError for one that cannot match."""
+    if operator == 'prefix':
+        if name in ('nomor_urut', 'tanggal'):
+            raise ValueError("Awalan hanya untuk kolom teks.")
+        value = value.strip()
+        if not value:
+            raise ValueError("Awalan tidak boleh kosong.")
+        return name, operator, value
+    if operator == 'range':
+        bounds = tuple(filter_value(name, bound) if bound.strip() else None for bound in (value, value_to))
+        if bounds == (None, None):
+            raise ValueError("Isi paling sedikit salah satu batas rentang.")
+        return name, operator, bounds
+    return name, 'equals', filter_value(name, value)
+
+
+def condition_clauses(name, operator, value):
+    """SQL filters of one ViewFilter condition."""
+    attribute = getattr(Record, name)
+    if operator == 'prefix':
+        return [attribute >= value, attribute < value + _PREFIX_END]
+    if operator == 'range':
+        low, high = value
+        clauses = []
+        if low is not None:
+            clauses.append(attribute >= low)
+        if high is not None:
+            clauses.append(attribute <= high)
+        return clauses
+    if value is None:
+        return [attribute.is_(None)]
+    if value == '':
+        # record_counts groups NULL and '' together
+        return [func.coalesce(attribute, '') == '']
+    return [attribute == value]
+
+
+class ViewFilter:
+    """Which records the view shows and in which order: the Search box text, a
+    (from, to) range of tanggal (see date_range_filters), filter builder
+    conditions (see FILTER_OPERATORS) and an optional sort.
+
+    sort is (column name, descending) with a name from SORT_COLUMNS; None is
+    the register order. Plain values only, so it can be handed to a worker thread.
+    """
+
+    def __init__(self, search_query="", date_range=None, conditions=(), sort=None):
+        self.search_query = search_query
+        self.date_range = date_range
+        self.conditions = tuple(conditions)
+        self.sort = sort
+
+    def key(self):
+        """Hashable identity of the filter, for QueryCache."""
+        # Blank search text filters nothing, whatever the spaces
+        search_query = self.search_query if self.search_query.strip() else ''
+        return search_query, self.date_range, self.conditions, self.sort
+
+    def clauses(self, db_session):
+        clauses = date_range_filters(self.date_range)
+        for condition in self.conditions:
+            clauses += condition_clauses(*condition)
+        if self.search_query.strip():
+            clauses.append(search_filter(self.search_query, search_index_ready(db_session)))
+        return clauses
+
+    def descending(self):
+        return self.sort is not None and self.sort[1]
+
+    def sort_column(self):
+        """Record column the view is sorted by, None for the register order (also 'nomor_urut')."""
+        if self.sort is None or self.sort[0] == 'nomor_urut':
+            return None
+        return getattr(Record, self.sort[0])
+
+    def order_parts(self, after=None):
+        """(filters, order) of each part of the view still to read after a row_key, as shown.
+
+        The register order is one part, continued by a keyset comparison. A
+        sorted view reads the records without a value (which SQLite sorts
+        first) by id and the others by (value, id); continuing after a value
+        reads the rest of its run by id, then the values past it. Every part
+        is then a seek in the column's index, which SQLite ends with the id,
+        and no comparison meets a NULL.
+        """
+        descending = self.descending()
+        attribute = self.sort_column()
+        if attribute is None:
+            order = record_order()
+            if after is None:
+                return [([], order)]
+            keyset, last = tuple_(*order), tuple_(*after)
+            return [([keyset < last if descending else keyset > last], order)]
+
+        def past(record_id):
+            return Record.id < record_id if descending else Record.id > record_id
+
+        values = ([attribute.isnot(None)], (attribute, Record.id))
+        nulls = ([attribute.is_(None)], (Record.id,))
+        if after is None:
+            return [values, nulls] if descending else [nulls, values]
+        value, record_id = after
+        if value is None:
+            nulls = ([attribute.is_(None), past(record_id)], (Record.id,))
+            return [nulls] if descending else [nulls, values]
+        run = ([attribute == value, past(record_id)], (Record.id,))
+        rest = ([attribute < value if descending else attribute > value], (attribute, Record.id))
+        return [run, rest, nulls] if descending else [run, rest]
+
+    def row_key(self, record):
+        """Keyset key of a loaded record in this view's order."""
+        attribute = self.sort_column()
+        if attribute is None:
+            return record_order_key(record)
+        return getattr(record, attribute.key), record.id
+
+
+# Columns of a RecordRow: what the Treeview, the keyset and the export read
+RECORD_ROW_FIELDS = (
+    'id', 'nomor_urut', 'urutan', 'nomor_akta', 'tanggal', 'tanggal_akta', 'sifat_akta', 'nama_debitur', 'gender',
+    'status', 'nama_perwakilan', 'perusahaan_finance', 'alamat_perusahaan', 'gelar',
+)
+# A record as a plain tuple with the attribute names of Record, so code that
+# only reads (record_row_values, fidusia_detail, ...) takes either
+RecordRow = namedtuple('RecordRow', RECORD_ROW_FIELDS)
+
+
+def record_rows_select():
+    """SELECT of the RECORD_ROW_FIELDS columns of records, to add filters and an order to."""
+    return select(*(getattr(Record, name) for name in RECORD_ROW_FIELDS))
+
+
+def read_record_rows(db_session, statement, yield_per=None):
+    """Iterate the RecordRows of a record_rows_select statement.
+
+    The statement runs on the session's connection without the ORM, so no
+    Record objects are built or tracked by the identity map. With yield_per
+    the rows are streamed that many at a time.
+    """
+    options = {'yield_per': yield_per} if yield_per else {}
+    return map(RecordRow._make, db_session.connection().execute(statement, execution_options=options))
+
+
+def fetch_records_page(db_session, view=None, after=None, limit=PAGE_SIZE):
+    """One page of the records a ViewFilter selects, as RecordRows in its order (keyset pagination).
+
+    after is the row_key of the last row of the previous page, so the cost of
+    a page does not depend on how far down the list it is.
+    """
+    view = view or ViewFilter()
+    statement = record_rows_select().where(*view.clauses(db_session))
+    records = []
+    for filters, order in view.order_parts(after):
+        part = statement.where(*filters).order_by(*(column.desc() if view.descending() else column for column in order))
+        records += read_record_rows(db_session, part.limit(limit - len(records)))
+        if len(records) >= limit:
+            break
+    return records
+
+
+# Treeview columns, in the order of record_row_values
+TREE_COLUMNS = ('Nomor Urut', 'Nomor Akta', 'Tanggal Akta', 'Sifat Akta', 'Nama Debitur', 'Gender', 'Status', 'Nama Perwakilan', 'Perusahaan Finance', 'Alamat Perusahaan', 'Gelar')
+
+
+def _shared(value):
+    """One string object per distinct text, for values that repeat across records."""
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def record_row_values(record):
+    """Values of a record in the column order of the Treeview.
+
+    The columns that repeat from record to record (and the formatted dates)
+    share one string per value, which halves the memory of loaded and cached rows.
+    """
+    return (
+        display_nomor_urut(record),
+        record.nomor_akta,
+        format_tanggal_akta(record.tanggal, record.tanggal_akta),
+        _shared(record.sifat_akta),
+        record.nama_debitur,
+        _shared(record.gender),
+        _shared(record.status),
+        _shared(record.nama_perwakilan),
+        _shared(record.perusahaan_finance),
+        _shared(record.alamat_perusahaan),
+        _shared(record.gelar)
+    )
+
+
+def record_row(record, view=None):
+    """(id, Treeview values, order key) of a record; the key is the view's row_key, by default the register order.
+
+    Plain tuples can be handed from a worker thread to the Tk thread, ORM
+    objects of the worker's session cannot.
+    """
+    key = record_order_key(record) if view is None else view.row_key(record)
+    return record.id, record_row_values(record), key
+
+
+def row_stripe(position):
+    """Treeview tag of the row at a position, alternating the row colours."""
+    return 'evenrow' if position % 2 == 0 else 'oddrow'
+
+
+class QueryCache:
+    """LRU cache of query results of one database, bounded by max_bytes.
+
+    Entries belong to the data version they were read at: a counter bumped by
+    every commit of a Session in this process, plus SQLite's PRAGMA
+    data_version on a connection of the cache's own, which changes whenever
+    any other connection commits, in this process or another one (watch.py).
+    The first lookup at a new version drops every entry. Values must not be
+    modified by the caller.
+    """
+
+    def __init__(self, path=None, max_bytes=QUERY_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.generation = 0
+        self.version = None
+        # Only ever reads, so every commit to the file shows in its data_version
+        self.watch = sqlite3.connect(path, check_same_thread=False) if path and path != ':memory:' else None
+
+    def bump(self):
+        with self.lock:
+            self.generation += 1
+
+    def _current_version(self):
+        data_version = self.watch.execute("PRAGMA data_version").fetchone()[0] if self.watch else None
+        return self.generation, data_version
+
+    def get(self, key):
+        """(version, value); value is None on a miss, and version goes to put() with the result."""
+        with self.lock:
+            version = self._current_version()
+            if version != self.version:
+                self.entries.clear()
+                self.size = 0
+                self.version = version
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return version, None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return version, entry[0]
+
+    def put(self, key, version, value, size):
+        # A result read before the latest change is dropped
+        with self.lock:
+            if version != self.version or size > self.max_bytes:
+                return
+            if key in self.entries:
+                self.size -= self.entries.pop(key)[1]
+            self.entries[key] = (value, size)
+            self.size += size
+            while self.size > self.max_bytes:
+                self.size -= self.entries.popitem(last=False)[1][1]
+
+    def stats(self):
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self.entries), 'bytes': self.size}
+
+
+# The QueryCache of every engine made by open_database
+_query_caches = weakref.WeakKeyDictionary()
+
+
+def query_cache(bind):
+    """The QueryCache of an engine, or None when it was not opened by open_database."""
+    return _query_caches.get(bind)
+
+
+def _bump_query_cache(db_session):
+    cache = query_cache(db_session.get_bind())
+    if cache is not None:
+        cache.bump()
+
+
+event.listen(Session, 'after_commit', _bump_query_cache)
+
+
+def _rows_size(rows):
+    """Approximate memory of a page of record_row tuples, in bytes; a value shared by several rows counts once."""
+    size = sys.getsizeof(rows)
+    counted = set()
+    for row in rows:
+        _, values, key = row
+        size += sys.getsizeof(row) + sys.getsizeof(values) + sys.getsizeof(key)
+        for value in values:
+            if id(value) not in counted:
+                counted.add(id(value))
+                size += sys.getsizeof(value)
+    return size
+
+
+def fetch_page_rows(db_session, view=None, after=None):
+    """fetch_records_page as record_row tuples, through the QueryCache of the database.
+
+    The session must not hold uncommitted writes, which the cache would keep.
+    """
+    cache = query_cache(db_session.get_bind())
+    view = view or ViewFilter()
+    if cache is None:
+        return [record_row(record, view) for record in fetch_records_page(db_session, view, after)]
+    key = ('page', view.key(), after)
+    version, rows = cache.get(key)
+    if rows is None:
+        rows = tuple(record_row(record, view) for record in fetch_records_page(db_session, view, after))
+        cache.put(key, version, rows, _rows_size(rows))
+    return list(rows)
+
+
+class ChangeSet:
+    """What a mutation did to the records, so a loaded view can be patched instead of reloaded.
+
+    updated maps a record id to {Treeview column: new value}. inserted lists
+    new record ids; inserted_after marks a bulk insert where every id above it
+    is new. renumbered means nomor_urut values may have moved (without changing
+    the order), and cleared means every record is gone.
+    """
+
+    def __init__(self, inserted=(), updated=None, deleted=(), inserted_after=None, renumbered=False, cleared=False):
+        self.inserted = [int(record_id) for record_id in inserted]
+        self.updated = {int(record_id): columns for record_id, columns in (updated or {}).items()}
+        self.deleted = [int(record_id) for record_id in deleted]
+        self.inserted_after = inserted_after
+        self.renumbered = renumbered
+        self.cleared = cleared
+
+    def needs_fetch(self):
+        """True when applying the change set needs rows from the database."""
+        return bool(self.inserted) or self.inserted_after is not None or self.renumbered
+
+
+def fetch_change_rows(db_session, changes, view, loaded_ids, up_to):
+    """Read what a ChangeSet adds to a loaded window of the register.
+
+    view is the ViewFilter of the window, loaded_ids are the ids in it, in
+    order, and up_to is the order key
+    of its last row (None when the whole result is loaded). Returns
+    (numbers, rows, overflow): numbers maps loaded ids to their new
+    (display nomor_urut, order key); rows are the record_row tuples of new
+    records that fall inside the window; overflow is True when a bulk insert
+    put more than a page of rows there.
+    """
+    numbers = {}
+    if changes.renumbered and loaded_ids:
+        for chunk in id_chunks(loaded_ids):
+            for record in read_record_rows(db_session, record_rows_select().where(Record.id.in_(chunk))):
+                numbers[record.id] = (display_nomor_urut(record), record_order_key(record))
+        # Records after the window were renumbered as well, so the window ends at its last row's new key
+        if up_to is not None and loaded_ids[-1] in numbers:
+            up_to = numbers[loaded_ids[-1]][1]
+
+    def window(*filters):
+        order = record_order()
+        statement = record_rows_select().where(*filters, *view.clauses(db_session)).order_by(*order)
+        if up_to is not None:
+            statement = statement.where(tuple_(*order) <= tuple_(*up_to))
+        return statement
+
+    rows = []
+    for chunk in id_chunks(changes.inserted):
+        rows += [record_row(record) for record in read_record_rows(db_session, window(Record.id.in_(chunk)))]
+    overflow = False
+    if changes.inserted_after is not None:
+        added = list(read_record_rows(db_session, window(Record.id > changes.inserted_after).limit(PAGE_SIZE + 1)))
+        overflow = len(added) > PAGE_SIZE
+        rows += [record_row(record) for record in added]
+    return numbers, rows, overflow
+
+
+class RecordRowModel:
+    """The rows loaded in the Treeview, keyed by Record.id and kept in register order.
+
+    version is bumped by every change, so a view can tell whether what it
+    shows is still current.
+    """
+
+    def __init__(self):
+        self.ids = []
+        self.keys = []
+        self.values = {}
+        self.version = 0
+
+    def __contains__(self, record_id):
+        return record_id in self.values
+
+    def __len__(self):
+        return len(self.ids)
+
+    def clear(self):
+        self.ids, self.keys = [], []
+        self.values = {}
+        self.version += 1
+
+    def extend(self, rows):
+        """Append a page of record_row tuples that follows the loaded rows."""
+        for record_id, values, key in rows:
+            self.ids.append(record_id)
+            self.keys.append(key)
+            self.values[record_id] = values
+        self.version += 1
+
+    def set_value(self, record_id, column_index, value):
+        values = self.values[record_id]
+        self.values[record_id] = values[:column_index] + (value,) + values[column_index + 1:]
+        self.version += 1
+
+    def remove(self, record_ids):
+        """Drop rows; returns the lowest position removed, or None."""
+        removed = {record_id for record_id in record_ids if record_id in self.values}
+        if not removed:
+            return None
+        first = min(self.ids.index(record_id) for record_id in removed)
+        kept = [(record_id, key) for record_id, key in zip(self.ids, self.keys) if record_id not in removed]
+        self.ids = [record_id for record_id, _ in kept]
+        self.keys = [key for _, key in kept]
+        for record_id in removed:
+            del self.values[record_id]
+        self.version += 1
+        return first
+
+    def insert(self, record_id, values, key):
+        """Insert a row at its place in the register order; returns its position."""
+        position = bisect.bisect(self.keys, key)
+        self.ids.insert(position, record_id)
+        self.keys.insert(position, key)
+        self.values[record_id] = values
+        self.version += 1
+        return position
+
+    def renumber(self, numbers):
+        """Apply fetch_change_rows numbers; returns the ids whose number changed."""
+        changed = []
+        for position, record_id in enumerate(self.ids):
+            if record_id not in numbers:
+                continue
+            display, key = numbers[record_id]
+            self.keys[position] = key
+            if self.values[record_id][0] != display:
+                self.values[record_id] = (display,) + self.values[record_id][1:]
+                changed.append(record_id)
+        self.version += 1
+        return changed
+
+
+def record_order():
+    """Columns that define the register order (and its keyset)."""
+    if SPARSE_ORDERING:
+        return (Record.urutan, Record.id)
+    return (Record.nomor_urut, Record.id)
+
+
+def record_order_key(record):
+    """record_order() values of a loaded record."""
+    return tuple(getattr(record, column_attr.key) for column_attr in record_order())
+
+
+def display_nomor_urut(record):
+    """nomor_urut as shown to the user; sparse rows awaiting compaction show their target with '*'."""
+    if record.nomor_urut < 0:
+        return f"{math.ceil(record.urutan)}*"
+    return record.nomor_urut
+
+
+def _restore_renumbered(connection):
+    """Second half of a renumbering: turn the parked negative numbers into their final values."""
+    connection.execute(
+        text("UPDATE records SET nomor_urut = -nomor_urut - :offset WHERE nomor_urut <= -:offset"),
+        {'offset': RENUMBER_OFFSET}
+    )
+
+
+def next_nomor_urut(db_session):
+    """The number after the highest nomor_urut in the register."""
+    highest = db_session.query(func.max(Record.nomor_urut)).scalar()
+    return (highest + 1) if highest is not None else 1
+
+
+def shift_nomor_urut(db_session, from_nomor_urut, by=1):
+    """Move every record with nomor_urut >= from_nomor_urut up by `by` (the caller commits).
+
+    Done with two set-based UPDATEs instead of loading the rows. Because SQLite
+    checks uniqueness row by row, shifting in place could collide with the next
+    number; the rows are first parked at negative numbers and then restored.
+    Returns the number of shifted records.
+    """
+    connection = db_session.connection()
+    shifted = connection.execute(
+        text("UPDATE records SET nomor_urut = -(nomor_urut + :by) - :offset, urutan = nomor_urut + :by WHERE nomor_urut >= :from_nomor_urut"),
+        {'by': by, 'offset': RENUMBER_OFFSET, 'from_nomor_urut': from_nomor_urut}
+    ).rowcount
+    if shifted:
+        _restore_renumbered(connection)
+    return shifted
+
+
+# Final number of every record from the first placeholder (:first_pending) on,
+# in urutan order: its own or target number, but at least the previous one + 1
+_COMPACTED_NUMBERS = """
+    WITH ordered AS (
+        SELECT id, nomor_urut, urutan,
+               CASE WHEN nomor_urut > 0 THEN nomor_urut
+                    ELSE CAST(urutan AS INTEGER) + (urutan > CAST(urutan AS INTEGER)) END AS wanted,
+               ROW_NUMBER() OVER (ORDER BY urutan, id) AS position
+        FROM records WHERE urutan >= :first_pending
+    ), numbered AS (
+        SELECT id, nomor_urut, urutan, position,
+               position + MAX(wanted - position) OVER (ORDER BY position ROWS UNBOUNDED PRECEDING) AS final
+        FROM ordered
+    )
+"""
+
+
+def sparse_insert_position(db_session, nomor_urut):
+    """Return (urutan, placeholder) for a record inserted at nomor_urut in sparse mode.
+
+    The row goes just before the record that would show nomor_urut after
+    compaction, placeholders included, so it takes that number and the record
+    moves down as with shift_nomor_urut. If no record would show it the number
+    is free and the row takes it directly (placeholder False).
+    Returns None when the gap is exhausted and the register must be compacted first.
+    """
+    first_pending = db_session.query(func.min(Record.urutan)).filter(Record.nomor_urut < 0).scalar()
+    # Before the first placeholder every record already shows its final number
+    query = db_session.query(Record.urutan, Record.nomor_urut).filter(Record.nomor_urut >= nomor_urut)
+    if first_pending is not None:
+        query = query.filter(Record.urutan < first_pending)
+    successor = query.order_by(Record.urutan, Record.id).first()
+    if successor is None and first_pending is not None:
+        successor = db_session.connection().execute(
+            text(_COMPACTED_NUMBERS + "SELECT urutan, final FROM numbered WHERE final >= :nomor_urut ORDER BY position LIMIT 1"),
+            {'first_pending': first_pending, 'nomor_urut': nomor_urut}
+        ).first()
+    if successor is None or successor[1] > nomor_urut:
+        return float(nomor_urut), False
+
+    successor_urutan = successor[0]
+    predecessor = db_session.query(func.max(Record.urutan)).filter(Record.urutan < successor_urutan).scalar()
+    lower = predecessor if predecessor is not None else nomor_urut - 1
+    # A successor above nomor_urut - 1 may show nomor_urut on its own, not
+    # because of the rows before it; the new row then needs that target itself
+    if successor_urutan > nomor_urut - 1:
+        lower = max(lower, nomor_urut - 1)
+    urutan = (lower + successor_urutan) / 2
+    if not lower < urutan < successor_urutan:
+        return None
+    return urutan, True
+
+
+def insert_record_at(db_session, nomor_urut, **values):
+    """Insert a record at position nomor_urut, moving the records from there down (the caller commits).
+
+    Returns (record, compaction_pending); compaction_pending is True when a
+    sparse insert left numbers for compact_nomor_urut.
+    """
+    if not SPARSE_ORDERING:
+        if db_session.query(Record.id).filter_by(nomor_urut=nomor_urut).first():
+            shift_nomor_urut(db_session, nomor_urut)
+        record = Record(nomor_urut=nomor_urut, urutan=nomor_urut, **values)
+        db_session.add(record)
+        return record, False
+
+    position = sparse_insert_position(db_session, nomor_urut)
+    if position is None:
+        compact_nomor_urut(db_session)
+        position = sparse_insert_position(db_session, nomor_urut)
+    urutan, placeholder = position
+
+    if placeholder:
+        # A unique negative number marks the row until compaction numbers it
+        lowest = db_session.query(func.min(Record.nomor_urut)).scalar() or 0
+        record = Record(nomor_urut=min(lowest, 0) - 1, urutan=urutan, **values)
+    else:
+        record = Record(nomor_urut=nomor_urut, urutan=urutan, **values)
+    db_session.add(record)
+    return record, placeholder
+
+
+def compact_nomor_urut(db_session):
+    """Give sparse-mode rows their final numbers and shift the rows after them (the caller commits).
+
+    Walking the register in urutan order from the first placeholder, each row
+    gets max(its own or target number, previous number + 1) in one set-based
+    UPDATE, so only rows whose number must change are written. Their urutan
+    is reset to the new number. Returns the number of renumbered records.
+    """
+    first_pending = db_session.query(func.min(Record.urutan)).filter(Record.nomor_urut < 0).scalar()
+    if first_pending is None:
+        return 0
+    connection = db_session.connection()
+    connection.execute(text(_COMPACTED_NUMBERS + """
+        UPDATE records SET nomor_urut = -(numbered.final + :offset), urutan = numbered.final
+        FROM numbered
+        WHERE records.id = numbered.id AND (numbered.nomor_urut != numbered.final OR numbered.urutan != numbered.final)
+    """), {'first_pending': first_pending, 'offset': RENUMBER_OFFSET})
+    # The DB-API rowcount is not reported for statements starting with WITH
+    renumbered = connection.exec_driver_sql("SELECT changes()").scalar()
+    _restore_renumbered(connection)
+    return renumbered
+
+
+def fetch_record_counts(db_session, dimension):
+    """(value, akta) pairs of one COUNT_DIMENSIONS dimension: months in order, otherwise most akta first."""
+    order = 'value' if dimension == 'bulan' else 'akta DESC, value'
+    result = db_session.connection().execute(
+        text(f"SELECT value, akta FROM record_counts WHERE dimension = :dimension AND akta > 0 ORDER BY {order}"),
+        {'dimension': dimension}
+    )
+    return [tuple(row) for row in result]
+
+
+def record_count_view(dimension, value):
+    """ViewFilter of the records counted under value in a record_counts dimension."""
+    if dimension != 'bulan':
+        return ViewFilter(conditions=[(dimension, 'equals', value)])
+    if not value:
+        return ViewFilter(conditions=[('tanggal', 'equals', None)])
+    year, month = map(int, value.split('-'))
+    first = datetime.date(year, month, 1)
+    last = datetime.date(year + month // 12, month % 12 + 1, 1) - datetime.timedelta(days=1)
+    return ViewFilter(date_range=(first, last))
+
+
+def delete_all_records(db_session):
+    """Delete every record (the caller commits); record_counts is emptied at once rather than row by row.
+
+    The upload manifest and the progress of unfinished streaming imports go
+    too: they describe rows that no longer exist, so a workbook uploaded again
+    is imported afresh instead of being reported as a duplicate or resumed.
+    """
+    connection = db_session.connection()
+    pause_record_counts(connection, True)
+    deleted = connection.exec_driver_sql("DELETE FROM records").rowcount
+    connection.exec_driver_sql("DELETE FROM record_counts")
+    connection.exec_driver_sql("DELETE FROM processed_files")
+    connection.exec_driver_sql("DELETE FROM import_progress")
+    pause_record_counts(connection, False)
+    return deleted
+
+
+# Ids per statement of the bulk operations; stays under SQLite's default
+# limit of 999 bound parameters of older builds
+BULK_ID_CHUNK = 900
+
+
+def id_chunks(record_ids):
+    record_ids = [int(record_id) for record_id in record_ids]
+    for index in range(0, len(record_ids), BULK_ID_CHUNK):
+        yield record_ids[index:index + BULK_ID_CHUNK]
+
+
+def delete_records(db_session, record_ids):
+    """Delete records by primary key in one transaction; returns the number deleted."""
+    deleted = 0
+    try:
+        for chunk in id_chunks(record_ids):
+            deleted += db_session.query(Record).filter(Record.id.in_(chunk)).delete(synchronize_session=False)
+        db_session.commit()
+    except Exception:
+        db_session.rollback()
+        raise
+    return deleted
+
+
+def _update_records(db_session, record_ids, attribute, value):
+    """update_records without the commit."""
+    if attribute not in Record.__table__.columns or attribute in ('id', 'urutan', 'tanggal'):
+        raise ValueError(f"Kolom {attribute} tidak dapat diubah.")
+    values = {attribute: value}
+    if attribute == 'tanggal_akta':
+        values = tanggal_columns(value)
+    if attribute == 'nomor_urut':
+        if len(record_ids) != 1:
+            raise ValueError("Nomor urut hanya dapat diubah satu per satu.")
+        # Keep the ordering key in step with a manually edited number
+        values['nomor_urut'] = values['urutan'] = int(value)
+        if db_session.query(Record.id).filter(Record.nomor_urut == values['nomor_urut'], Record.id != int(record_ids[0])).first():
+            raise ValueError(f"Nomor urut {values['nomor_urut']} sudah dipakai.")
+    updated = 0
+    for chunk in id_chunks(record_ids):
+        updated += db_session.query(Record).filter(Record.id.in_(chunk)).update(values, synchronize_session=False)
+    return updated
+
+
+def update_records(db_session, record_ids, attribute, value):
+    """Set one column to the same value on records by primary key, in one transaction.
+
+    nomor_urut is unique per record, so it can only be changed on a single
+    record; urutan follows it. tanggal_akta is parsed into tanggal when it is
+    a date (see tanggal_columns). Returns the number of records updated.
+    """
+    try:
+        updated = _update_records(db_session, record_ids, attribute, value)
+        db_session.commit()
+    except Exception:
+        db_session.rollback()
+        raise
+    return updated
+
+
+# Write-behind cell edits: pending edits are written together once the buffer
+# holds EDIT_BUFFER_MAX of them (the app also writes them on a timer)
+EDIT_BUFFER_MAX = 200
+EDIT_JOURNAL_SUFFIX = '.edits.jsonl'
+
+
+def edit_journal_path(engine):
+    """Journal file of the EditBuffer of a database, None for an in-memory database."""
+    database = engine.url.database
+    if database in (None, '', ':memory:'):
+        return None
+    return os.path.abspath(database) + EDIT_JOURNAL_SUFFIX
+
+
+def apply_record_edits(db_session, edits):
+    """Write {(record id, column): value} cell edits in one transaction; returns the number of records edited.
+
+    Records with the same edited columns share one executemany UPDATE by id.
+    Core statements, unlike the ORM's bulk update, skip records that were
+    deleted in the meantime.
+    """
+    rows = {}
+    for (record_id, attribute), value in edits.items():
+        values = tanggal_columns(value) if attribute == 'tanggal_akta' else {attribute: value}
+        rows.setdefault(record_id, {'record_id': record_id}).update(values)
+    statements = {}
+    for row in rows.values():
+        statements.setdefault(tuple(sorted(row)), []).append(row)
+    table = Record.__table__
+    updated = 0
+    try:
+        connection = db_session.connection()
+        # The SET clause comes from the keys of the parameters, hence one statement per set of columns
+        statement = update(table).where(table.c.id == bindparam('record_id'))
+        for batch in statements.values():
+            updated += connection.execute(statement, batch).rowcount
+        db_session.commit()
+    except Exception:
+        db_session.rollback()
+        raise
+    return updated
+
+
+class EditBuffer:
+    """Single-cell edits held back and written to the database in one transaction.
+
+    add() keeps the latest value per (record id, column) and appends the edit
+    to a JSON-lines journal next to the database. The journal is flushed to
+    the operating system but not fsynced: like the WAL with synchronous=NORMAL,
+    pending edits survive the app crashing or being killed, not a power cut.
+    Edits left in the journal by a crash are pending again when the buffer is
+    opened. nomor_urut is not buffered: a new number is checked against the others.
+
+    The buffer belongs to one thread. Another thread may write a snapshot()
+    with apply_record_edits; saved() then drops what it wrote.
+    """
+
+    def __init__(self, journal_path=None, max_edits=EDIT_BUFFER_MAX):
+        self.journal_path = journal_path
+        self.max_edits = max_edits
+        self.pending = {}
+        self.journal = None
+        if journal_path is None:
+            return
+        if os.path.exists(journal_path):
+            with open(journal_path, encoding='utf-8') as journal:
+                for line in journal:
+                    try:
+                        edit = json.loads(line)
+                    except ValueError:
+                        # The last line may have been cut short by the crash
+                        break
+                    self.pending[(edit['id'], edit['attribute'])] = edit['value']
+            if self.pending:
+                logger.warning(f"Recovered {len(self.pending)} unsaved edits", extra={'fields': {'journal': journal_path}})
+        # Rewritten without a torn last line, so new edits start on a line of their own
+        self.journal = open(journal_path, 'w', encoding='utf-8')
+        self._write_journal(self.pending.items())
+
+    def __len__(self):
+        return len(self.pending)
+
+    def full(self):
+        return len(self.pending) >= self.max_edits
+
+    def _write_journal(self, edits):
+        for (record_id, attribute), value in edits:
+            self.journal.write(json.dumps({'id': record_id, 'attribute': attribute, 'value': value}, ensure_ascii=False) + '\n')
+        self.journal.flush()
+
+    def _rewrite_journal(self):
+        if self.journal is not None:
+            self.journal.seek(0)
+            self.journal.truncate()
+            self._write_journal(self.pending.items())
+
+    def add(self, record_id, attribute, value):
+        if attribute not in Record.__table__.columns or attribute in ('id', 'urutan', 'tanggal', 'nomor_urut'):
+            raise ValueError(f"Kolom {attribute} tidak dapat diubah.")
+        key = (int(record_id), attribute)
+        if self.journal is not None:
+            self._write_journal([(key, value)])
+        self.pending[key] = value
+
+    def snapshot(self):
+        return dict(self.pending)
+
+    def saved(self, edits):
+        """Drop the edits of a snapshot once written; a cell edited again since keeps its newer value."""
+        for key, value in edits.items():
+            if key in self.pending and self.pending[key] == value:
+                del self.pending[key]
+        self._rewrite_journal()
+
+    def discard(self, record_ids=None):
+        """Drop the pending edits of deleted records (of every record when record_ids is None)."""
+        if record_ids is None:
+            self.pending.clear()
+        else:
+            deleted = {int(record_id) for record_id in record_ids}
+            self.pending = {key: value for key, value in self.pending.items() if key[0] not in deleted}
+        self._rewrite_journal()
+
+    def apply(self, db_session):
+        """Write the pending edits in one transaction; returns the number of records edited."""
+        if not self.pending:
+            return 0
+        edits = self.snapshot()
+        updated = apply_record_edits(db_session, edits)
+        self.saved(edits)
+        return updated
+
+    def close(self):
+        """Close the journal; it is removed unless edits are still pending."""
+        if self.journal is None:
+            return
+        self.journal.close()
+        self.journal = None
+        if not self.pending:
+            os.remove(self.journal_path)
+
+
+# Fidusia register template: a header row, then a block of EXPORT_BLOCK_ROWS rows
+# per record with columns A-E each merged over the block
+EXPORT_HEADERS = ('Nomor Urut', 'Nomor Akta', 'Tanggal Akta', 'Sifat Akta', 'Nama Penghadap dan atau yang diwakilkan/kuasa')
+EXPORT_BLOCK_ROWS = 4
+EXPORT_YIELD_PER = 2000
+# openpyxl release (major, minor) whose private WorksheetWriter _write_merged_blocks
+# was checked against; requirements.txt pins it. Other releases get the public
+# merged_cells, which holds every range in memory until the file is saved.
+STREAMED_MERGES_OPENPYXL = (3, 1)
+
+
+def fidusia_detail(record):
+    """Text of the merged 'Nama Penghadap' cell of a record."""
+    return (
+        f"- {record.nama_perwakilan}\n"
+        f"QQ.   A. {record.gelar}. {record.nama_debitur}\n"
+        f"           B. PT. {record.perusahaan_finance}\n"
+        f"                Berkedudukan di {record.alamat_perusahaan}"
+    )
+
+
+def _merged_block_refs(count):
+    """Ranges merged by the template for count record blocks: columns A-E of each block."""
+    for first_row in range(2, 2 + count * EXPORT_BLOCK_ROWS, EXPORT_BLOCK_ROWS):
+        last_row = first_row + EXPORT_BLOCK_ROWS - 1
+        for letter in 'ABCDE':
+            yield f"{letter}{first_row}:{letter}{last_row}"
+
+
+def _streams_merged_cells():
+    """True when the installed openpyxl is the STREAMED_MERGES_OPENPYXL release."""
+    import openpyxl
+    try:
+        version = tuple(int(part) for part in openpyxl.__version__.split('.')[:2])
+    except ValueError:
+        return False
+    return version == STREAMED_MERGES_OPENPYXL
+
+
+def _write_merged_blocks(writer, blocks):
+    """write_merged_cells of the export worksheet: streams the <mergeCells> of the record blocks.
+
+    openpyxl's own writer builds one list of every merged range; here they
+    are generated while the element is written.
+    """
+    from openpyxl.xml.functions import Element
+
+    if not blocks.count:
+        return
+    xf = writer.xf.send(True)
+    with xf.element('mergeCells', count=str(blocks.count * len(EXPORT_HEADERS))):
+        for ref in _merged_block_refs(blocks.count):
+            xf.write(Element('mergeCell', ref=ref))
+    writer.xf.send(None)
+
+
+class _BlockCount:
+    count = 0
+
+
+def export_fidusia_workbook(db_session, file_path, progress=None, view=None):
+    """Write all records (or those of a ViewFilter's filters) to file_path in the fidusia template, streaming.
+
+    RecordRows are read EXPORT_YIELD_PER at a time and written with a write-only
+    workbook; the cells of every block reuse the same pre-built styled cells,
+    and with the openpyxl release of STREAMED_MERGES_OPENPYXL the merged ranges
+    are streamed too, so memory does not grow with the number of records. The
+    sheet has the same cells, merges and styles as the former in-memory export.
+    progress(records_written) is called after every EXPORT_YIELD_PER records.
+    """
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Alignment, Border, Font, Side
+    from openpyxl.worksheet.cell_range import CellRange, MultiCellRange
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    blocks = _BlockCount()
+    streamed_merges = _streams_merged_cells()
+    if streamed_merges:
+        # Private API, hence the version check: the worksheet's writer is made
+        # here, as ws.append would, so its write_merged_cells can be replaced
+        from openpyxl.worksheet._writer import WorksheetWriter
+        ws._writer = WorksheetWriter(ws)
+        ws._writer.write_merged_cells = functools.partial(_write_merged_blocks, ws._writer, blocks)
+        ws._writer.write_top()
+
+    thin_border = Border(
+        left=Side(style='thin'),
+        right=Side(style='thin'),
+        top=Side(style='thin'),
+        bottom=Side(style='thin')
+    )
+
+    def styled_cell(font=None, alignment=None):
+        cell = WriteOnlyCell(ws)
+        cell.border = thin_border
+        if font is not None:
+            cell.font = font
+        if alignment is not None:
+            cell.alignment = alignment
+        return cell
+
+    header = [styled_cell(font=Font(bold=True)) for _ in EXPORT_HEADERS]
+    for cell, title in zip(header, EXPORT_HEADERS):
+        cell.value = title
+    ws.append(header)
+
+    detail_alignment = Alignment(wrap_text=True, vertical="top")
+    first_row = [styled_cell() for _ in range(4)] + [styled_cell(alignment=detail_alignment)]
+    # The old template set a regular font on E2, which the first record then filled
+    first_record_row = first_row[:4] + [styled_cell(font=Font(bold=False), alignment=detail_alignment)]
+    border_row = [styled_cell() for _ in EXPORT_HEADERS]
+
+    statement = record_rows_select()
+    if view is not None:
+        statement = statement.where(*view.clauses(db_session))
+    records = read_record_rows(db_session, statement.order_by(Record.nomor_urut, Record.id), EXPORT_YIELD_PER)
+    for record in records:
+        row = first_record_row if blocks.count == 0 else first_row
+        row[0].value = record.nomor_urut
+        row[1].value = record.nomor_akta
+        row[2].value = format_tanggal_akta(record.tanggal, record.tanggal_akta)
+        row[3].value = record.sifat_akta
+        row[4].value = fidusia_detail(record)
+        ws.append(row)
+        for _ in range(EXPORT_BLOCK_ROWS - 1):
+            ws.append(border_row)
+        blocks.count += 1
+        if progress and blocks.count % EXPORT_YIELD_PER == 0:
+            progress(blocks.count)
+
+    if blocks.count == 0:
+        # Without records the sub-headers of column E stay visible
+        regular_font = Font(bold=False)
+        for title, font in (('Nama Debitur', regular_font), ('Perusahaan Finance', regular_font), ('Alamat Perusahaan', regular_font), ('gelar', None)):
+            cell = WriteOnlyCell(ws, value=title)
+            if font is not None:
+                cell.font = font
+            ws.append([None, None, None, None, cell])
+    elif not streamed_merges:
+        ws.merged_cells = MultiCellRange(CellRange(ref) for ref in _merged_block_refs(blocks.count))
+
+    wb.save(file_path)
+    return blocks.count
+
+
+# Sharded export: one workbook per value of a record_counts dimension, each
+# rendered by an export worker process from its own connection to the database
+EXPORT_PARTITIONS = ('perusahaan_finance', 'bulan')
+EXPORT_PROCESSES = os.cpu_count() or 1
+_UNSAFE_FILE_NAME_CHARS = str.maketrans({char: '_' for char in '<>:"/\\|?*' + ''.join(map(chr, range(32)))})
+_export_engine = None
+
+
+def partition_file_name(value, used):
+    """Workbook name of one partition, unique (ignoring case, as on Windows) among the names in used."""
+    stem = (value or 'kosong').translate(_UNSAFE_FILE_NAME_CHARS).strip(' .')[:100] or '_'
+    name, number = f"{stem}.xlsx", 1
+    while name.lower() in used:
+        number += 1
+        name = f"{stem} ({number}).xlsx"
+    used.add(name.lower())
+    return name
+
+
+def _open_export_worker(uri):
+    """Initializer of an export worker process: one read connection to the database for all its partitions."""
+    global _export_engine
+    _export_engine = create_engine(uri)
+    pragmas = PRAGMA_PROFILES[PRAGMA_PROFILE]
+    event.listen(_export_engine, 'connect', lambda dbapi_connection, _: apply_pragmas(dbapi_connection, pragmas))
+
+
+def export_partition_file(dimension, value, file_path):
+    """Write the records of one partition to file_path; runs in an export worker process. Returns the record count."""
+    with Session(bind=_export_engine) as db_session:
+        return export_fidusia_workbook(db_session, file_path, view=record_count_view(dimension, value))
+
+
+def export_partitioned(db_session, target, dimension, archive=False, processes=EXPORT_PROCESSES, progress=None):
+    """Write one fidusia workbook per perusahaan_finance or per month (bulan) of tanggal.
+
+    The partitions are the values of the record_counts dimension. Workbooks are
+    rendered in parallel worker processes, largest partition first so the
+    workers finish together, and are named after their value (see
+    partition_file_name). target is a folder, created if needed, or with
+    archive the .zip file that holds the workbooks. progress(files_done,
+    total_files) is called as workbooks finish.
+    Returns (value, file name, records) of every workbook in statistics order.
+    """
+    if dimension not in EXPORT_PARTITIONS:
+        raise ValueError(f"Unknown export partition: {dimension}")
+    partitions = fetch_record_counts(db_session, dimension)
+    used = set()
+    names = [partition_file_name(value, used) for value, _ in partitions]
+    if not archive:
+        os.makedirs(target, exist_ok=True)
+        return _export_partitions(db_session, target, dimension, partitions, names, processes, progress)
+
+    # Workbooks are zip files already, so they are stored rather than compressed again
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(target))) as directory:
+        exported = _export_partitions(db_session, directory, dimension, partitions, names, processes, progress)
+        with zipfile.ZipFile(target, 'w', zipfile.ZIP_STORED) as archive_file:
+            for name in names:
+                archive_file.write(os.path.join(directory, name), name)
+    return exported
+
+
+def _export_partitions(db_session, directory, dimension, partitions, names, processes, progress):
+    counts = {}
+    uri = db_session.get_bind().url
+    # An in-memory database cannot be opened from another process
+    if processes <= 1 or len(partitions) <= 1 or uri.database in (None, '', ':memory:'):
+        for index, ((value, _), name) in enumerate(zip(partitions, names)):
+            counts[name] = export_fidusia_workbook(db_session, os.path.join(directory, name), view=record_count_view(dimension, value))
+            if progress:
+                progress(index + 1, len(partitions))
+    else:
+        largest_first = sorted(zip(partitions, names), key=lambda partition: -partition[0][1])
+        pool = ProcessPoolExecutor(
+            max_workers=min(processes, len(partitions)), initializer=_open_export_worker,
+            initargs=(uri.render_as_string(hide_password=False),)
+        )
+        try:
+            pending = {pool.submit(export_partition_file, dimension, value, os.path.join(directory, name)): name for (value, _), name in largest_first}
+            while pending:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    counts[pending.pop(future)] = future.result()
+                if progress:
+                    progress(len(counts), len(partitions))
+        finally:
+            # After a failure or cancellation the workbooks not started yet are dropped
+            pool.shutdown(wait=True, cancel_futures=True)
+    return [(value, name, counts[name]) for (value, _), name in zip(partitions, names)]
+
+
+def file_sha256(file_path):
+    """Content hash of a file, read in 1 MB blocks."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def import_excel_stream(db_session, file_path, start_nomor_urut, nama_perwakilan, nama_perusahaan_finance, alamat_perusahaan_finance, chunk_size=STREAM_CHUNK_SIZE, progress=None, file_hash=None, on_complete=None):
+    """Import a workbook row by row, committing every chunk_size rows.
+
+    Only one chunk is held in memory at a time. The position in the file is
+    committed together with each chunk, so uploading the same file again after
+    a failure resumes right after the last committed chunk.
+    progress(rows_done, total_rows) is called after every commit; total_rows
+    may be None when the sheet does not declare its size. on_complete(db_session,
+    counts) runs in the transaction that marks the file as finished.
+    Returns the ImportCounts of this run.
+    """
+    if file_hash is None:
+        file_hash = file_sha256(file_path)
+    state = db_session.get(ImportProgress, (file_hash, start_nomor_urut))
+    if state is None:
+        state = ImportProgress(file_hash=file_hash, start_nomor_urut=start_nomor_urut, rows_done=0, next_nomor_urut=start_nomor_urut)
+
+    import pandas as pd
+    from openpyxl import load_workbook
+
+    counts = ImportCounts()
+    wb = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        ws = wb.worksheets[0]
+        total_rows = ws.max_row - 1 if ws.max_row else None
+        sheet_rows = ws.iter_rows(values_only=True)
+        header = next(sheet_rows, None) or ()
+        sheet_rows = islice(sheet_rows, state.rows_done, None)
+
+        while True:
+            chunk = list(islice(sheet_rows, chunk_size))
+            if not chunk:
+                break
+            df = pd.DataFrame([row for row in chunk if any(value is not None for value in row)], columns=header)
+
+            try:
+                chunk_counts, state.next_nomor_urut = write_import(db_session, sheet_import_columns(df), state.next_nomor_urut, nama_perwakilan, nama_perusahaan_finance, alamat_perusahaan_finance)
+                state.rows_done += len(chunk)
+                db_session.add(state)
+                db_session.commit()
+            except Exception:
+                db_session.rollback()
+                raise
+            counts += chunk_counts
+
+            if progress:
+                progress(state.rows_done, total_rows)
+    finally:
+        wb.close()
+
+    # The file is complete, so a later upload of it starts from scratch again
+    if inspect(state).persistent:
+        db_session.delete(state)
+    if on_complete:
+        on_complete(db_session, counts)
+    db_session.commit()
+    return counts
+
+
+def pending_stream_import(db_session, file_hash):
+    """start_nomor_urut of an unfinished streaming import of this file, or None."""
+    return db_session.query(ImportProgress.start_nomor_urut).filter_by(file_hash=file_hash).scalar()
+
+
+PROCESSED_IMPORTED = 'imported'
+PROCESSED_DUPLICATE = 'duplicate'
+
+
+def file_signature(file_path, stat_result=None):
+    """(absolute path, size, mtime_ns) of a file; changes whenever the file is rewritten, and costs one stat."""
+    stat_result = stat_result or os.stat(file_path)
+    return os.path.abspath(file_path), stat_result.st_size, stat_result.st_mtime_ns
+
+
+def record_processed_file(db_session, file_hash, signature, rows, status=PROCESSED_IMPORTED):
+    """Add a manifest entry for a file (the caller commits, ideally together with the import)."""
+    path, size, mtime_ns = signature
+    entry = ProcessedFile(
+        file_hash=file_hash, path=path, size=size, mtime_ns=mtime_ns, status=status, rows=rows,
+        processed_at=datetime.datetime.now().isoformat(timespec='seconds'),
+    )
+    db_session.add(entry)
+    return entry
+
+
+def find_processed_file(db_session, file_hash):
+    """The latest manifest entry of an imported file with this content, or None."""
+    return (
+        db_session.query(ProcessedFile)
+        .filter_by(file_hash=file_hash, status=PROCESSED_IMPORTED)
+        .order_by(ProcessedFile.id.desc())
+        .first()
+    )
+
+
+TASK_WORKERS = 2
+TASK_POLL_MS = 50
+
+
+class TaskCancelled(Exception):
+    """Raised inside a background task once its cancellation was requested."""
+
+
+class BackgroundTask:
+    """A job run by TaskRunner.
+
+    The job function is called as func(db_session, task) on a worker thread.
+    It may call task.report(...) to publish progress; report is also a
+    cancellation point, like check_cancelled.
+    """
+
+    def __init__(self, name, func, writes, on_done, on_error, on_progress):
+        self.name = name
+        self.func = func
+        self.writes = writes
+        self.on_done = on_done
+        self.on_error = on_error
+        self.on_progress = on_progress
+        self.running = False
+        self.progress = None
+        self.progress_shown = None
+        self.cancel_event = threading.Event()
+
+    def report(self, *progress):
+        self.progress = progress
+        self.check_cancelled()
+
+    def check_cancelled(self):
+        if self.cancel_event.is_set():
+            raise TaskCancelled(self.name)
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def describe(self):
+        """Name plus the latest progress, for the status bar."""
+        if not self.progress:
+            return self.name
+        done, total = (self.progress + (None,))[:2]
+        if total:
+            return f"{self.name} ({done:,} / {total:,})"
+        return f"{self.name} ({done:,})"
+
+
+class TaskRunner:
+    """Runs slow work off the Tk main loop.
+
+    Read-only tasks share a pool of TASK_WORKERS threads. Tasks that write go
+    through a single writer thread, because SQLite allows one writer at a time.
+    Each task gets its own session from thread_session. Results and progress
+    are handed back by polling with root.after, so the on_done, on_error and
+    on_progress callbacks always run on the Tk thread. on_error also receives
+    TaskCancelled when a task is cancelled.
+    """
+
+    def __init__(self, root, workers=TASK_WORKERS, on_status=None):
+        self.root = root
+        self.on_status = on_status
+        self.readers = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='task-read')
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='task-write')
+        self.finished = queue.Queue()
+        self.tasks = []
+        self.poll_after_id = None
+
+    def submit(self, name, func, writes=False, on_done=None, on_error=None, on_progress=None):
+        task = BackgroundTask(name, func, writes, on_done, on_error, on_progress)
+        self.tasks.append(task)
+        (self.writer if writes else self.readers).submit(self._run, task)
+        if self.poll_after_id is None:
+            self.poll_after_id = self.root.after(TASK_POLL_MS, self.poll)
+        self._notify_status()
+        return task
+
+    def _run(self, task):
+        # Worker thread: never touch Tk here
+        if task.cancel_event.is_set():
+            self.finished.put((task, None, TaskCancelled(task.name)))
+            return
+        task.running = True
+        db_session = thread_session()
+        started = time.perf_counter()
+        status = 'done'
+        try:
+            with perf.span(task.name, writes=task.writes):
+                result = task.func(db_session, task)
+        except TaskCancelled as e:
+            status = 'cancelled'
+            self.finished.put((task, None, e))
+        except Exception as e:
+            status = 'failed'
+            self.finished.put((task, None, e))
+        else:
+            self.finished.put((task, result, None))
+        finally:
+            # Closes the session; anything left uncommitted is rolled back
+            thread_session.remove()
+            # Reads (page loads) are frequent, so only writes are logged at INFO
+            logger.log(logging.INFO if task.writes else logging.DEBUG, "Task finished", extra={'fields': {
+                'task': task.name, 'status': status, 'elapsed_ms': round((time.perf_counter() - started) * 1000, 1),
+            }})
+
+    def poll(self):
+        self.poll_after_id = None
+        try:
+            for task in self.tasks:
+                progress = task.progress
+                if task.on_progress and progress is not task.progress_shown:
+                    task.progress_shown = progress
+                    task.on_progress(*progress)
+            while True:
+                try:
+                    task, result, error = self.finished.get_nowait()
+                except queue.Empty:
+                    break
+                self.tasks.remove(task)
+                if error is None:
+                    if task.on_done:
+                        task.on_done(result)
+                elif task.on_error:
+                    task.on_error(error)
+        finally:
+            # A failing callback must not stop the polling of the other tasks
+            if self.tasks and self.poll_after_id is None:
+                self.poll_after_id = self.root.after(TASK_POLL_MS, self.poll)
+            self._notify_status()
+
+    def _notify_status(self):
+        if self.on_status:
+            running = [task for task in self.tasks if task.running]
+            queued = [task for task in self.tasks if not task.running]
+            self.on_status(running, queued)
+
+    def cancel_all(self):
+        for task in self.tasks:
+            task.cancel()
+
+    def shutdown(self):
+        """Cancel everything and wait for the running tasks to stop."""
+        self.cancel_all()
+        if self.poll_after_id is not None:
+            self.root.after_cancel(self.poll_after_id)
+            self.poll_after_id = None
+        for executor in (self.readers, self.writer):
+            executor.shutdown(wait=True, cancel_futures=True)
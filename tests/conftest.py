@@ -0,0 +1,33 @@
+import pandas as pd
+import pytest
+
+from core import Session, open_database
+
+
+@pytest.fixture
+def database(tmp_path):
+    """Path of a fresh database, opened with open_database."""
+    path = tmp_path / 'test.db'
+    open_database(f"sqlite:///{path}").dispose()
+    return path
+
+
+@pytest.fixture
+def db_session(database):
+    engine = open_database(f"sqlite:///{database}")
+    db_session = Session(bind=engine)
+    yield db_session
+    db_session.close()
+    engine.dispose()
+
+
+def make_sheet(rows, start=1, gender='male'):
+    """An upload sheet with the real columns and rows numbered from start."""
+    numbers = range(start, start + rows)
+    return pd.DataFrame({
+        'number': [f"{i}/FID/2024" for i in numbers],
+        'created_time': [f"{i % 28 + 1:02d}/01/2024 10:00" for i in numbers],
+        'name_debitur': [f"DEBITUR {i}" for i in numbers],
+        'gender_1': [gender] * rows,
+        'marital_1': ['single'] * rows,
+    })
@@ -0,0 +1,73 @@
+import datetime
+import os
+
+import pytest
+
+from core import EditBuffer, Record, apply_record_edits, delete_records, edit_journal_path
+
+
+@pytest.fixture
+def records(db_session):
+    for nomor_urut in range(1, 4):
+        db_session.add(Record(nomor_urut=nomor_urut, urutan=nomor_urut, nama_debitur=f"DEBITUR {nomor_urut}", gender='male'))
+    db_session.commit()
+    return [record.id for record in db_session.query(Record).order_by(Record.nomor_urut)]
+
+
+def values(db_session, column):
+    db_session.expire_all()
+    return [getattr(record, column) for record in db_session.query(Record).order_by(Record.nomor_urut)]
+
+
+def test_edits_left_by_a_crash_are_recovered(db_session, records):
+    journal_path = edit_journal_path(db_session.get_bind())
+    edits = EditBuffer(journal_path)
+    edits.add(records[0], 'nama_debitur', 'ANI')
+    edits.add(records[1], 'gender', 'female')
+    edits.add(records[0], 'nama_debitur', 'ANITA')
+    # The app is killed in the middle of writing the next edit
+    edits.journal.write('{"id": 3, "attr')
+    edits.journal.close()
+
+    recovered = EditBuffer(journal_path)
+    assert recovered.snapshot() == {(records[0], 'nama_debitur'): 'ANITA', (records[1], 'gender'): 'female'}
+    recovered.add(records[2], 'tanggal_akta', '05/03/2024')
+    # Closing keeps the journal while edits are pending
+    recovered.close()
+    assert os.path.exists(journal_path)
+
+    recovered = EditBuffer(journal_path)
+    assert len(recovered) == 3
+    assert recovered.apply(db_session) == 3
+    assert values(db_session, 'nama_debitur') == ['ANITA', 'DEBITUR 2', 'DEBITUR 3']
+    assert values(db_session, 'gender') == ['male', 'female', 'male']
+    assert values(db_session, 'tanggal') == [None, None, datetime.date(2024, 3, 5)]
+    recovered.close()
+    assert not os.path.exists(journal_path)
+
+
+def test_edits_of_deleted_records_are_skipped(db_session, records):
+    delete_records(db_session, [records[1]])
+    edits = {(records[0], 'gender'): 'female', (records[1], 'gender'): 'female', (records[2], 'nama_debitur'): 'CICI'}
+    assert apply_record_edits(db_session, edits) == 2
+    assert values(db_session, 'gender') == ['female', 'male']
+    assert values(db_session, 'nama_debitur') == ['DEBITUR 1', 'CICI']
+
+
+def test_saved_keeps_a_cell_edited_again(db_session, records):
+    edits = EditBuffer()
+    edits.add(records[0], 'gender', 'female')
+    snapshot = edits.snapshot()
+    # Edited again while the snapshot was being written
+    edits.add(records[0], 'gender', 'male')
+    edits.add(records[1], 'gender', 'female')
+    apply_record_edits(db_session, snapshot)
+    edits.saved(snapshot)
+    assert edits.snapshot() == {(records[0], 'gender'): 'male', (records[1], 'gender'): 'female'}
+    edits.discard([records[1]])
+    assert edits.snapshot() == {(records[0], 'gender'): 'male'}
+
+
+def test_nomor_urut_is_not_buffered():
+    with pytest.raises(ValueError):
+        EditBuffer().add(1, 'nomor_urut', '5')
@@ -0,0 +1,104 @@
+import datetime
+
+import pytest
+from openpyxl import Workbook, load_workbook
+from openpyxl.styles import Alignment, Border, Font, Side
+
+import core
+from core import Record, ViewFilter, export_fidusia_workbook, format_tanggal_akta
+
+
+def template_workbook(records, path):
+    """The in-memory export of the first release, which export_fidusia_workbook replaces."""
+    wb = Workbook()
+    ws = wb.active
+    for cell, title in zip(('A1', 'B1', 'C1', 'D1', 'E1', 'E2', 'E3', 'E4', 'E5'), (
+            'Nomor Urut', 'Nomor Akta', 'Tanggal Akta', 'Sifat Akta', 'Nama Penghadap dan atau yang diwakilkan/kuasa',
+            'Nama Debitur', 'Perusahaan Finance', 'Alamat Perusahaan', 'gelar')):
+        ws[cell] = title
+    for cell in ('A1', 'B1', 'C1', 'D1', 'E1'):
+        ws[cell].font = Font(bold=True)
+    for cell in ('E2', 'E3', 'E4'):
+        ws[cell].font = Font(bold=False)
+    thin_border = Border(left=Side(style='thin'), right=Side(style='thin'), top=Side(style='thin'), bottom=Side(style='thin'))
+    for cell in ('A1', 'B1', 'C1', 'D1', 'E1'):
+        ws[cell].border = thin_border
+
+    row_index = 2
+    for record in records:
+        values = (
+            record.nomor_urut, record.nomor_akta, format_tanggal_akta(record.tanggal, record.tanggal_akta), record.sifat_akta,
+            f"- {record.nama_perwakilan}\n"
+            f"QQ.   A. {record.gelar}. {record.nama_debitur}\n"
+            f"           B. PT. {record.perusahaan_finance}\n"
+            f"                Berkedudukan di {record.alamat_perusahaan}"
+        )
+        for column, value in enumerate(values, start=1):
+            ws.merge_cells(start_row=row_index, start_column=column, end_row=row_index + 3, end_column=column)
+            ws.cell(row=row_index, column=column).value = value
+            if column == 5:
+                ws.cell(row=row_index, column=column).alignment = Alignment(wrap_text=True, vertical="top")
+            for row in range(row_index, row_index + 4):
+                ws.cell(row=row, column=column).border = thin_border
+        row_index += 4
+    wb.save(path)
+
+
+def sheet_contents(path):
+    """Everything of the first sheet the template defines: cells with their style, and merged ranges."""
+    ws = load_workbook(path).worksheets[0]
+    cells = {}
+    for row in ws.iter_rows():
+        for cell in row:
+            if cell.value is None and not cell.has_style:
+                continue
+            border = cell.border
+            cells[cell.coordinate] = (
+                cell.value, cell.font.b, cell.alignment.wrap_text, cell.alignment.vertical,
+                tuple(getattr(border, side).style for side in ('left', 'right', 'top', 'bottom')),
+            )
+    return cells, sorted(str(merged) for merged in ws.merged_cells.ranges)
+
+
+@pytest.fixture(autouse=True, params=['streamed', 'public'])
+def merged_cells(request, monkeypatch):
+    """Run each test with the merged cells streamed, and with openpyxl's public merged_cells as on an unchecked release."""
+    if request.param == 'public':
+        monkeypatch.setattr(core, 'STREAMED_MERGES_OPENPYXL', (0, 0))
+    return request.param
+
+
+@pytest.fixture
+def records(db_session):
+    for nomor_urut, (tanggal, tanggal_akta, finance) in enumerate([
+        (datetime.date(2024, 3, 5), None, 'ALFA'),
+        (None, 'belum ada', 'BETA'),
+        (datetime.date(2024, 1, 31), None, 'ALFA'),
+        (None, None, 'ALFA'),
+    ], start=1):
+        db_session.add(Record(
+            nomor_urut=nomor_urut, urutan=nomor_urut, nomor_akta=f"{nomor_urut}/FID/2024", tanggal=tanggal, tanggal_akta=tanggal_akta,
+            sifat_akta='AKTA JAMINAN FIDUSIA', nama_debitur=f"DEBITUR {nomor_urut}", gender='male', status='single',
+            nama_perwakilan='PERWAKILAN', perusahaan_finance=finance, alamat_perusahaan='JAKARTA', gelar='Tn',
+        ))
+    db_session.commit()
+    return db_session.query(Record).order_by(Record.nomor_urut).all()
+
+
+def test_export_matches_the_template(tmp_path, db_session, records):
+    template_workbook(records, tmp_path / 'template.xlsx')
+    assert export_fidusia_workbook(db_session, tmp_path / 'export.xlsx') == len(records)
+    assert sheet_contents(tmp_path / 'export.xlsx') == sheet_contents(tmp_path / 'template.xlsx')
+
+
+def test_filtered_export_matches_the_template(tmp_path, db_session, records):
+    view = ViewFilter(conditions=[('perusahaan_finance', 'equals', 'ALFA')])
+    template_workbook([record for record in records if record.perusahaan_finance == 'ALFA'], tmp_path / 'template.xlsx')
+    assert export_fidusia_workbook(db_session, tmp_path / 'export.xlsx', view=view) == 3
+    assert sheet_contents(tmp_path / 'export.xlsx') == sheet_contents(tmp_path / 'template.xlsx')
+
+
+def test_empty_export_matches_the_template(tmp_path, db_session):
+    template_workbook([], tmp_path / 'template.xlsx')
+    assert export_fidusia_workbook(db_session, tmp_path / 'export.xlsx') == 0
+    assert sheet_contents(tmp_path / 'export.xlsx') == sheet_contents(tmp_path / 'template.xlsx')
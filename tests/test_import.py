@@ -0,0 +1,101 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+
+import core
+from conftest import make_sheet
+from core import (
+    ImportProgress, Record, delete_all_records, fetch_record_counts, find_processed_file, import_dataframe, import_files,
+    pending_stream_import, record_processed_file,
+)
+
+
+def import_sheet(db_session, df, finance='FINANCE'):
+    return import_dataframe(db_session, df, 1, 'PERWAKILAN', finance, 'JAKARTA')
+
+
+def test_row_committed_by_another_writer_is_counted_once(database, db_session, monkeypatch):
+    import_sheet(db_session, make_sheet(3))
+    pause_record_counts = core.pause_record_counts
+
+    def commit_other_row_first(connection, paused):
+        # Another writer (watch.py, Input Data) commits just before the import starts writing
+        if paused:
+            with sqlite3.connect(database) as other:
+                other.execute("INSERT INTO records (nomor_urut, urutan, nama_debitur, perusahaan_finance) VALUES (100, 100, 'X', 'OTHER')")
+        pause_record_counts(connection, paused)
+
+    monkeypatch.setattr(core, 'pause_record_counts', commit_other_row_first)
+    import_sheet(db_session, make_sheet(2, start=4))
+
+    assert dict(fetch_record_counts(db_session, 'perusahaan_finance')) == {'FINANCE': 5, 'OTHER': 1}
+    if core.SEARCH_FTS_AVAILABLE:
+        indexed = db_session.connection().exec_driver_sql("SELECT COUNT(*) FROM records_fts WHERE records_fts MATCH 'OTHER'").scalar()
+        assert indexed == 1
+    assert db_session.query(Record).count() == 6
+
+
+def test_reimport_of_the_same_sheet_changes_nothing(db_session):
+    df = make_sheet(3)
+    assert import_sheet(db_session, df).as_dict() == {'inserted': 3, 'updated': 0, 'skipped': 0}
+    assert import_sheet(db_session, df).as_dict() == {'inserted': 0, 'updated': 0, 'skipped': 3}
+    assert db_session.query(Record).count() == 3
+    assert dict(fetch_record_counts(db_session, 'perusahaan_finance')) == {'FINANCE': 3}
+
+
+def test_overlapping_sheet_adds_only_its_new_rows(db_session):
+    import_sheet(db_session, make_sheet(3))
+    counts = import_sheet(db_session, make_sheet(4, start=2))
+    assert counts.as_dict() == {'inserted': 2, 'updated': 0, 'skipped': 2}
+    # Taken numbers are skipped, so the new rows follow without a gap
+    assert [nomor_urut for nomor_urut, in db_session.query(Record.nomor_urut).order_by(Record.nomor_urut)] == [1, 2, 3, 4, 5]
+
+
+def test_reimport_updates_changed_rows_in_place(db_session):
+    import_sheet(db_session, make_sheet(3))
+    numbers = {record.nomor_akta: record.nomor_urut for record in db_session.query(Record)}
+    counts = import_sheet(db_session, make_sheet(3, gender='female'), finance='OTHER')
+    assert counts.as_dict() == {'inserted': 0, 'updated': 3, 'skipped': 0}
+    db_session.expire_all()
+    records = db_session.query(Record).all()
+    assert {(record.gender, record.perusahaan_finance) for record in records} == {('female', 'OTHER')}
+    assert {record.nomor_akta: record.nomor_urut for record in records} == numbers
+    assert dict(fetch_record_counts(db_session, 'perusahaan_finance')) == {'OTHER': 3}
+    # Up to date now
+    assert import_sheet(db_session, make_sheet(3, gender='female'), finance='OTHER').as_dict() == {'inserted': 0, 'updated': 0, 'skipped': 3}
+
+
+def test_repeated_row_within_a_sheet_counts_once(db_session):
+    df = pd.concat([make_sheet(2), make_sheet(1)], ignore_index=True)
+    assert import_sheet(db_session, df).as_dict() == {'inserted': 2, 'updated': 0, 'skipped': 1}
+    changed = pd.concat([make_sheet(2, gender='female'), make_sheet(1, gender='female')], ignore_index=True)
+    assert import_sheet(db_session, changed).as_dict() == {'inserted': 0, 'updated': 2, 'skipped': 1}
+    assert db_session.query(Record).count() == 2
+
+
+def test_delete_all_forgets_uploaded_files(db_session):
+    import_sheet(db_session, make_sheet(3))
+    record_processed_file(db_session, 'hash', ('sheet.xlsx', 1, 1), 3)
+    db_session.add(ImportProgress(file_hash='stream', start_nomor_urut=1, rows_done=5000, next_nomor_urut=5001))
+    db_session.commit()
+
+    delete_all_records(db_session)
+    db_session.commit()
+    assert find_processed_file(db_session, 'hash') is None
+    assert pending_stream_import(db_session, 'stream') is None
+    assert fetch_record_counts(db_session, 'perusahaan_finance') == []
+    assert import_sheet(db_session, make_sheet(3)).as_dict() == {'inserted': 3, 'updated': 0, 'skipped': 0}
+
+
+def test_import_files_reports_only_committed_files(database, db_session, tmp_path):
+    good = tmp_path / 'good.xlsx'
+    make_sheet(3).to_excel(good, index=False)
+    broken = tmp_path / 'broken.xlsx'
+    broken.write_text('not a workbook')
+    reported = []
+    with pytest.raises(Exception):
+        import_files(db_session, [str(good), str(broken)], 1, 'PERWAKILAN', 'FINANCE', 'JAKARTA', processes=1,
+                     progress=lambda done, total: reported.append((done, total)))
+    assert reported == [(0, 2), (1, 2)]
+    assert db_session.query(Record).count() == 3
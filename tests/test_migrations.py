@@ -0,0 +1,83 @@
+import datetime
+import sqlite3
+
+from core import SCHEMA_VERSION, Record, Session, fetch_record_counts, migrate_database, open_database
+
+# records as created by the first release, before MIGRATIONS
+BASELINE_SCHEMA = """
+    CREATE TABLE records (
+        id INTEGER NOT NULL PRIMARY KEY,
+        nomor_urut INTEGER NOT NULL,
+        nomor_akta VARCHAR,
+        tanggal_akta VARCHAR,
+        sifat_akta VARCHAR,
+        nama_debitur VARCHAR,
+        gender VARCHAR,
+        status VARCHAR,
+        nama_perwakilan VARCHAR,
+        perusahaan_finance VARCHAR,
+        alamat_perusahaan VARCHAR,
+        gelar VARCHAR
+    )
+"""
+BASELINE_ROWS = [
+    # id, nomor_urut, nomor_akta, tanggal_akta, nama_debitur, perusahaan_finance
+    (1, 1, '1/FID', '05 January 2024', 'A', 'FINANCE'),
+    (2, 2, '2/FID', '06 January 2024', 'B', 'FINANCE'),
+    # An older import skipped a taken number only once
+    (3, 2, '3/FID', '07 February 2024', 'C', 'OTHER'),
+    (4, 3, '4/FID', 'belum ada', 'D', 'OTHER'),
+    (5, 5, '5/FID', '', 'E', 'OTHER'),
+    # The same row imported twice
+    (6, 6, '1/FID', '05 January 2024', 'A', 'FINANCE'),
+]
+
+
+def baseline_database(path):
+    with sqlite3.connect(path) as connection:
+        connection.execute(BASELINE_SCHEMA)
+        connection.executemany(
+            "INSERT INTO records (id, nomor_urut, nomor_akta, tanggal_akta, nama_debitur, perusahaan_finance) VALUES (?, ?, ?, ?, ?, ?)",
+            BASELINE_ROWS
+        )
+    connection.close()
+
+
+def test_baseline_database_is_migrated(tmp_path):
+    path = tmp_path / 'database.db'
+    baseline_database(path)
+    engine = open_database(f"sqlite:///{path}")
+    db_session = Session(bind=engine)
+    try:
+        records = {record.id: record for record in db_session.query(Record)}
+        # Duplicate numbers move down until the gap at 4
+        assert {record_id: record.nomor_urut for record_id, record in records.items()} == {1: 1, 2: 2, 3: 3, 4: 4, 5: 5, 6: 6}
+        assert all(record.urutan == record.nomor_urut for record in records.values())
+        # Dates move to tanggal, other text stays as it was
+        assert (records[1].tanggal, records[1].tanggal_akta) == (datetime.date(2024, 1, 5), None)
+        assert (records[3].tanggal, records[3].tanggal_akta) == (datetime.date(2024, 2, 7), None)
+        assert (records[4].tanggal, records[4].tanggal_akta) == (None, 'belum ada')
+        # Only the first of a repeated import gets a fingerprint
+        assert records[1].fingerprint is not None and records[6].fingerprint is None
+        assert dict(fetch_record_counts(db_session, 'perusahaan_finance')) == {'FINANCE': 3, 'OTHER': 3}
+        assert dict(fetch_record_counts(db_session, 'bulan')) == {'': 2, '2024-01': 3, '2024-02': 1}
+    finally:
+        db_session.close()
+
+    with sqlite3.connect(path) as connection:
+        assert connection.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+        indexes = {name for name, in connection.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        duplicate = connection.execute("SELECT COUNT(*) FROM records GROUP BY nomor_urut HAVING COUNT(*) > 1").fetchall()
+    connection.close()
+    assert {'ux_records_nomor_urut', 'ix_records_perusahaan_finance', 'ix_records_nama_perwakilan', 'ix_records_tanggal'} <= indexes
+    assert not duplicate
+    assert (tmp_path / 'database.db.v0.bak').exists()
+    # An up-to-date database is left alone
+    assert migrate_database(engine) == 0
+    engine.dispose()
+
+
+def test_new_database_starts_at_the_latest_version(database):
+    with sqlite3.connect(database) as connection:
+        assert connection.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+    connection.close()
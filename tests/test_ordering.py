@@ -0,0 +1,36 @@
+import pytest
+
+import core
+from core import Record, Session, compact_nomor_urut, insert_record_at, open_database
+
+
+def register_after_inserts(path, sparse, monkeypatch, inserts):
+    """Numbered debtor names of a 5-record register after inserting (nomor_urut, name) pairs in turn."""
+    monkeypatch.setattr(core, 'SPARSE_ORDERING', sparse)
+    open_database(f"sqlite:///{path}")
+    db_session = Session()
+    try:
+        for nomor_urut in range(1, 6):
+            db_session.add(Record(nomor_urut=nomor_urut, urutan=nomor_urut, nama_debitur=f"R{nomor_urut}"))
+        db_session.commit()
+        for nomor_urut, name in inserts:
+            insert_record_at(db_session, nomor_urut, nama_debitur=name)
+            db_session.commit()
+        compact_nomor_urut(db_session)
+        db_session.commit()
+        return [(record.nomor_urut, record.nama_debitur) for record in db_session.query(Record).order_by(Record.urutan)]
+    finally:
+        db_session.close()
+
+
+@pytest.mark.parametrize('inserts', [
+    [(3, 'A'), (3, 'B')],
+    [(3, 'A'), (3, 'B'), (3, 'C')],
+    [(3, 'A'), (4, 'B'), (3, 'C')],
+    [(2, 'A'), (3, 'B'), (7, 'C'), (8, 'D')],
+])
+def test_sparse_insert_matches_shifting(tmp_path, monkeypatch, inserts):
+    shifted = register_after_inserts(tmp_path / 'shift.db', False, monkeypatch, inserts)
+    sparse = register_after_inserts(tmp_path / 'sparse.db', True, monkeypatch, inserts)
+    assert sparse == shifted
+    assert [nomor_urut for nomor_urut, _ in sparse] == list(range(1, len(sparse) + 1))
@@ -0,0 +1,107 @@
+import datetime
+import sqlite3
+
+import pytest
+
+from core import (
+    SORT_COLUMNS, Record, ViewFilter, delete_records, fetch_page_rows, fetch_records_page, filter_condition, query_cache,
+    update_records,
+)
+
+# (nomor_urut, nama_debitur, perusahaan_finance, tanggal): repeated values and NULLs
+# in every sortable column, so the keyset has to continue within a run
+ROWS = [
+    (index, name, finance, tanggal)
+    for index, (name, finance, tanggal) in enumerate([
+        ('BUDI', 'ALFA', datetime.date(2024, 3, 1)),
+        ('ANI', None, datetime.date(2024, 1, 5)),
+        ('BUDI', 'ALFA', None),
+        (None, 'BETA', datetime.date(2024, 1, 5)),
+        ('CICI', 'ALFA', datetime.date(2024, 2, 1)),
+        ('ANI', 'BETA', None),
+        ('BUDI', None, datetime.date(2024, 3, 1)),
+        ('DEDI', 'ALFABET', datetime.date(2024, 1, 5)),
+    ], start=1)
+]
+
+
+@pytest.fixture
+def records(db_session):
+    for nomor_urut, name, finance, tanggal in ROWS:
+        db_session.add(Record(nomor_urut=nomor_urut, urutan=nomor_urut, nomor_akta=f"{nomor_urut}/FID", nama_debitur=name,
+                              perusahaan_finance=finance, nama_perwakilan='PERWAKILAN', tanggal=tanggal))
+    db_session.commit()
+    return db_session.query(Record).all()
+
+
+def read_all_pages(db_session, view, limit):
+    ids, after = [], None
+    while True:
+        page = fetch_records_page(db_session, view, after, limit)
+        ids += [record.id for record in page]
+        if len(page) < limit:
+            return ids
+        after = view.row_key(page[-1])
+
+
+@pytest.mark.parametrize('column', SORT_COLUMNS)
+@pytest.mark.parametrize('descending', [False, True])
+@pytest.mark.parametrize('limit', [1, 2, 3, 100])
+def test_sorted_pages_follow_one_another(db_session, records, column, descending, limit):
+    # Ascending: records without a value first, then by value; both by id within a run
+    expected = [record.id for record in sorted(records, key=lambda record: (getattr(record, column) is not None, getattr(record, column), record.id))]
+    if descending:
+        expected.reverse()
+    assert read_all_pages(db_session, ViewFilter(sort=(column, descending)), limit) == expected
+
+
+@pytest.mark.parametrize('limit', [1, 3, 100])
+def test_register_order_pages(db_session, records, limit):
+    assert read_all_pages(db_session, ViewFilter(), limit) == [record.id for record in sorted(records, key=lambda record: record.nomor_urut)]
+    assert read_all_pages(db_session, ViewFilter(sort=('nomor_urut', True)), limit) == [record.id for record in sorted(records, key=lambda record: -record.nomor_urut)]
+
+
+@pytest.mark.parametrize('conditions, expected', [
+    ([('perusahaan_finance', 'equals', 'ALFA')], [1, 3, 5]),
+    ([filter_condition('perusahaan_finance', 'prefix', 'ALFA')], [1, 3, 5, 8]),
+    ([filter_condition('perusahaan_finance', 'equals', '')], [2, 7]),
+    ([filter_condition('tanggal', 'range', '01/01/2024', '01/02/2024')], [2, 4, 5, 8]),
+    ([filter_condition('tanggal', 'equals', '')], [3, 6]),
+    ([filter_condition('nama_debitur', 'equals', 'BUDI'), filter_condition('tanggal', 'range', '', '31/12/2024')], [1, 7]),
+    ([filter_condition('nomor_urut', 'range', '3', '5')], [3, 4, 5]),
+])
+def test_filter_conditions(db_session, records, conditions, expected):
+    view = ViewFilter(conditions=conditions, sort=('nama_debitur', False))
+    assert sorted(read_all_pages(db_session, view, 2)) == expected
+
+
+def test_filter_condition_rejects_what_cannot_match():
+    with pytest.raises(ValueError):
+        filter_condition('tanggal', 'equals', '31/02/2024')
+    with pytest.raises(ValueError):
+        filter_condition('nomor_urut', 'prefix', '1')
+    with pytest.raises(ValueError):
+        filter_condition('nama_debitur', 'range', '', ' ')
+
+
+def test_query_cache_serves_pages_until_the_data_changes(database, db_session, records):
+    cache = query_cache(db_session.get_bind())
+    first_id, second_id = records[0].id, records[1].id
+    first = fetch_page_rows(db_session)
+    assert fetch_page_rows(db_session) == first
+    assert cache.stats()['hits'] == 1
+
+    # A commit of this process
+    update_records(db_session, [first_id], 'nama_debitur', 'ZAINAL')
+    assert 'ZAINAL' in fetch_page_rows(db_session)[0][1]
+    delete_records(db_session, [first_id])
+    assert first_id not in [row[0] for row in fetch_page_rows(db_session)]
+
+    # A commit of another connection (watch.py)
+    fetch_page_rows(db_session)
+    hits = cache.stats()['hits']
+    with sqlite3.connect(database) as other:
+        other.execute("UPDATE records SET nama_debitur = 'YUDI' WHERE id = ?", (second_id,))
+    other.close()
+    assert 'YUDI' in fetch_page_rows(db_session)[0][1]
+    assert cache.stats()['hits'] == hits
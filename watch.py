@@ -0,0 +1,223 @@
+"""Unattended upload of partner workbooks dropped into an inbox folder.
+
+Every folder under the inbox that has an upload.json (or inherits one from a
+parent folder) is scanned for .xlsx files, and each new workbook is imported
+the same way as Upload Data. New rows are appended after the last nomor_urut.
+
+    {"nama_perwakilan": "...", "nama_perusahaan_finance": "...",
+     "alamat_perusahaan_finance": "...", "stream": false}
+
+Files already in the manifest (the processed_files table) are skipped:
+unchanged files by path, size and modification time without being read, and
+copies of an imported file by content hash. Rows imported before are updated
+in place rather than added again (see core.write_import). Every imported,
+duplicate or failed file is appended to import_summary.jsonl in the inbox,
+with its inserted, updated and skipped row counts.
+
+Run with:  python watch.py INBOX [--interval 60] [--once]
+   or:     app.exe watch INBOX [--interval 60] [--once]
+"""
+import argparse
+import datetime
+import json
+import logging
+import os
+import sys
+import time
+
+import core
+from core import (
+    DATABASE_URI, PROCESSED_DUPLICATE, PROCESSED_IMPORTED, ImportCounts, ProcessedFile, Session, compact_nomor_urut,
+    file_sha256, file_signature, import_dataframe, import_excel_stream, logger, next_nomor_urut, open_database,
+    pending_stream_import, perf, record_processed_file, setup_logging,
+)
+
+CONFIG_FILE_NAME = 'upload.json'
+CONFIG_KEYS = ('nama_perwakilan', 'nama_perusahaan_finance', 'alamat_perusahaan_finance')
+SUMMARY_FILE_NAME = 'import_summary.jsonl'
+POLL_INTERVAL_SEC = 60
+# Files modified more recently than this may still be being copied into the inbox
+SETTLE_SEC = 10
+
+
+def read_folder_config(folder, inherited):
+    """The upload settings of a folder: its upload.json on top of the parent folder's settings."""
+    path = os.path.join(folder, CONFIG_FILE_NAME)
+    if not os.path.exists(path):
+        return inherited
+    with open(path, encoding='utf-8') as config_file:
+        config = json.load(config_file)
+    if not isinstance(config, dict):
+        raise ValueError(f"{path} harus berisi objek JSON.")
+    return {**(inherited or {}), **config}
+
+
+def missing_config_keys(config):
+    return [key for key in CONFIG_KEYS if not str(config.get(key) or '').strip()]
+
+
+class InboxWatcher:
+    """Imports new workbooks from an inbox; run_once() is one pass over it."""
+
+    def __init__(self, inbox, db_session, settle_sec=SETTLE_SEC):
+        self.inbox = os.path.abspath(inbox)
+        self.db_session = db_session
+        self.settle_sec = settle_sec
+        self.summary_path = os.path.join(self.inbox, SUMMARY_FILE_NAME)
+        # The whole manifest is kept in memory, so deciding to skip a file is a dict lookup
+        self.known = {}
+        self.imported_hashes = set()
+        for entry in db_session.query(ProcessedFile):
+            self.known[(entry.path, entry.size, entry.mtime_ns)] = entry.file_hash
+            if entry.status == PROCESSED_IMPORTED:
+                self.imported_hashes.add(entry.file_hash)
+        # Files that failed are not retried until they change (or the watcher restarts); bad configs are reported once
+        self.failed = set()
+        self.reported = set()
+
+    def candidates(self):
+        """(path, stat, config) of every workbook that is not in the manifest yet."""
+        configs = {}
+        now_ns = time.time_ns()
+        for folder, subfolders, _ in os.walk(self.inbox):
+            subfolders.sort()
+            try:
+                config = read_folder_config(folder, configs.get(os.path.dirname(folder)))
+            except (OSError, ValueError) as e:
+                self.report_once(folder, f"Invalid {CONFIG_FILE_NAME} in {folder}: {e}")
+                config = None
+            configs[folder] = config
+
+            with os.scandir(folder) as entries:
+                workbooks = sorted(
+                    (entry for entry in entries
+                     if entry.is_file() and entry.name.lower().endswith('.xlsx') and not entry.name.startswith('~$')),
+                    key=lambda entry: entry.name,
+                )
+            for entry in workbooks:
+                stat_result = entry.stat()
+                signature = file_signature(entry.path, stat_result)
+                if signature in self.known or signature in self.failed:
+                    continue
+                if now_ns - stat_result.st_mtime_ns < self.settle_sec * 1_000_000_000:
+                    continue
+                if config is None:
+                    self.report_once(folder, f"No {CONFIG_FILE_NAME} for {folder}; its workbooks are skipped")
+                    continue
+                missing = missing_config_keys(config)
+                if missing:
+                    self.report_once(folder, f"{CONFIG_FILE_NAME} for {folder} is missing {', '.join(missing)}")
+                    continue
+                yield entry.path, stat_result, config
+
+    def report_once(self, key, message):
+        if key not in self.reported:
+            self.reported.add(key)
+            logger.warning(message)
+
+    def import_file(self, path, stat_result, config):
+        """Import one workbook and record it in the manifest in the same transaction; returns the summary entry."""
+        signature = file_signature(path, stat_result)
+        file_hash = file_sha256(path)
+        if file_hash in self.imported_hashes:
+            record_processed_file(self.db_session, file_hash, signature, 0, PROCESSED_DUPLICATE)
+            self.db_session.commit()
+            self.known[signature] = file_hash
+            return {'status': PROCESSED_DUPLICATE, **ImportCounts().as_dict()}
+
+        def mark_processed(db_session, counts):
+            record_processed_file(db_session, file_hash, signature, counts.inserted)
+
+        if core.SPARSE_ORDERING:
+            compact_nomor_urut(self.db_session)
+            self.db_session.commit()
+        settings = [config[key] for key in CONFIG_KEYS]
+        with perf.span("Upload otomatis"):
+            if config.get('stream'):
+                # An interrupted streaming import continues where it stopped
+                start_nomor_urut = pending_stream_import(self.db_session, file_hash) or next_nomor_urut(self.db_session)
+                counts = import_excel_stream(self.db_session, path, start_nomor_urut, *settings, file_hash=file_hash, on_complete=mark_processed)
+            else:
+                # Imported here, so the watcher starts without loading pandas
+                import pandas as pd
+                df = pd.read_excel(path)
+                start_nomor_urut = next_nomor_urut(self.db_session)
+                counts = import_dataframe(self.db_session, df, start_nomor_urut, *settings, on_complete=mark_processed)
+        self.known[signature] = file_hash
+        self.imported_hashes.add(file_hash)
+        return {'status': PROCESSED_IMPORTED, **counts.as_dict(), 'start_nomor_urut': start_nomor_urut}
+
+    def run_once(self):
+        """Import every new workbook in the inbox; returns the summary entries of this pass."""
+        results = []
+        for path, stat_result, config in self.candidates():
+            start = time.perf_counter()
+            try:
+                result = self.import_file(path, stat_result, config)
+            except Exception as e:
+                self.db_session.rollback()
+                self.failed.add(file_signature(path, stat_result))
+                result = {'status': 'failed', **ImportCounts().as_dict(), 'error': str(e)}
+                logger.error(f"Error importing {path}: {e}", extra={'fields': {'file': path}})
+            result = {
+                'time': datetime.datetime.now().isoformat(timespec='seconds'),
+                'file': os.path.relpath(path, self.inbox),
+                **result,
+                'elapsed_ms': round((time.perf_counter() - start) * 1000, 1),
+            }
+            logger.info(
+                f"{result['status']}: {result['file']} ({result['inserted']} inserted, {result['updated']} updated, {result['skipped']} skipped)",
+                extra={'fields': result}
+            )
+            self.write_summary(result)
+            results.append(result)
+        if results:
+            logger.info(
+                f"Inbox pass: {sum(result['inserted'] for result in results)} rows inserted from {len(results)} files",
+                extra={'fields': {status: sum(result['status'] == status for result in results) for status in (PROCESSED_IMPORTED, PROCESSED_DUPLICATE, 'failed')}}
+            )
+        return results
+
+    def write_summary(self, result):
+        with open(self.summary_path, 'a', encoding='utf-8') as summary_file:
+            summary_file.write(json.dumps(result, ensure_ascii=False) + '\n')
+
+    def run_forever(self, interval=POLL_INTERVAL_SEC):
+        logger.info(f"Watching {self.inbox} every {interval} s")
+        while True:
+            self.run_once()
+            time.sleep(interval)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('inbox', help="folder to watch")
+    parser.add_argument('--interval', type=float, default=POLL_INTERVAL_SEC, help="seconds between passes over the inbox")
+    parser.add_argument('--once', action='store_true', help="do a single pass and exit")
+    parser.add_argument('--database', default=DATABASE_URI, help="SQLAlchemy URI of the database")
+    args = parser.parse_args(argv)
+    if not os.path.isdir(args.inbox):
+        parser.error(f"{args.inbox} is not a folder")
+
+    log_listener = setup_logging()
+    # The windowed build has no console, so progress is only echoed when there is one
+    console = logging.StreamHandler() if sys.stderr is not None else logging.NullHandler()
+    console.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(message)s'))
+    logger.addHandler(console)
+    try:
+        open_database(args.database)
+        db_session = Session()
+        watcher = InboxWatcher(args.inbox, db_session)
+        if args.once:
+            watcher.run_once()
+        else:
+            watcher.run_forever(args.interval)
+    except KeyboardInterrupt:
+        logger.info("Stopped watching")
+    finally:
+        logger.removeHandler(console)
+        log_listener.stop()
+
+
+if __name__ == '__main__':
+    main()